@@ -5,18 +5,36 @@
 import asyncio
 import json
 import logging
+import math
 import os
 import random
 import threading
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
-from typing import Dict, List, Optional, TYPE_CHECKING, Iterable
+from typing import Callable, Dict, List, Optional, Set, Tuple, TYPE_CHECKING, Iterable
 
 from fastapi import HTTPException
 
 # 导入存储层（支持数据库）
-from core import storage
+from core import metrics, storage
+from core.account_index import AccountAvailabilityIndex
+from core.account_limiter import AccountLimiter, pacing_quota_type
+from core.circuit_breaker import CircuitBreaker
+from core.latency_histogram import ACCOUNT, TTFT, latency_histograms
+from core.quota_model import NEAR_LIMIT_PRESSURE, AccountQuotaModel
+from core.session_cache import WHEEL_TICK_SECONDS, SessionCache, SessionEntry
+from core.session_store import SessionBindingStore
+from core.account_selection import (
+    LEAST_IN_FLIGHT_CANDIDATES,
+    NEAR_LIMIT_EXTRA_PROBES,
+    P2C_MAX_SAMPLES,
+    QUOTA_PRESSURE_PENALTY,
+    SCORE_TIE_TOLERANCE,
+    LatencyTracker,
+    selection_score,
+)
+from core.config import config as app_config
 
 if TYPE_CHECKING:
     from core.jwt import JWTManager
@@ -38,6 +56,16 @@ QUOTA_TYPES = {
     "videos": "视频"
 }
 
+# 排队等待账户空闲时的重新检查间隔（秒），令牌桶补充不会触发释放事件
+CAPACITY_RECHECK_SECONDS = 0.5
+
+class AccountsSaturatedError(HTTPException):
+    """所有可用账户均达到并发/速率上限，且排队已满或等待超时"""
+
+    def __init__(self, detail: str):
+        super().__init__(429, detail)
+
+
 @dataclass
 class AccountConfig:
     """单个账户配置"""
@@ -60,32 +88,38 @@ class AccountConfig:
     mail_verify_ssl: Optional[bool] = None
     mail_domain: Optional[str] = None
     mail_api_key: Optional[str] = None
+    # 过期时间戳缓存：(expires_at 原始字符串, 解析后的时间戳)，避免每次检查都调用 strptime
+    _expires_cache: Optional[tuple] = field(default=None, init=False, repr=False, compare=False)
 
-    def get_remaining_hours(self) -> Optional[float]:
-        """计算账户剩余小时数"""
+    def get_expires_timestamp(self) -> Optional[float]:
+        """解析过期时间为时间戳（按北京时间解析，结果随 expires_at 缓存）"""
         if not self.expires_at:
             return None
+        cache = self._expires_cache
+        if cache is not None and cache[0] == self.expires_at:
+            return cache[1]
         try:
-            # 解析过期时间（假设为北京时间）
             beijing_tz = timezone(timedelta(hours=8))
             expire_time = datetime.strptime(self.expires_at, "%Y-%m-%d %H:%M:%S")
-            expire_time = expire_time.replace(tzinfo=beijing_tz)
-
-            # 当前时间（北京时间）
-            now = datetime.now(beijing_tz)
-
-            # 计算剩余时间
-            remaining = (expire_time - now).total_seconds() / 3600
-            return remaining
+            timestamp = expire_time.replace(tzinfo=beijing_tz).timestamp()
         except Exception:
+            timestamp = None
+        self._expires_cache = (self.expires_at, timestamp)
+        return timestamp
+
+    def get_remaining_hours(self) -> Optional[float]:
+        """计算账户剩余小时数"""
+        timestamp = self.get_expires_timestamp()
+        if timestamp is None:
             return None
+        return (timestamp - time.time()) / 3600
 
     def is_expired(self) -> bool:
         """检查账户是否已过期"""
-        remaining = self.get_remaining_hours()
-        if remaining is None:
+        timestamp = self.get_expires_timestamp()
+        if timestamp is None:
             return False  # 未设置过期时间，默认不过期
-        return remaining <= 0
+        return time.time() >= timestamp
 
 
 @dataclass(frozen=True)
@@ -93,6 +127,7 @@ class CooldownConfig:
     text: int
     images: int
     videos: int
+    probe_seconds: int = 300  # 熔断后首次试探间隔（固定冷却时间为退避上限）
 
 
 @dataclass(frozen=True)
@@ -122,6 +157,28 @@ def format_account_expiration(remaining_hours: Optional[float]) -> tuple:
         return ("正常", "#4caf50", f"{remaining_hours:.1f} 小时")
 
 
+class AccountReservation:
+    """
+    get_account 选中账户时预留的名额，由发起请求的一方持有
+
+    acquire_slot 占用并发槽时消耗该预留；在此之前放弃该账户（创建 Session 失败、切换账户、
+    请求出错等）必须调用 cancel 归还，否则名额要到预留过期才释放。cancel 可重复调用。
+    """
+
+    __slots__ = ("account", "quota_type", "reserved_at", "active")
+
+    def __init__(self, account: "AccountManager", quota_type: str, reserved_at: float) -> None:
+        self.account = account
+        self.quota_type = quota_type
+        self.reserved_at = reserved_at
+        self.active = True
+
+    def cancel(self) -> None:
+        if self.active:
+            self.active = False
+            self.account.limiter.cancel_reservation(self.quota_type, self.reserved_at)
+
+
 class AccountManager:
     """单个账户管理器"""
     def __init__(
@@ -140,15 +197,190 @@ class AccountManager:
         self.text_rate_limit_cooldown_seconds = retry_policy.cooldowns.text
         self.images_rate_limit_cooldown_seconds = retry_policy.cooldowns.images
         self.videos_rate_limit_cooldown_seconds = retry_policy.cooldowns.videos
+        self.probe_seconds = retry_policy.cooldowns.probe_seconds
         self.jwt_manager: Optional['JWTManager'] = None  # 延迟初始化
-        self.is_available = True
+        # 状态变化回调（由 MultiAccountManager 设置，用于更新可用性索引）
+        self.state_listener: Optional[Callable[["AccountManager"], None]] = None
+        self._is_available = True
         self.last_error_time = 0.0
-        self.last_cooldown_time = 0.0  # 冷却时间戳（401/403/429错误）
-        self.quota_cooldowns: Dict[str, float] = {}  # 按配额类型的冷却时间戳 {"text": timestamp, "images": timestamp, "videos": timestamp}
+        # 熔断器：全局（401/403/未区分配额的429）与按配额类型（对话/绘图/视频的429）
+        self.breaker = CircuitBreaker()
+        self.quota_breakers: Dict[str, CircuitBreaker] = {quota_type: CircuitBreaker() for quota_type in QUOTA_TYPES}
         self.error_count = 0
         self.conversation_count = 0  # 累计成功次数（用于统计展示）
         self.failure_count = 0  # 累计失败次数（用于统计展示）
         self.session_usage_count = 0  # 本次启动后使用次数（用于均衡轮询）
+        self.limiter = AccountLimiter()  # 按配额类型的并发上限与令牌桶
+        # 并发槽释放回调（由 MultiAccountManager 设置，用于唤醒排队中的请求）
+        self.capacity_listener: Optional[Callable[["AccountManager"], None]] = None
+        # TTFT/错误率 EWMA 与 TTFT 滚动直方图（用于负载感知选择）
+        self.latency = LatencyTracker(latency_histograms.series(ACCOUNT, config.account_id, TTFT))
+        self.quota_model = AccountQuotaModel(QUOTA_TYPES)  # 按配额类型的用量与学习到的配额上限
+
+    @property
+    def in_flight(self) -> int:
+        """进行中的上游对话请求数（由限流器按配额类型计数，账户重新加载后随限流器保留）"""
+        return sum(self.limiter.in_flight.values())
+
+    @property
+    def load(self) -> int:
+        """进行中请求数 + 已选中但尚未发起的预留数"""
+        return self.in_flight + self.limiter.total_pending(time.time())
+
+    def has_capacity(self, quota_type: str) -> bool:
+        """是否未达到该配额类型的并发/速率上限（计入预留）"""
+        return self.limiter.has_capacity(quota_type, time.time())
+
+    def reserve(self, quota_type: str) -> "AccountReservation":
+        """选中账户时预留一个名额，发起请求时转为进行中"""
+        return AccountReservation(self, quota_type, self.limiter.reserve(quota_type, time.time()))
+
+    async def acquire_slot(
+        self, quota_type: str, timeout: float, reservation: Optional["AccountReservation"] = None
+    ) -> bool:
+        """等待并占用并发槽与令牌（超时返回 False），成功后计入进行中请求并消耗 reservation"""
+        reserved_at = None
+        if reservation is not None and reservation.active and reservation.account.limiter is self.limiter:
+            reserved_at = reservation.reserved_at
+        if not await self.limiter.acquire(quota_type, timeout, reserved_at):
+            return False
+        if reserved_at is not None:
+            reservation.active = False
+        self.quota_model.record_request(quota_type, time.time())
+        return True
+
+    def release_slot(self, quota_type: str) -> None:
+        self.limiter.release(quota_type)
+        if self.capacity_listener is not None:
+            self.capacity_listener(self)
+
+    def quota_pressure(self, quota_type: str) -> float:
+        """预测的配额用量比例（0~1，无学习数据时为 0）"""
+        if not app_config.performance.quota_prediction_enabled:
+            return 0.0
+        return self.quota_model.pressure(quota_type, time.time())
+
+    def selection_score(self) -> float:
+        """负载感知选择得分（越低越优）"""
+        return selection_score(self.load, self.latency)
+
+    def get_selection_status(self) -> dict:
+        now = time.time()
+        ttft_ms, error_rate = self.latency.effective(now)
+        tail_ms = self.latency.tail_ms(now)
+        return {
+            "in_flight": self.in_flight,
+            "pending": self.limiter.total_pending(now),
+            "ttft_ewma_ms": round(ttft_ms),
+            "ttft_p90_ms": round(tail_ms) if tail_ms is not None else None,
+            "error_rate": round(error_rate, 3),
+            "score": round(self.selection_score()),
+            "samples": self.latency.samples,
+            "limits": self.limiter.get_status(now),
+        }
+
+    def notify_state_change(self) -> None:
+        """通知可用性索引重新评估该账户"""
+        if self.state_listener is not None:
+            self.state_listener(self)
+
+    @property
+    def is_available(self) -> bool:
+        return self._is_available
+
+    @is_available.setter
+    def is_available(self, value: bool) -> None:
+        if value != self._is_available:
+            self._is_available = value
+            self.notify_state_change()
+
+    def begin_trial(self, quota_types: Optional[Iterable[str]] = None) -> None:
+        """账户被选中时调用：处于 half-open 的熔断器将本次请求作为唯一的试探请求"""
+        now = time.time()
+        probing = self.breaker.begin_probe(now)
+        for quota_type in quota_types or ():
+            breaker = self.quota_breakers.get(quota_type)
+            if breaker is not None and breaker.begin_probe(now):
+                probing = True
+        if probing:
+            logger.info(f"[ACCOUNT] [{self.config.account_id}] 熔断半开，放行试探请求")
+            self.notify_state_change()
+
+    def end_trial(self) -> None:
+        """试探结果不确定（网络错误、普通HTTP错误），释放试探名额"""
+        released = False
+        for breaker in (self.breaker, *self.quota_breakers.values()):
+            if breaker.probe_started_at:
+                breaker.end_probe()
+                released = True
+        if released:
+            self.notify_state_change()
+
+    def record_success(self, quota_types: Optional[Iterable[str]] = None) -> None:
+        """请求成功：重置错误计数，关闭全局及相关配额的熔断器"""
+        self.is_available = True
+        self.error_count = 0
+        now = time.time()
+        closed = self.breaker.close(now)
+        for quota_type in quota_types or ():
+            breaker = self.quota_breakers.get(quota_type)
+            if breaker is not None and breaker.close(now):
+                closed = True
+        if closed:
+            logger.info(f"[ACCOUNT] [{self.config.account_id}] 试探请求成功，熔断已关闭")
+            self.notify_state_change()
+
+    def reset_circuit_breakers(self) -> None:
+        """手动启用账户时清除所有熔断状态"""
+        for breaker in (self.breaker, *self.quota_breakers.values()):
+            breaker.reset()
+        self.notify_state_change()
+
+    def export_runtime_state(self) -> dict:
+        """可跨 worker 共享的运行时状态（熔断、错误计数、可用性）"""
+        return {
+            "is_available": self._is_available,
+            "error_count": self.error_count,
+            "last_error_time": self.last_error_time,
+            "breaker": self.breaker.to_dict(),
+            "quota_breakers": {quota_type: breaker.to_dict() for quota_type, breaker in self.quota_breakers.items()},
+        }
+
+    def apply_runtime_state(self, data: dict) -> None:
+        """应用其他 worker 同步来的运行时状态"""
+        self._is_available = bool(data.get("is_available", True))
+        self.error_count = int(data.get("error_count") or 0)
+        self.last_error_time = float(data.get("last_error_time") or 0.0)
+        if isinstance(data.get("breaker"), dict):
+            self.breaker.load(data["breaker"])
+        for quota_type, breaker_data in (data.get("quota_breakers") or {}).items():
+            breaker = self.quota_breakers.get(quota_type)
+            if breaker is not None and isinstance(breaker_data, dict):
+                breaker.load(breaker_data)
+        self.notify_state_change()
+
+    def get_circuit_status(self) -> dict:
+        now = time.time()
+        return {
+            "global": self.breaker.get_status(now),
+            "quotas": {quota_type: breaker.get_status(now) for quota_type, breaker in self.quota_breakers.items()},
+        }
+
+    def next_state_change_at(self) -> float:
+        """下一次可用性可能自动变化的时间戳（熔断到期、试探超时或账户过期），无则为 inf"""
+        deadlines = []
+        expires_ts = self.config.get_expires_timestamp()
+        if expires_ts is not None:
+            deadlines.append(expires_ts)
+        for breaker in (self.breaker, *self.quota_breakers.values()):
+            deadline = breaker.next_state_change_at()
+            if deadline is not None:
+                deadlines.append(deadline)
+        return min(deadlines) if deadlines else math.inf
+
+    def is_usable(self) -> bool:
+        """账户本身是否可用于新请求（不考虑配额）"""
+        return self.should_retry() and not self.config.is_expired() and not self.config.disabled
 
     def handle_non_http_error(self, error_context: str = "", request_id: str = "") -> None:
         """
@@ -159,6 +391,7 @@ class AccountManager:
             request_id: 请求ID（用于日志）
         """
         req_tag = f"[req_{request_id}] " if request_id else ""
+        self.end_trial()
         self.last_error_time = time.time()
         self.error_count += 1
         if self.error_count >= self.account_failure_threshold:
@@ -188,6 +421,8 @@ class AccountManager:
         self.text_rate_limit_cooldown_seconds = retry_policy.cooldowns.text
         self.images_rate_limit_cooldown_seconds = retry_policy.cooldowns.images
         self.videos_rate_limit_cooldown_seconds = retry_policy.cooldowns.videos
+        self.probe_seconds = retry_policy.cooldowns.probe_seconds
+        self.notify_state_change()
 
     def handle_http_error(self, status_code: int, error_detail: str = "", request_id: str = "", quota_type: Optional[str] = None) -> None:
         """
@@ -201,10 +436,12 @@ class AccountManager:
 
         处理逻辑：
             - 400: 参数错误，不计入失败（客户端问题）
-            - 429 + quota_type: 按配额类型冷却（对话/绘图/视频独立冷却）
-            - 429 无quota_type: 全局冷却（整个账户不可用）
-            - 401/403: 全局冷却（认证错误）
+            - 429 + quota_type: 该配额类型熔断（对话/绘图/视频独立熔断）
+            - 429 无quota_type: 全局熔断（整个账户不可用）
+            - 401/403: 全局熔断（认证错误）
             - 其他HTTP错误: 计入error_count，达到阈值后永久禁用
+
+        熔断后经过试探间隔放行一个试探请求，失败则间隔翻倍，上限为配置的冷却时间。
         """
         req_tag = f"[req_{request_id}] " if request_id else ""
 
@@ -216,41 +453,55 @@ class AccountManager:
             )
             return
 
-        # 429限流错误：按配额类型冷却或全局冷却
+        # 429限流错误：按配额类型熔断或全局熔断
         if status_code == 429:
             if quota_type and quota_type in QUOTA_TYPES:
-                # 按配额类型冷却（不影响账户整体可用性）
-                self.quota_cooldowns[quota_type] = time.time()
-                cooldown_seconds = self._get_quota_cooldown_seconds(quota_type)
+                # 学习本配额周期内的请求数与时长
+                if self.quota_model.record_limit(quota_type, time.time()):
+                    prediction = self.quota_model.prediction(quota_type, time.time())
+                    logger.info(
+                        f"[ACCOUNT] [{self.config.account_id}] {req_tag}"
+                        f"{QUOTA_TYPES[quota_type]}配额预测更新: 约{prediction['limit']}次/"
+                        f"{prediction['window_seconds'] // 60}分钟 (样本: {prediction['samples']})"
+                    )
+                # 按配额类型熔断（不影响账户整体可用性）
+                open_seconds = self.quota_breakers[quota_type].trip(
+                    self.probe_seconds, self._get_quota_cooldown_seconds(quota_type), "429限流"
+                )
+                self.notify_state_change()
                 logger.warning(
                     f"[ACCOUNT] [{self.config.account_id}] {req_tag}"
-                    f"{QUOTA_TYPES[quota_type]}配额限流，将在{cooldown_seconds}秒后自动恢复"
+                    f"{QUOTA_TYPES[quota_type]}配额限流，熔断{int(open_seconds)}秒后试探恢复"
                     f"{': ' + error_detail[:100] if error_detail else ''}"
                 )
             else:
-                # 全局冷却（未指定配额类型）
-                self.last_cooldown_time = time.time()
-                self.is_available = False
+                # 全局熔断（未指定配额类型）
+                open_seconds = self.breaker.trip(self.probe_seconds, self.rate_limit_cooldown_seconds, "429限流")
+                self.notify_state_change()
                 logger.warning(
                     f"[ACCOUNT] [{self.config.account_id}] {req_tag}"
-                    f"遇到429限流，账户将休息{self.rate_limit_cooldown_seconds}秒后自动恢复"
+                    f"遇到429限流，账户熔断{int(open_seconds)}秒后试探恢复"
                     f"{': ' + error_detail[:100] if error_detail else ''}"
                 )
             return
 
-        # 401/403认证错误：全局冷却
+        # 401/403认证错误：全局熔断
         if status_code in (401, 403):
-            self.last_cooldown_time = time.time()
-            self.is_available = False
             error_type = HTTP_ERROR_NAMES.get(status_code, "HTTP错误")
+            open_seconds = self.breaker.trip(
+                self.probe_seconds, self.rate_limit_cooldown_seconds, f"{status_code}{error_type}"
+            )
+            self.notify_state_change()
+            self.invalidate_jwt()
             logger.warning(
                 f"[ACCOUNT] [{self.config.account_id}] {req_tag}"
-                f"遇到{status_code}{error_type}，账户将休息{self.rate_limit_cooldown_seconds}秒后自动恢复"
+                f"遇到{status_code}{error_type}，账户熔断{int(open_seconds)}秒后试探恢复"
                 f"{': ' + error_detail[:100] if error_detail else ''}"
             )
             return
 
-        # 其他HTTP错误：计入error_count
+        # 其他HTTP错误：计入error_count（试探结果不确定，释放试探名额）
+        self.end_trial()
         self.last_error_time = time.time()
         self.error_count += 1
         if self.error_count >= self.account_failure_threshold:
@@ -268,22 +519,11 @@ class AccountManager:
             )
 
     def is_quota_available(self, quota_type: str) -> bool:
-        """检查指定配额是否可用（冷却中则不可用）。"""
-        if quota_type not in QUOTA_TYPES:
-            return True
-
-        cooldown_time = self.quota_cooldowns.get(quota_type)
-        if not cooldown_time:
+        """检查指定配额是否可用（熔断中或半开且试探进行中则不可用）。"""
+        breaker = self.quota_breakers.get(quota_type)
+        if breaker is None:
             return True
-
-        elapsed = time.time() - cooldown_time
-        cooldown_seconds = self._get_quota_cooldown_seconds(quota_type)
-        if elapsed < cooldown_seconds:
-            return False
-
-        # 冷却已过期，清理
-        del self.quota_cooldowns[quota_type]
-        return True
+        return breaker.allows()
 
     def are_quotas_available(self, quota_types: Optional[Iterable[str]] = None) -> bool:
         """检查多个配额类型是否都可用。"""
@@ -318,25 +558,18 @@ class AccountManager:
                 self.handle_non_http_error("JWT获取", request_id)
             raise
 
-    def should_retry(self) -> bool:
-        """检查账户是否可重试（冷却期后自动恢复，普通错误永久禁用）"""
-        if self.is_available:
-            return True
+    def invalidate_jwt(self) -> None:
+        """丢弃缓存的 JWT 密钥材料（认证失败后下次获取会重新请求 getoxsrf）"""
+        if self.jwt_manager is not None:
+            self.jwt_manager.invalidate()
 
-        current_time = time.time()
-
-        # 检查冷却期（401/403/429错误冷却期后自动恢复）
-        if self.last_cooldown_time > 0:
-            if current_time - self.last_cooldown_time > self.rate_limit_cooldown_seconds:
-                # 冷却期已过，自动恢复账户可用性
-                self.is_available = True
-                self.last_cooldown_time = 0.0
-                logger.info(f"[ACCOUNT] [{self.config.account_id}] 冷却期已过，账户已自动恢复")
-                return True
-            return False  # 仍在冷却期
-
-        # 普通错误永久禁用
-        return False
+    def should_retry(self) -> bool:
+        """检查账户是否可重试（熔断到期后放行试探请求，普通错误永久禁用）"""
+        # 普通错误达到阈值：永久禁用
+        if not self.is_available:
+            return False
+        # 401/403/429：熔断器决定（half-open 时只放行一个试探请求）
+        return self.breaker.allows()
 
     def get_cooldown_info(self) -> tuple[int, str | None]:
         """
@@ -347,16 +580,15 @@ class AccountManager:
             - cooldown_seconds: 剩余冷却秒数，0表示无冷却，-1表示永久禁用
             - cooldown_reason: 冷却原因，None表示无冷却
         """
-        current_time = time.time()
-
-        # 优先检查冷却期（无论账户是否可用）
-        if self.last_cooldown_time > 0:
-            remaining = self.rate_limit_cooldown_seconds - (current_time - self.last_cooldown_time)
+        # 优先检查熔断状态（无论账户是否可用）
+        if not self.breaker.is_closed:
+            remaining = self.breaker.remaining_seconds()
             if remaining > 0:
-                return (int(remaining), "限流冷却")
-            # 冷却期已过
+                return (remaining, self.breaker.reason)
+            if self.is_available:
+                return (0, "试探恢复中")
 
-        # 如果账户可用且没有冷却，返回正常状态
+        # 如果账户可用且没有熔断，返回正常状态
         if self.is_available:
             return (0, None)
 
@@ -370,9 +602,9 @@ class AccountManager:
         Returns:
             {
                 "quotas": {
-                    "text": {"available": bool, "remaining_seconds": int},
-                    "images": {"available": bool, "remaining_seconds": int},
-                    "videos": {"available": bool, "remaining_seconds": int}
+                    "text": {"available": bool, "remaining_seconds": int, "state": str, "predicted": dict | None},
+                    "images": {...},
+                    "videos": {...}
                 },
                 "limited_count": int,  # 受限配额数量
                 "total_count": int,    # 总配额数量
@@ -392,35 +624,29 @@ class AccountManager:
             }
 
         current_time = time.time()
+        prediction_enabled = app_config.performance.quota_prediction_enabled
 
         quotas = {}
         limited_count = 0
-        expired_quotas = []  # 收集已过期的配额类型
-
-        for quota_type in QUOTA_TYPES:
-            if quota_type in self.quota_cooldowns:
-                cooldown_time = self.quota_cooldowns[quota_type]
-                # 检查冷却时间是否已过（按配额类型）
-                elapsed = current_time - cooldown_time
-                cooldown_seconds = self._get_quota_cooldown_seconds(quota_type)
-                if elapsed < cooldown_seconds:
-                    remaining = int(cooldown_seconds - elapsed)
-                    quotas[quota_type] = {
-                        "available": False,
-                        "remaining_seconds": remaining
-                    }
-                    limited_count += 1
-                else:
-                    # 冷却时间已过，标记为待删除
-                    expired_quotas.append(quota_type)
-                    quotas[quota_type] = {"available": True}
-            else:
-                # 未检测到限流
-                quotas[quota_type] = {"available": True}
 
-        # 统一删除已过期的配额冷却
-        for quota_type in expired_quotas:
-            del self.quota_cooldowns[quota_type]
+        for quota_type, breaker in self.quota_breakers.items():
+            remaining = breaker.remaining_seconds(current_time)
+            if remaining > 0:
+                quotas[quota_type] = {
+                    "available": False,
+                    "remaining_seconds": remaining,
+                    "state": breaker.state
+                }
+                limited_count += 1
+            else:
+                # 未熔断，或已到试探时间（半开且试探进行中时仍不可用）
+                available = breaker.allows(current_time)
+                quotas[quota_type] = {"available": available, "state": breaker.state}
+                if not available:
+                    limited_count += 1
+            if prediction_enabled:
+                # 预测剩余额度：{"limit", "used", "headroom", "window_seconds", "samples", "source"}
+                quotas[quota_type]["predicted"] = self.quota_model.prediction(quota_type, current_time)
 
         return {
             "quotas": quotas,
@@ -436,88 +662,98 @@ class MultiAccountManager:
         self.accounts: Dict[str, AccountManager] = {}
         self.account_list: List[str] = []  # 账户ID列表 (用于轮询)
         self.current_index = 0
-        self._cache_lock = asyncio.Lock()  # 缓存操作专用锁
         self._counter_lock = threading.Lock()  # 轮询计数器锁
         self._request_counter = 0  # 请求计数器
         self._last_account_count = 0  # 可用账户数量
-        # 全局会话缓存：{conv_key: {"account_id": str, "session_id": str, "updated_at": float}}
-        self.global_session_cache: Dict[str, dict] = {}
-        self.cache_max_size = 1000  # 最大缓存条目数
-        self.cache_ttl = session_cache_ttl_seconds  # 缓存过期时间（秒）
-        # Session级别锁：防止同一对话的并发请求冲突
-        self._session_locks: Dict[str, asyncio.Lock] = {}
-        self._session_locks_lock = asyncio.Lock()  # 保护锁字典的锁
-        self._session_locks_max_size = 2000  # 最大锁数量
-
-    def _clean_expired_cache(self):
-        """清理过期的缓存条目"""
-        current_time = time.time()
-        expired_keys = [
-            key for key, value in self.global_session_cache.items()
-            if current_time - value["updated_at"] > self.cache_ttl
-        ]
-        for key in expired_keys:
-            del self.global_session_cache[key]
-        if expired_keys:
-            logger.info(f"[CACHE] 清理 {len(expired_keys)} 个过期会话缓存")
-
-    def _ensure_cache_size(self):
-        """确保缓存不超过最大大小（LRU策略）"""
-        if len(self.global_session_cache) > self.cache_max_size:
-            # 按更新时间排序，删除最旧的20%
-            sorted_items = sorted(
-                self.global_session_cache.items(),
-                key=lambda x: x[1]["updated_at"]
-            )
-            remove_count = len(sorted_items) - int(self.cache_max_size * 0.8)
-            for key, _ in sorted_items[:remove_count]:
-                del self.global_session_cache[key]
-            logger.info(f"[CACHE] LRU清理 {remove_count} 个最旧会话缓存")
+        # 会话缓存：conv_key -> (账户, Session) 绑定及对话锁（分片 LRU + TTL 时间轮）
+        self.session_cache = SessionCache(session_cache_ttl_seconds)
+        # 对话绑定的写后持久化（重启后懒加载恢复）
+        self.binding_store = SessionBindingStore()
+        # 账户可用性索引：按配额类型的就绪集合 + 冷却/过期截止时间堆
+        self._availability_index = AccountAvailabilityIndex(QUOTA_TYPES)
+        # 账户全部饱和时的排队：任一账户释放并发槽时置位并替换，唤醒排队请求
+        self._capacity_released = asyncio.Event()
+        self._capacity_waiters = 0
+        self.queued_total = 0
+        self.queue_rejected = 0
+        # 账户删除或凭据变更后回调 listener(account_id)，供按账户缓存资源的组件（如预热 Session 池）清理
+        self.account_retired_listeners: List[Callable[[str], None]] = []
+
+    @property
+    def cache_ttl(self) -> int:
+        """会话缓存过期时间（秒）"""
+        return self.session_cache.ttl
+
+    @cache_ttl.setter
+    def cache_ttl(self, value: int) -> None:
+        self.session_cache.ttl = value
 
     async def start_background_cleanup(self):
-        """启动后台缓存清理任务（每5分钟执行一次）"""
+        """启动后台缓存清理任务（按时间轮槽位粒度检查到期条目）"""
         try:
             while True:
-                await asyncio.sleep(300)  # 5分钟
-                async with self._cache_lock:
-                    self._clean_expired_cache()
-                    self._ensure_cache_size()
+                await asyncio.sleep(WHEEL_TICK_SECONDS)
+                removed = self.session_cache.sweep()
+                if removed:
+                    logger.info(f"[CACHE] 清理 {removed} 个过期会话缓存")
         except asyncio.CancelledError:
             logger.info("[CACHE] 后台清理任务已停止")
         except Exception as e:
             logger.error(f"[CACHE] 后台清理任务异常: {e}")
 
+    def get_session_cache(self, conv_key: str) -> Optional[SessionEntry]:
+        """获取对话绑定的账户与 Session（未绑定或已过期返回 None）"""
+        return self.session_cache.get(conv_key)
+
+    async def restore_session_cache(self, conv_key: str) -> Optional[SessionEntry]:
+        """内存未命中时从持久化记录恢复绑定（账户已不存在的绑定忽略）"""
+        binding = await self.binding_store.load(conv_key, self.cache_ttl)
+        if binding is None or binding["account_id"] not in self.accounts:
+            return None
+        return await self.session_cache.bind(
+            conv_key, binding["account_id"], binding["session_id"], binding["updated_at"]
+        )
+
     async def set_session_cache(self, conv_key: str, account_id: str, session_id: str):
-        """线程安全地设置会话缓存"""
-        async with self._cache_lock:
-            self.global_session_cache[conv_key] = {
-                "account_id": account_id,
-                "session_id": session_id,
-                "updated_at": time.time()
-            }
-            # 检查缓存大小
-            self._ensure_cache_size()
+        """绑定对话到账户与 Session"""
+        entry = await self.session_cache.bind(conv_key, account_id, session_id)
+        self.binding_store.record(conv_key, account_id, session_id, entry.updated_at)
+        await self._flush_bindings_if_shared()
+
+    async def _flush_bindings_if_shared(self):
+        """共享模式下绑定变更立即写入，其他 worker 的下一次查找即可看到"""
+        if self.binding_store.shared:
+            await self.binding_store.flush(self.cache_ttl)
+
+    def invalidate_session_cache(self, conv_key: str):
+        """删除对话绑定（条目的锁未被持有时一并删除条目，避免只剩锁的条目占用缓存容量）"""
+        self.session_cache.discard(conv_key)
+        self.binding_store.record_delete(conv_key)
+
+    async def find_session_prefix(self, prefix_keys: List[str]) -> Tuple[int, Optional[SessionEntry]]:
+        """
+        查找已绑定的最长历史前缀（不含本次请求的完整消息序列）
 
-    async def update_session_time(self, conv_key: str):
-        """线程安全地更新会话时间戳"""
-        async with self._cache_lock:
-            if conv_key in self.global_session_cache:
-                self.global_session_cache[conv_key]["updated_at"] = time.time()
+        多 worker 共享模式下其他 worker 可能已推进同一对话，直接以数据库中的绑定为准。
+
+        Returns:
+            (前缀消息数, 条目)，未找到时为 (0, None)
+        """
+        candidates = prefix_keys[:-1]
+        if self.binding_store.shared:
+            index, binding = await self.binding_store.load_longest(candidates, self.cache_ttl)
+            if binding is None or binding["account_id"] not in self.accounts:
+                return 0, None
+            entry = await self.session_cache.bind(
+                candidates[index], binding["account_id"], binding["session_id"], binding["updated_at"]
+            )
+            return index + 1, entry
+        index, entry = self.session_cache.find_longest(candidates)
+        return index + 1, entry
 
     async def acquire_session_lock(self, conv_key: str) -> asyncio.Lock:
         """获取指定对话的锁（用于防止同一对话的并发请求冲突）"""
-        async with self._session_locks_lock:
-            # 清理过多的锁（LRU策略：删除不在缓存中的锁）
-            if len(self._session_locks) > self._session_locks_max_size:
-                # 只保留当前缓存中存在的锁
-                valid_keys = set(self.global_session_cache.keys())
-                keys_to_remove = [k for k in self._session_locks if k not in valid_keys]
-                for k in keys_to_remove[:len(keys_to_remove)//2]:  # 删除一半无效锁
-                    del self._session_locks[k]
-
-            if conv_key not in self._session_locks:
-                self._session_locks[conv_key] = asyncio.Lock()
-            return self._session_locks[conv_key]
+        return await self.session_cache.acquire_lock(conv_key)
 
     def update_http_client(self, http_client):
         """更新所有账户使用的 http_client（用于代理变更后重建客户端）"""
@@ -541,17 +777,81 @@ class MultiAccountManager:
             manager.conversation_count = global_stats["account_conversations"].get(config.account_id, 0)
         if "account_failures" in global_stats:
             manager.failure_count = global_stats["account_failures"].get(config.account_id, 0)
+        if "account_quota_models" in global_stats:
+            manager.quota_model.load(global_stats["account_quota_models"].get(config.account_id))
         self.accounts[config.account_id] = manager
         self.account_list.append(config.account_id)
+        manager.state_listener = self._reindex_account
+        manager.capacity_listener = self._on_capacity_released
+        self._reindex_account(manager)
         logger.info(f"[MULTI] [ACCOUNT] 添加账户: {config.account_id}")
 
+    def _reindex_account(self, account: AccountManager) -> None:
+        """重新评估账户状态并更新可用性索引"""
+        account_id = account.config.account_id
+        if self.accounts.get(account_id) is not account:
+            return
+        usable = account.is_usable()
+        ready_quota_types = [qt for qt in QUOTA_TYPES if account.is_quota_available(qt)] if usable else []
+        self._availability_index.update(account_id, usable, ready_quota_types, account.next_state_change_at())
+
+    def refresh_account_state(self, account_id: str) -> None:
+        """账户配置（如禁用状态、过期时间）在外部修改后调用，同步可用性索引"""
+        account = self.accounts.get(account_id)
+        if account is not None:
+            self._reindex_account(account)
+
+    def _on_capacity_released(self, account: AccountManager) -> None:
+        released, self._capacity_released = self._capacity_released, asyncio.Event()
+        released.set()
+
+    def get_queue_stats(self) -> dict:
+        return {
+            "waiting": self._capacity_waiters,
+            "queued_total": self.queued_total,
+            "rejected": self.queue_rejected,
+        }
+
+    def _process_due_accounts(self) -> None:
+        for account_id in self._availability_index.pop_due(time.time()):
+            account = self.accounts.get(account_id)
+            if account is not None:
+                self._reindex_account(account)
+
+    def _is_selectable(self, account: AccountManager, required_quota_types: Optional[Iterable[str]]) -> bool:
+        return account.is_usable() and account.are_quotas_available(required_quota_types)
+
+    def count_available(
+        self,
+        required_quota_types: Optional[Iterable[str]] = None,
+        exclude: Optional[Set[str]] = None
+    ) -> int:
+        """统计满足配额要求的可用账户数（基于可用性索引）"""
+        self._process_due_accounts()
+        primary, others = self._availability_index.candidates(required_quota_types)
+        if not others:
+            excluded = sum(1 for account_id in exclude if account_id in primary) if exclude else 0
+            return len(primary) - excluded
+        return sum(
+            1 for account_id in primary
+            if all(account_id in members for members in others)
+            and not (exclude and account_id in exclude)
+        )
+
     async def get_account(
         self,
         account_id: Optional[str] = None,
         request_id: str = "",
-        required_quota_types: Optional[Iterable[str]] = None
-    ) -> AccountManager:
-        """获取账户 - Round-Robin轮询"""
+        required_quota_types: Optional[Iterable[str]] = None,
+        exclude: Optional[Set[str]] = None
+    ) -> AccountReservation:
+        """
+        获取账户 - 按配置的选择策略（默认 Round-Robin 轮询；基于可用性索引，无需扫描全部账户）
+
+        跳过已达到并发/速率上限的账户；全部饱和时在有界队列中等待，排队已满或超时抛出 AccountsSaturatedError。
+        选中的账户会预留一个名额并返回该预留（账户为 reservation.account），
+        调用方发起请求时通过 acquire_slot 占用，放弃该账户时调用 reservation.cancel() 归还。
+        """
         req_tag = f"[req_{request_id}] " if request_id else ""
 
         # 指定账户ID时直接返回
@@ -563,35 +863,204 @@ class MultiAccountManager:
                 raise HTTPException(503, f"Account {account_id} temporarily unavailable")
             if not account.are_quotas_available(required_quota_types):
                 raise HTTPException(503, f"Account {account_id} quota temporarily unavailable")
-            return account
-
-        # 筛选可用账户
-        available_accounts = [
-            acc for acc in self.accounts.values()
-            if (acc.should_retry() and
-                not acc.config.is_expired() and
-                not acc.config.disabled and
-                acc.are_quotas_available(required_quota_types))
-        ]
-
-        if not available_accounts:
+            reservation = account.reserve(pacing_quota_type(required_quota_types))
+            account.begin_trial(required_quota_types)
+            return reservation
+
+        pacing_quota = pacing_quota_type(required_quota_types)
+        selected = self._select(required_quota_types, exclude, pacing_quota)
+        if selected is None:
+            selected = await self._wait_for_capacity(required_quota_types, exclude, pacing_quota, req_tag)
+
+        selected.session_usage_count += 1
+        reservation = selected.reserve(pacing_quota)
+        selected.begin_trial(required_quota_types)
+        metrics.ACCOUNT_SELECTIONS_TOTAL.labels(selected.config.account_id).inc()
+
+        logger.info(f"[MULTI] [ACCOUNT] {req_tag}选择账户: {selected.config.account_id} "
+                    f"(策略: {app_config.performance.account_selection_policy}, 进行中: {selected.in_flight}, "
+                    f"使用: {selected.session_usage_count})")
+        return reservation
+
+    def _select(
+        self,
+        required_quota_types: Optional[Iterable[str]],
+        exclude: Optional[Set[str]],
+        pacing_quota: str
+    ) -> Optional[AccountManager]:
+        """按当前策略选择一个未饱和的账户；没有可用账户时抛出 503，全部饱和时返回 None"""
+        # 冷却/过期截止时间已到的账户重新评估
+        self._process_due_accounts()
+        primary, others = self._availability_index.candidates(required_quota_types)
+        if not primary:
             raise HTTPException(503, "No available accounts")
 
-        # 轮询选择
+        # 轮询位置（所有策略共用，保证候选在账户池中轮转）
         with self._counter_lock:
-            if len(available_accounts) != self._last_account_count:
+            if len(primary) != self._last_account_count:
                 self._request_counter = random.randint(0, 999999)
-                self._last_account_count = len(available_accounts)
-            index = self._request_counter % len(available_accounts)
+                self._last_account_count = len(primary)
+            start = self._request_counter % len(primary)
             self._request_counter += 1
 
-        selected = available_accounts[index]
-        selected.session_usage_count += 1
+        policy = app_config.performance.account_selection_policy
+        if policy == "p2c":
+            selected = self._select_p2c(primary, others, required_quota_types, exclude, pacing_quota, start)
+        elif policy == "least_in_flight":
+            selected = self._select_round_robin(
+                primary, others, required_quota_types, exclude, pacing_quota, start, LEAST_IN_FLIGHT_CANDIDATES
+            )
+        else:
+            selected = self._select_round_robin(primary, others, required_quota_types, exclude, pacing_quota, start, 1)
 
-        logger.info(f"[MULTI] [ACCOUNT] {req_tag}选择账户: {selected.config.account_id} "
-                    f"(索引: {index}/{len(available_accounts)}, 使用: {selected.session_usage_count})")
+        if selected is None and self.count_available(required_quota_types, exclude) == 0:
+            raise HTTPException(503, "No available accounts")
         return selected
 
+    async def _wait_for_capacity(
+        self,
+        required_quota_types: Optional[Iterable[str]],
+        exclude: Optional[Set[str]],
+        pacing_quota: str,
+        req_tag: str
+    ) -> AccountManager:
+        """所有可用账户均饱和时排队等待，直到有账户释放名额或超时"""
+        performance = app_config.performance
+        if self._capacity_waiters >= performance.account_queue_max_waiters:
+            self.queue_rejected += 1
+            logger.warning(f"[MULTI] [ACCOUNT] {req_tag}所有账户已达并发上限，排队已满 ({self._capacity_waiters})")
+            raise AccountsSaturatedError("All accounts are busy, please retry later")
+
+        timeout = performance.account_queue_timeout_seconds
+        deadline = time.monotonic() + timeout
+        self._capacity_waiters += 1
+        self.queued_total += 1
+        logger.info(f"[MULTI] [ACCOUNT] {req_tag}所有账户已达并发上限，排队等待 (排队: {self._capacity_waiters})")
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.queue_rejected += 1
+                    logger.warning(f"[MULTI] [ACCOUNT] {req_tag}排队等待账户超时 ({timeout}秒)")
+                    raise AccountsSaturatedError("Timed out waiting for an available account")
+                released = self._capacity_released
+                try:
+                    await asyncio.wait_for(released.wait(), timeout=min(remaining, CAPACITY_RECHECK_SECONDS))
+                except asyncio.TimeoutError:
+                    pass
+                selected = self._select(required_quota_types, exclude, pacing_quota)
+                if selected is not None:
+                    return selected
+        finally:
+            self._capacity_waiters -= 1
+
+    def _check_candidate(
+        self,
+        account_id: str,
+        others: list,
+        required_quota_types: Optional[Iterable[str]],
+        exclude: Optional[Set[str]],
+        pacing_quota: str
+    ) -> Optional[AccountManager]:
+        """候选是否满足全部条件（含未饱和）；状态未同步的账户顺便修正索引"""
+        candidate = self.accounts.get(account_id)
+        if candidate is None:
+            self._availability_index.remove(account_id)
+            return None
+        if exclude and account_id in exclude:
+            return None
+        if not all(account_id in members for members in others):
+            return None
+        if not self._is_selectable(candidate, required_quota_types):
+            self._reindex_account(candidate)
+            return None
+        if not candidate.has_capacity(pacing_quota):
+            return None
+        return candidate
+
+    def _select_round_robin(
+        self,
+        primary,
+        others: list,
+        required_quota_types: Optional[Iterable[str]],
+        exclude: Optional[Set[str]],
+        pacing_quota: str,
+        start: int,
+        max_candidates: int
+    ) -> Optional[AccountManager]:
+        """
+        从轮询位置向后探测，收集至多 max_candidates 个合格候选，选择负载（进行中 + 预留）最少者
+        （max_candidates=1 即纯轮询；并列时取先出现者，保持轮询公平性）
+
+        预测接近配额上限的账户先跳过（至多 NEAR_LIMIT_EXTRA_PROBES 个），没有其他候选时才使用
+        """
+        best = None
+        best_load = 0
+        fallback = None
+        fallback_pressure = 0.0
+        skipped = 0
+        found = 0
+        index = start
+        probes = len(primary)
+        while probes > 0 and primary and found < max_candidates:
+            index = index % len(primary)
+            account_id = primary[index]
+            probes -= 1
+            candidate = self._check_candidate(account_id, others, required_quota_types, exclude, pacing_quota)
+            if index < len(primary) and primary[index] == account_id:
+                index += 1
+            if candidate is None:
+                continue
+            pressure = candidate.quota_pressure(pacing_quota)
+            if pressure >= NEAR_LIMIT_PRESSURE:
+                if fallback is None or pressure < fallback_pressure:
+                    fallback, fallback_pressure = candidate, pressure
+                skipped += 1
+                if skipped > NEAR_LIMIT_EXTRA_PROBES:
+                    break
+                continue
+            found += 1
+            load = candidate.load
+            if best is None or load < best_load:
+                best, best_load = candidate, load
+                if best_load == 0:
+                    break
+        return best if best is not None else fallback
+
+    def _select_p2c(
+        self,
+        primary,
+        others: list,
+        required_quota_types: Optional[Iterable[str]],
+        exclude: Optional[Set[str]],
+        pacing_quota: str,
+        start: int
+    ) -> Optional[AccountManager]:
+        """随机抽取两个合格候选，选择得分更低者（接近预测配额上限的账户得分加重）；候选不足时回退到轮询"""
+        picks = []
+        for _ in range(P2C_MAX_SAMPLES):
+            if len(picks) == 2 or not primary:
+                break
+            candidate = self._check_candidate(random.choice(primary), others, required_quota_types, exclude, pacing_quota)
+            if candidate is not None and candidate not in picks:
+                picks.append(candidate)
+        if not picks:
+            return self._select_round_robin(primary, others, required_quota_types, exclude, pacing_quota, start, 1)
+        if len(picks) == 1:
+            return picks[0]
+        now = time.time()
+        first, second = picks
+        first_score = selection_score(first.load, first.latency, now) * (
+            1.0 + QUOTA_PRESSURE_PENALTY * first.quota_pressure(pacing_quota)
+        )
+        second_score = selection_score(second.load, second.latency, now) * (
+            1.0 + QUOTA_PRESSURE_PENALTY * second.quota_pressure(pacing_quota)
+        )
+        if abs(first_score - second_score) <= SCORE_TIE_TOLERANCE * max(first_score, second_score):
+            # 得分接近时选使用次数较少的账户，保持公平
+            return first if first.session_usage_count <= second.session_usage_count else second
+        return first if first_score < second_score else second
+
 
 # ---------- 配置管理 ----------
 
@@ -702,6 +1171,14 @@ def load_multi_account_config(
     return manager
 
 
+def _same_credentials(old: AccountConfig, new: AccountConfig) -> bool:
+    return (
+        old.secure_c_ses == new.secure_c_ses
+        and old.host_c_oses == new.host_c_oses
+        and old.csesidx == new.csesidx
+    )
+
+
 def reload_accounts(
     multi_account_mgr: MultiAccountManager,
     http_client,
@@ -719,14 +1196,17 @@ def reload_accounts(
             "failure_count": account_mgr.failure_count,
             "is_available": account_mgr.is_available,
             "last_error_time": account_mgr.last_error_time,
-            "last_cooldown_time": account_mgr.last_cooldown_time,
+            "breaker": account_mgr.breaker,
+            "quota_model": account_mgr.quota_model,
+            "quota_breakers": account_mgr.quota_breakers,
             "error_count": account_mgr.error_count,
             "session_usage_count": account_mgr.session_usage_count,
-            "quota_cooldowns": dict(account_mgr.quota_cooldowns),
+            "jwt_manager": account_mgr.jwt_manager,
+            "limiter": account_mgr.limiter,
+            "latency": account_mgr.latency,
+            "manager": account_mgr,
         }
 
-    # Clear session cache and reload config.
-    multi_account_mgr.global_session_cache.clear()
     new_mgr = load_multi_account_config(
         http_client,
         user_agent,
@@ -735,6 +1215,17 @@ def reload_accounts(
         global_stats
     )
 
+    # Keep conversation bindings (and in-flight conversation locks) for accounts that still exist.
+    removed_account_ids = set(multi_account_mgr.accounts) - set(new_mgr.accounts)
+    multi_account_mgr.session_cache.unbind_accounts(removed_account_ids)
+    multi_account_mgr.binding_store.forget_accounts(removed_account_ids)
+    latency_histograms.forget(ACCOUNT, removed_account_ids)
+    new_mgr.session_cache = multi_account_mgr.session_cache
+    new_mgr.binding_store = multi_account_mgr.binding_store
+    new_mgr.account_retired_listeners = multi_account_mgr.account_retired_listeners
+    new_mgr.cache_ttl = session_cache_ttl_seconds
+    retired_account_ids = set(removed_account_ids)
+
     # Restore stats + runtime state.
     for account_id, stats in old_stats.items():
         if account_id in new_mgr.accounts:
@@ -743,12 +1234,34 @@ def reload_accounts(
             account_mgr.failure_count = stats.get("failure_count", 0)
             account_mgr.is_available = stats.get("is_available", True)
             account_mgr.last_error_time = stats.get("last_error_time", 0.0)
-            account_mgr.last_cooldown_time = stats.get("last_cooldown_time", 0.0)
             account_mgr.error_count = stats.get("error_count", 0)
             account_mgr.session_usage_count = stats.get("session_usage_count", 0)
-            account_mgr.quota_cooldowns = stats.get("quota_cooldowns", {})
+            # 熔断状态（含退避进度）整体保留
+            account_mgr.breaker = stats["breaker"]
+            account_mgr.quota_breakers = stats["quota_breakers"]
+            account_mgr.quota_model = stats["quota_model"]
+            # 并发计数、令牌桶、预留与延迟统计整体保留：进行中的请求仍持有旧的账户对象，
+            # 它们释放的名额必须计入同一个限流器
+            account_mgr.limiter = stats["limiter"]
+            account_mgr.latency = stats["latency"]
+            old_mgr = stats["manager"]
+            if not _same_credentials(old_mgr.config, account_mgr.config):
+                retired_account_ids.add(account_id)
+            old_mgr.state_listener = lambda _, account_id=account_id: new_mgr.refresh_account_state(account_id)
+            old_mgr.capacity_listener = new_mgr._on_capacity_released
+            account_mgr.notify_state_change()
+            # 凭据未变化时保留 JWT 密钥材料，避免重载后所有账户冷启动
+            jwt_manager = stats.get("jwt_manager")
+            if jwt_manager is not None and _same_credentials(jwt_manager.config, account_mgr.config):
+                jwt_manager.config = account_mgr.config
+                jwt_manager.http_client = account_mgr.http_client
+                account_mgr.jwt_manager = jwt_manager
             logger.debug(f"[CONFIG] Account {account_id} refreshed; runtime state preserved")
 
+    for listener in new_mgr.account_retired_listeners:
+        for account_id in retired_account_ids:
+            listener(account_id)
+
     logger.info(
         f"[CONFIG] Reloaded config; accounts={len(new_mgr.accounts)}; cooldown/error state preserved"
     )
@@ -832,12 +1345,14 @@ def update_account_disabled_status(
             raise ValueError(f"账户 {account_id} 不存在")
         if account_id in multi_account_mgr.accounts:
             multi_account_mgr.accounts[account_id].config.disabled = disabled
+            multi_account_mgr.refresh_account_state(account_id)
         return multi_account_mgr
 
     if account_id not in multi_account_mgr.accounts:
         raise ValueError(f"账户 {account_id} 不存在")
     account_mgr = multi_account_mgr.accounts[account_id]
     account_mgr.config.disabled = disabled
+    multi_account_mgr.refresh_account_state(account_id)
 
     accounts_data = load_accounts_from_source()
     for i, acc in enumerate(accounts_data, 1):
@@ -863,6 +1378,7 @@ def bulk_update_account_disabled_status(
         for account_id in account_ids:
             if account_id in multi_account_mgr.accounts:
                 multi_account_mgr.accounts[account_id].config.disabled = disabled
+                multi_account_mgr.refresh_account_state(account_id)
         errors = [f"{account_id}: 账户不存在" for account_id in missing]
         status_text = "已禁用" if disabled else "已启用"
         logger.info(f"[CONFIG] 批量{status_text} {updated}/{len(account_ids)} 个账户")
@@ -877,6 +1393,7 @@ def bulk_update_account_disabled_status(
             continue
         account_mgr = multi_account_mgr.accounts[account_id]
         account_mgr.config.disabled = disabled
+        multi_account_mgr.refresh_account_state(account_id)
         success_count += 1
 
     accounts_data = load_accounts_from_source()
@@ -0,0 +1,121 @@
+"""账户可用性索引
+
+为账户选择维护按配额类型划分的就绪集合，以及冷却/过期截止时间的最小堆，
+使选择账户无需每次扫描全部账户：账户只在截止时间到达或状态变化（报错、恢复、
+启用/禁用）时在集合之间移动。
+"""
+import heapq
+import math
+from typing import Dict, Generic, Hashable, Iterable, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T", bound=Hashable)
+
+# 不区分配额类型的就绪集合键（账户本身可用即可）
+ANY_QUOTA = None
+
+
+class IndexedSet(Generic[T]):
+    """支持 O(1) 添加、删除、成员判断和按下标访问的集合（删除时与末尾元素交换）"""
+
+    __slots__ = ("_items", "_positions")
+
+    def __init__(self) -> None:
+        self._items: List[T] = []
+        self._positions: Dict[T, int] = {}
+
+    def add(self, item: T) -> None:
+        if item not in self._positions:
+            self._positions[item] = len(self._items)
+            self._items.append(item)
+
+    def discard(self, item: T) -> None:
+        position = self._positions.pop(item, None)
+        if position is None:
+            return
+        last = self._items.pop()
+        if position < len(self._items):
+            self._items[position] = last
+            self._positions[last] = position
+
+    def __contains__(self, item: object) -> bool:
+        return item in self._positions
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __getitem__(self, index: int) -> T:
+        return self._items[index]
+
+    def __iter__(self):
+        return iter(self._items)
+
+
+class AccountAvailabilityIndex:
+    """按配额类型的就绪集合 + 状态截止时间最小堆"""
+
+    def __init__(self, quota_types: Iterable[str]) -> None:
+        self.ready: Dict[Optional[str], IndexedSet[str]] = {ANY_QUOTA: IndexedSet()}
+        for quota_type in quota_types:
+            self.ready[quota_type] = IndexedSet()
+        # 堆中可能残留过时条目，以 _deadlines 中记录的值为准（惰性删除）
+        self._heap: List[Tuple[float, str]] = []
+        self._deadlines: Dict[str, float] = {}
+
+    def update(self, account_id: str, usable: bool, ready_quota_types: Iterable[str], deadline: float) -> None:
+        """
+        更新账户的索引状态
+
+        Args:
+            account_id: 账户ID
+            usable: 账户本身是否可用（未冷却、未过期、未禁用）
+            ready_quota_types: 当前可用的配额类型
+            deadline: 下一次状态可能变化的时间戳（冷却结束/过期），无则为 inf
+        """
+        ready_quota_types = set(ready_quota_types) if usable else set()
+        for key, members in self.ready.items():
+            if key is ANY_QUOTA:
+                ready = usable
+            else:
+                ready = key in ready_quota_types
+            if ready:
+                members.add(account_id)
+            else:
+                members.discard(account_id)
+
+        if math.isinf(deadline):
+            self._deadlines.pop(account_id, None)
+        elif self._deadlines.get(account_id) != deadline:
+            self._deadlines[account_id] = deadline
+            heapq.heappush(self._heap, (deadline, account_id))
+
+    def remove(self, account_id: str) -> None:
+        for members in self.ready.values():
+            members.discard(account_id)
+        self._deadlines.pop(account_id, None)
+
+    def pop_due(self, now: float) -> List[str]:
+        """取出截止时间已到的账户（需要重新评估状态）"""
+        due = []
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            deadline, account_id = heapq.heappop(heap)
+            if self._deadlines.get(account_id) == deadline:
+                del self._deadlines[account_id]
+                due.append(account_id)
+        # 过时条目过多时重建堆，避免无限增长
+        if len(heap) > 4 * len(self._deadlines) + 64:
+            self._heap = [(deadline, account_id) for account_id, deadline in self._deadlines.items()]
+            heapq.heapify(self._heap)
+        return due
+
+    def candidates(self, quota_types: Optional[Iterable[str]]) -> Tuple[IndexedSet[str], List[IndexedSet[str]]]:
+        """返回用于轮询的主集合（最小的就绪集合）以及其余需要同时满足的集合"""
+        if not quota_types:
+            return self.ready[ANY_QUOTA], []
+        if isinstance(quota_types, str):
+            quota_types = [quota_types]
+        sets = [self.ready[quota_type] for quota_type in quota_types if quota_type in self.ready]
+        if not sets:
+            return self.ready[ANY_QUOTA], []
+        sets.sort(key=len)
+        return sets[0], sets[1:]
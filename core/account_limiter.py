@@ -0,0 +1,179 @@
+"""账户并发与速率限制
+
+每个账户按配额类型（对话/绘图/视频）限制：
+- 同时进行中的上游请求数（并发上限）
+- 请求速率（令牌桶，按每分钟请求数匀速补充，允许少量突发）
+
+账户选择时跳过已饱和的账户；选中后到真正发起请求之间记为"预留"，
+避免并发请求在同一时刻集中选中同一个账户。
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, Optional, Tuple
+
+from core.config import config
+
+# 预留的最长有效期（秒）：选中账户后未发起请求（如创建 Session 失败）的预留到期自动失效
+RESERVATION_TTL_SECONDS = 30
+
+
+def pacing_quota_type(required_quota_types: Optional[Iterable[str]]) -> str:
+    """限流所依据的配额类型：图/视频请求按对应配额，其余按对话配额"""
+    if not required_quota_types:
+        return "text"
+    if isinstance(required_quota_types, str):
+        return required_quota_types
+    quota_type = "text"
+    for required in required_quota_types:
+        if required != "text":
+            quota_type = required
+    return quota_type
+
+
+def quota_limits(quota_type: str) -> Tuple[int, int]:
+    """返回 (并发上限, 每分钟请求数)，0 表示不限制"""
+    performance = config.performance
+    max_in_flight = getattr(performance, f"account_max_in_flight_{quota_type}", 0)
+    rate_per_minute = getattr(performance, f"account_rate_per_minute_{quota_type}", 0)
+    return max_in_flight, rate_per_minute
+
+
+class TokenBucket:
+    """令牌桶（速率与容量按调用时的配置计算，配置热更新后立即生效）"""
+
+    __slots__ = ("tokens", "updated_at")
+
+    def __init__(self) -> None:
+        self.tokens: Optional[float] = None  # None 表示满桶
+        self.updated_at = 0.0
+
+    def available(self, rate_per_minute: int, burst: int, now: float) -> float:
+        if self.tokens is None:
+            return float(burst)
+        refilled = self.tokens + (now - self.updated_at) * rate_per_minute / 60.0
+        return min(float(burst), refilled)
+
+    def take(self, rate_per_minute: int, burst: int, now: float) -> None:
+        self.tokens = self.available(rate_per_minute, burst, now) - 1.0
+        self.updated_at = now
+
+    def wait_seconds(self, rate_per_minute: int, burst: int, now: float, needed: float = 1.0) -> float:
+        """距离可用令牌达到 needed 还需等待的秒数"""
+        missing = needed - self.available(rate_per_minute, burst, now)
+        if missing <= 0:
+            return 0.0
+        return missing * 60.0 / rate_per_minute
+
+
+class AccountLimiter:
+    """单个账户的并发计数、令牌桶与预留（仅在事件循环内使用，无需加锁）"""
+
+    def __init__(self) -> None:
+        self.in_flight: Dict[str, int] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        # 预留时间戳队列：{quota_type: deque[timestamp]}
+        self._reservations: Dict[str, Deque[float]] = {}
+        # 有并发槽释放时置位并替换，唤醒等待该账户的请求
+        self._released = asyncio.Event()
+
+    def _bucket(self, quota_type: str) -> TokenBucket:
+        bucket = self._buckets.get(quota_type)
+        if bucket is None:
+            bucket = self._buckets[quota_type] = TokenBucket()
+        return bucket
+
+    def pending(self, quota_type: str, now: float) -> int:
+        """未过期的预留数"""
+        reservations = self._reservations.get(quota_type)
+        if not reservations:
+            return 0
+        while reservations and now - reservations[0] > RESERVATION_TTL_SECONDS:
+            reservations.popleft()
+        return len(reservations)
+
+    def total_pending(self, now: float) -> int:
+        return sum(self.pending(quota_type, now) for quota_type in list(self._reservations))
+
+    def reserve(self, quota_type: str, now: float) -> float:
+        """记录一个预留，返回预留时间戳（取消或占用时用于定位该预留）"""
+        self._reservations.setdefault(quota_type, deque()).append(now)
+        return now
+
+    def cancel_reservation(self, quota_type: str, reserved_at: float) -> None:
+        """取消指定的预留（已过期失效时不做任何事）"""
+        reservations = self._reservations.get(quota_type)
+        if reservations:
+            try:
+                reservations.remove(reserved_at)
+            except ValueError:
+                pass
+
+    def has_capacity(self, quota_type: str, now: float) -> bool:
+        """计入预留后是否还能再接一个请求（用于账户选择）"""
+        max_in_flight, rate_per_minute = quota_limits(quota_type)
+        if not max_in_flight and not rate_per_minute:
+            return True
+        pending = self.pending(quota_type, now)
+        if max_in_flight and self.in_flight.get(quota_type, 0) + pending >= max_in_flight:
+            return False
+        if rate_per_minute:
+            burst = config.performance.account_rate_burst
+            if self._bucket(quota_type).available(rate_per_minute, burst, now) < pending + 1:
+                return False
+        return True
+
+    def try_acquire(self, quota_type: str, now: float, reserved_at: Optional[float] = None) -> float:
+        """
+        尝试占用一个并发槽并消耗一个令牌，成功时转换 reserved_at 对应的预留（未指定时不动其他请求的预留）
+
+        Returns:
+            0 表示成功；否则为建议的等待秒数（inf 表示需等待并发槽释放）
+        """
+        max_in_flight, rate_per_minute = quota_limits(quota_type)
+        if max_in_flight and self.in_flight.get(quota_type, 0) >= max_in_flight:
+            return math.inf
+        if rate_per_minute:
+            burst = config.performance.account_rate_burst
+            bucket = self._bucket(quota_type)
+            wait = bucket.wait_seconds(rate_per_minute, burst, now)
+            if wait > 0:
+                return wait
+            bucket.take(rate_per_minute, burst, now)
+        if reserved_at is not None:
+            self.cancel_reservation(quota_type, reserved_at)
+        self.in_flight[quota_type] = self.in_flight.get(quota_type, 0) + 1
+        return 0.0
+
+    async def acquire(self, quota_type: str, timeout: float, reserved_at: Optional[float] = None) -> bool:
+        """等待并发槽与令牌，超时返回 False"""
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(quota_type, time.time(), reserved_at)
+            if wait == 0:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            released = self._released
+            try:
+                await asyncio.wait_for(released.wait(), timeout=min(wait, remaining))
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self, quota_type: str) -> None:
+        self.in_flight[quota_type] = max(0, self.in_flight.get(quota_type, 0) - 1)
+        released, self._released = self._released, asyncio.Event()
+        released.set()
+
+    def get_status(self, now: float) -> dict:
+        status = {}
+        for quota_type in sorted(set(self.in_flight) | set(self._reservations)):
+            max_in_flight, _ = quota_limits(quota_type)
+            status[quota_type] = {
+                "in_flight": self.in_flight.get(quota_type, 0),
+                "pending": self.pending(quota_type, now),
+                "max_in_flight": max_in_flight,
+            }
+        return status
@@ -0,0 +1,113 @@
+"""账户选择策略
+
+为 MultiAccountManager.get_account 提供可切换的选择策略：
+- round_robin：按请求计数轮询（默认，与原行为一致）
+- least_in_flight：从轮询位置起取若干候选，选择进行中请求最少的账户
+- p2c：随机取两个候选（power of two choices），按进行中请求数、TTFT（EWMA 与近期 p90 混合）和错误率打分，取较优者
+"""
+import math
+import time
+from typing import Optional
+
+from core.latency_histogram import RollingHistogram
+
+SELECTION_POLICIES = ("round_robin", "least_in_flight", "p2c")
+
+# least_in_flight 每次最多比较的候选数
+LEAST_IN_FLIGHT_CANDIDATES = 8
+# p2c 随机抽样的最大尝试次数（跳过不满足条件的候选）
+P2C_MAX_SAMPLES = 6
+# 轮询时最多跳过的接近配额上限的候选数（超过后不再跳过，避免扫描整个账户池）
+NEAR_LIMIT_EXTRA_PROBES = 8
+# p2c 中预测配额用量比例对得分的放大倍数
+QUOTA_PRESSURE_PENALTY = 4.0
+
+# EWMA 平滑系数（越大越偏向最近的观测）
+EWMA_ALPHA = 0.3
+# 观测随时间衰减回全局先验的时间常数（秒），避免表现差的账户永远不被选中
+SCORE_DECAY_SECONDS = 300
+# 错误率对得分的放大倍数
+ERROR_PENALTY = 4.0
+# 得分相对差距在该比例内视为相同（按使用次数择一，保持公平）
+SCORE_TIE_TOLERANCE = 0.05
+# 尚无观测时的默认 TTFT（毫秒）
+DEFAULT_TTFT_MS = 3000.0
+# 尾延迟：取最近 TAIL_WINDOW_MINUTES 分钟对应的时间槽（当前未满的槽 + 之前的完整槽，实际覆盖 14~15 分钟）的 TTFT p90，
+# 样本数不少于 TAIL_MIN_SAMPLES 时按 TAIL_WEIGHT 与 EWMA 混合
+TAIL_PERCENTILE = 90
+TAIL_WINDOW_MINUTES = 15
+TAIL_MIN_SAMPLES = 5
+TAIL_WEIGHT = 0.5
+# 尾延迟的缓存时间（秒），避免每次选择都合并直方图
+TAIL_REFRESH_SECONDS = 10
+
+
+class _GlobalLatencyPrior:
+    """全部账户的 TTFT EWMA，作为无观测账户和衰减的基准"""
+
+    def __init__(self) -> None:
+        self.ttft_ms = DEFAULT_TTFT_MS
+
+    def observe(self, ttft_ms: float) -> None:
+        self.ttft_ms += EWMA_ALPHA * 0.1 * (ttft_ms - self.ttft_ms)
+
+
+global_latency_prior = _GlobalLatencyPrior()
+
+
+class LatencyTracker:
+    """单个账户的 TTFT 与错误率 EWMA，以及 TTFT 的滚动窗口直方图（提供尾延迟）"""
+
+    __slots__ = ("ttft_ms", "error_rate", "updated_at", "samples", "histogram", "_tail_ms", "_tail_at")
+
+    def __init__(self, histogram: Optional[RollingHistogram] = None) -> None:
+        self.ttft_ms: Optional[float] = None
+        self.error_rate = 0.0
+        self.updated_at = 0.0
+        self.samples = 0
+        # 由调用方传入共享的序列时，账户重新加载后仍保留历史
+        self.histogram = histogram if histogram is not None else RollingHistogram()
+        self._tail_ms: Optional[float] = None
+        self._tail_at = 0.0
+
+    def record_success(self, ttft_ms: Optional[float]) -> None:
+        if ttft_ms is not None:
+            self.ttft_ms = ttft_ms if self.ttft_ms is None else self.ttft_ms + EWMA_ALPHA * (ttft_ms - self.ttft_ms)
+            global_latency_prior.observe(ttft_ms)
+            self.histogram.record(ttft_ms)
+        self.error_rate += EWMA_ALPHA * (0.0 - self.error_rate)
+        self.updated_at = time.time()
+        self.samples += 1
+
+    def record_failure(self) -> None:
+        self.error_rate += EWMA_ALPHA * (1.0 - self.error_rate)
+        self.updated_at = time.time()
+        self.samples += 1
+
+    def tail_ms(self, now: float) -> Optional[float]:
+        """最近窗口内的 TTFT p90（样本不足时为 None）"""
+        if now - self._tail_at >= TAIL_REFRESH_SECONDS:
+            window = self.histogram.window(TAIL_WINDOW_MINUTES, now)
+            self._tail_ms = window.percentile(TAIL_PERCENTILE) if window.total >= TAIL_MIN_SAMPLES else None
+            self._tail_at = now
+        return self._tail_ms
+
+    def effective(self, now: float) -> tuple:
+        """按观测时间衰减后的 (TTFT 毫秒, 错误率)"""
+        prior = global_latency_prior.ttft_ms
+        if self.ttft_ms is None and self.error_rate == 0.0:
+            return prior, 0.0
+        weight = math.exp(-(now - self.updated_at) / SCORE_DECAY_SECONDS)
+        observed = self.ttft_ms
+        if observed is not None:
+            tail = self.tail_ms(now)
+            if tail is not None:
+                observed += TAIL_WEIGHT * (tail - observed)
+        ttft = prior if observed is None else prior + (observed - prior) * weight
+        return ttft, self.error_rate * weight
+
+
+def selection_score(in_flight: int, tracker: LatencyTracker, now: Optional[float] = None) -> float:
+    """账户得分（越低越优）：预计排队负载 × TTFT × 错误惩罚"""
+    ttft_ms, error_rate = tracker.effective(time.time() if now is None else now)
+    return (in_flight + 1) * ttft_ms * (1.0 + ERROR_PENALTY * error_rate)
@@ -0,0 +1,172 @@
+"""账户熔断器
+
+替代固定时长的 429/401/403 冷却：
+- closed：正常使用
+- open：熔断中，不参与选择；经过试探间隔后进入 half-open
+- half-open：只放行一个试探请求，成功则关闭，失败则以指数退避重新熔断
+
+试探间隔从 probe_seconds 开始，每次试探失败翻倍，上限为原固定冷却时间。
+"""
+import time
+from collections import deque
+from typing import Deque, Optional
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+# 试探请求的最长占用时间（秒），超过后视为结果未知，允许新的试探
+PROBE_TIMEOUT_SECONDS = 180
+# 每个熔断器保留的最近状态变化记录数
+TRANSITION_HISTORY_SIZE = 10
+
+
+class CircuitBreaker:
+    """单个熔断器（账户全局或某个配额类型）"""
+
+    __slots__ = ("state", "opened_at", "open_seconds", "trips", "reason", "probe_started_at", "transitions")
+
+    def __init__(self) -> None:
+        self.state = STATE_CLOSED
+        self.opened_at = 0.0
+        self.open_seconds = 0.0  # 当前熔断时长（到达后进入 half-open）
+        self.trips = 0  # 连续熔断次数（关闭时清零）
+        self.reason: Optional[str] = None
+        self.probe_started_at = 0.0
+        # 最近状态变化：(时间戳, 原状态, 新状态, 原因)
+        self.transitions: Deque[tuple] = deque(maxlen=TRANSITION_HISTORY_SIZE)
+
+    def _transition(self, state: str, now: float, reason: Optional[str] = None) -> None:
+        if state != self.state:
+            self.transitions.append((now, self.state, state, reason))
+            self.state = state
+
+    @property
+    def is_closed(self) -> bool:
+        return self.state == STATE_CLOSED
+
+    def retry_at(self) -> float:
+        """open 状态下进入 half-open 的时间戳"""
+        return self.opened_at + self.open_seconds
+
+    def trip(self, probe_seconds: float, max_seconds: float, reason: str, now: Optional[float] = None) -> float:
+        """
+        记录一次限流/认证失败并熔断
+
+        Returns:
+            本次熔断时长（秒）
+        """
+        now = time.time() if now is None else now
+        if self.state == STATE_OPEN:
+            # 熔断期间仍在进行的请求陆续失败：只刷新起点，不重复退避
+            pass
+        elif self.state == STATE_HALF_OPEN:
+            self.trips += 1
+            self.open_seconds = min(self.open_seconds * 2 or probe_seconds, max_seconds)
+        else:
+            self.trips = 1
+            self.open_seconds = min(probe_seconds, max_seconds)
+        self.opened_at = now
+        self.reason = reason
+        self.probe_started_at = 0.0
+        self._transition(STATE_OPEN, now, reason)
+        return self.open_seconds
+
+    def allows(self, now: Optional[float] = None) -> bool:
+        """是否允许新请求（open 到期后转为 half-open；half-open 只允许一个试探）"""
+        if self.state == STATE_CLOSED:
+            return True
+        now = time.time() if now is None else now
+        if self.state == STATE_OPEN:
+            if now < self.retry_at():
+                return False
+            self._transition(STATE_HALF_OPEN, now)
+        return not self.probe_started_at or now - self.probe_started_at > PROBE_TIMEOUT_SECONDS
+
+    def begin_probe(self, now: Optional[float] = None) -> bool:
+        """half-open 状态下占用试探名额，返回是否为试探请求"""
+        if self.state != STATE_HALF_OPEN:
+            return False
+        self.probe_started_at = time.time() if now is None else now
+        return True
+
+    def end_probe(self) -> None:
+        """试探结果不确定（如网络错误），释放名额以便再次试探"""
+        self.probe_started_at = 0.0
+
+    def close(self, now: Optional[float] = None) -> bool:
+        """
+        请求成功，关闭熔断器；返回是否发生了状态变化
+
+        open 状态下不关闭：熔断前已发出的请求成功不能说明限流已解除
+        """
+        if self.state != STATE_HALF_OPEN:
+            return False
+        self._transition(STATE_CLOSED, time.time() if now is None else now, "试探成功")
+        self.trips = 0
+        self.open_seconds = 0.0
+        self.opened_at = 0.0
+        self.reason = None
+        self.probe_started_at = 0.0
+        return True
+
+    def reset(self) -> None:
+        """手动重置（管理员启用账户）"""
+        if self.state != STATE_CLOSED:
+            self._transition(STATE_CLOSED, time.time(), "手动重置")
+        self.trips = 0
+        self.open_seconds = 0.0
+        self.opened_at = 0.0
+        self.reason = None
+        self.probe_started_at = 0.0
+
+    def next_state_change_at(self) -> Optional[float]:
+        """下一次可能变为可用的时间戳（open 到期或试探超时），closed 返回 None"""
+        if self.state == STATE_OPEN:
+            return self.retry_at()
+        if self.state == STATE_HALF_OPEN and self.probe_started_at:
+            return self.probe_started_at + PROBE_TIMEOUT_SECONDS
+        return None
+
+    def remaining_seconds(self, now: Optional[float] = None) -> int:
+        if self.state != STATE_OPEN:
+            return 0
+        now = time.time() if now is None else now
+        return max(0, int(self.retry_at() - now))
+
+    def to_dict(self) -> dict:
+        """可跨进程共享的状态（试探名额与变化记录只在本进程内有效）"""
+        return {
+            "state": self.state,
+            "opened_at": self.opened_at,
+            "open_seconds": self.open_seconds,
+            "trips": self.trips,
+            "reason": self.reason,
+        }
+
+    def load(self, data: dict, now: Optional[float] = None) -> None:
+        """应用其他进程同步来的状态"""
+        state = data.get("state", STATE_CLOSED)
+        self._transition(state, time.time() if now is None else now, data.get("reason") or "其他进程同步")
+        self.opened_at = float(data.get("opened_at") or 0.0)
+        self.open_seconds = float(data.get("open_seconds") or 0.0)
+        self.trips = int(data.get("trips") or 0)
+        self.reason = data.get("reason")
+        if state != STATE_HALF_OPEN:
+            self.probe_started_at = 0.0
+
+    def get_status(self, now: Optional[float] = None) -> dict:
+        now = time.time() if now is None else now
+        self.allows(now)  # 熔断到期时先转为 half-open，避免展示过时状态
+        return {
+            "state": self.state,
+            "reason": self.reason,
+            "trips": self.trips,
+            "open_seconds": int(self.open_seconds),
+            "retry_in_seconds": self.remaining_seconds(now),
+            "probing": self.state == STATE_HALF_OPEN and bool(self.probe_started_at),
+            "transitions": [
+                {"time": int(ts), "from": from_state, "to": to_state, "reason": reason}
+                for ts, from_state, to_state, reason in self.transitions
+            ],
+        }
@@ -15,7 +15,7 @@ import shutil
 import yaml
 import secrets
 from pathlib import Path
-from typing import Optional, List
+from typing import Optional, List, Literal
 from pydantic import BaseModel, Field, validator
 from dotenv import load_dotenv
 
@@ -103,6 +103,7 @@ class RetryConfig(BaseModel):
     text_rate_limit_cooldown_seconds: int = Field(default=7200, ge=3600, le=86400, description="Text 429 cooldown (seconds)")
     images_rate_limit_cooldown_seconds: int = Field(default=14400, ge=3600, le=86400, description="Images 429 cooldown (seconds)")
     videos_rate_limit_cooldown_seconds: int = Field(default=14400, ge=3600, le=86400, description="Videos 429 cooldown (seconds)")
+    circuit_probe_seconds: int = Field(default=300, ge=10, le=3600, description="熔断后首次试探间隔（秒），试探失败后翻倍，上限为对应冷却时间")
     session_cache_ttl_seconds: int = Field(default=3600, ge=0, le=86400, description="会话缓存时间（秒，0表示禁用缓存）")
     auto_refresh_accounts_seconds: int = Field(default=60, ge=0, le=600, description="自动刷新账号间隔（秒，0禁用）")
     # 定时刷新配置
@@ -120,6 +121,41 @@ class SessionConfig(BaseModel):
     expire_hours: int = Field(default=24, ge=1, le=168, description="Session过期时间（小时）")
 
 
+class PerformanceConfig(BaseModel):
+    """性能调优配置"""
+    stream_coalesce_window_ms: int = Field(default=0, ge=0, le=1000, description="流式增量合并窗口（毫秒，0表示不合并）")
+    stream_coalesce_max_chars: int = Field(default=2048, ge=1, le=65536, description="单个合并帧的最大字符数")
+    stream_parser_engine: Literal["bytes", "legacy"] = Field(
+        default="bytes", description="上游流解析引擎（bytes：按字节块增量解析；legacy：按行逐字符解析）"
+    )
+    session_pool_max_size: int = Field(default=2, ge=0, le=10, description="每个账户预热 Session 的最大数量（0表示禁用预热池）")
+    session_pool_ttl_seconds: int = Field(default=600, ge=60, le=3600, description="预热 Session 的最长闲置时间（秒）")
+    upload_concurrency_per_request: int = Field(default=4, ge=1, le=16, description="单个请求的附件并发上传数")
+    upload_concurrency_per_account: int = Field(default=8, ge=1, le=64, description="单个账户的附件并发上传数")
+    url_fetch_max_mb: int = Field(default=20, ge=1, le=100, description="URL 附件下载大小上限（MB）")
+    url_fetch_cache_mb: int = Field(default=64, ge=0, le=1024, description="URL 附件缓存容量（MB，0表示不缓存）")
+    account_selection_policy: Literal["round_robin", "least_in_flight", "p2c"] = Field(
+        default="round_robin", description="账户选择策略（轮询/最少进行中/双随机择优）"
+    )
+    account_max_in_flight_text: int = Field(default=4, ge=0, le=100, description="单账户对话并发上限（0表示不限制）")
+    account_max_in_flight_images: int = Field(default=2, ge=0, le=100, description="单账户绘图并发上限（0表示不限制）")
+    account_max_in_flight_videos: int = Field(default=1, ge=0, le=100, description="单账户视频并发上限（0表示不限制）")
+    account_rate_per_minute_text: int = Field(default=0, ge=0, le=600, description="单账户对话每分钟请求数（0表示不限制）")
+    account_rate_per_minute_images: int = Field(default=0, ge=0, le=600, description="单账户绘图每分钟请求数（0表示不限制）")
+    account_rate_per_minute_videos: int = Field(default=0, ge=0, le=600, description="单账户视频每分钟请求数（0表示不限制）")
+    account_rate_burst: int = Field(default=2, ge=1, le=100, description="令牌桶容量（允许的瞬时突发请求数）")
+    account_queue_max_waiters: int = Field(default=100, ge=0, le=10000, description="账户全部饱和时的最大排队请求数（0表示不排队）")
+    account_queue_timeout_seconds: int = Field(default=30, ge=1, le=300, description="排队等待账户空闲的最长时间（秒）")
+    quota_prediction_enabled: bool = Field(default=True, description="根据历史429学习各账户配额上限，优先避开即将耗尽的账户")
+    session_cache_max_entries: int = Field(default=1000, ge=100, le=100000, description="会话缓存最大条目数（超出后按最近最少使用淘汰）")
+    session_binding_flush_seconds: int = Field(default=5, ge=1, le=300, description="对话绑定写入数据库的间隔（秒）")
+    context_max_chars: int = Field(default=500000, ge=0, le=10000000, description="发送完整上下文时的字符预算（0表示不限制）")
+    context_max_tokens: int = Field(default=0, ge=0, le=2000000, description="发送完整上下文时的估算 token 预算（0表示不限制）")
+    state_sync_interval_ms: int = Field(default=1000, ge=100, le=10000, description="多 worker 共享状态的同步间隔（毫秒）")
+    stats_flush_seconds: int = Field(default=5, ge=1, le=300, description="统计数据写入数据库的间隔（秒，异常退出时最多丢失该间隔内的统计）")
+    stats_retention_days: int = Field(default=30, ge=1, le=3650, description="每小时统计的保留天数")
+
+
 class SecurityConfig(BaseModel):
     """安全配置（仅从环境变量读取，不可热更新）"""
     admin_key: str = Field(default="", description="管理员密钥（必需）")
@@ -138,6 +174,7 @@ class AppConfig(BaseModel):
     retry: RetryConfig
     public_display: PublicDisplayConfig
     session: SessionConfig
+    performance: PerformanceConfig = Field(default_factory=PerformanceConfig)
 
 
 # ==================== 配置管理器 ====================
@@ -265,6 +302,14 @@ class ConfigManager:
             print(f"[WARN] Session配置加载失败，使用默认值: {e}")
             session_config = SessionConfig()
 
+        try:
+            performance_config = PerformanceConfig(
+                **yaml_data.get("performance", {})
+            )
+        except Exception as e:
+            print(f"[WARN] 性能配置加载失败，使用默认值: {e}")
+            performance_config = PerformanceConfig()
+
         # 5. 构建完整配置
         self._config = AppConfig(
             security=security_config,
@@ -273,7 +318,8 @@ class ConfigManager:
             video_generation=video_generation_config,
             retry=retry_config,
             public_display=public_display_config,
-            session=session_config
+            session=session_config,
+            performance=performance_config
         )
 
     def _load_yaml(self) -> dict:
@@ -339,6 +385,10 @@ class ConfigManager:
                 **data.get("session", {})
             )
 
+            performance_config = PerformanceConfig(
+                **data.get("performance", {})
+            )
+
             # 验证通过，构建完整配置
             test_config = AppConfig(
                 security=security_config,
@@ -347,7 +397,8 @@ class ConfigManager:
                 video_generation=video_generation_config,
                 retry=retry_config,
                 public_display=public_display_config,
-                session=session_config
+                session=session_config,
+                performance=performance_config
             )
         except Exception as e:
             # 验证失败，不保存到数据库
@@ -529,4 +580,8 @@ class _ConfigProxy:
     def session(self):
         return config_manager.config.session
 
+    @property
+    def performance(self):
+        return config_manager.config.performance
+
 config = _ConfigProxy()
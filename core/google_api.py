@@ -82,8 +82,9 @@ async def make_request_with_jwt_retry(
     else:
         raise ValueError(f"Unsupported HTTP method: {method}")
 
-    # 如果401，刷新JWT后重试一次
+    # 如果401，丢弃缓存的密钥材料，刷新JWT后重试一次
     if resp.status_code == 401:
+        account_mgr.invalidate_jwt()
         jwt = await account_mgr.get_jwt(request_id)
         headers = get_common_headers(jwt, user_agent)
         if extra_headers:
@@ -227,6 +228,62 @@ async def get_session_file_metadata(
     return result
 
 
+class GeneratedFileCollector:
+    """增量检测流式响应中生成的文件（图片/视频）
+
+    每收到一个响应对象就调用 feed()，只记录 fileId/mimeType 和最新的 session，
+    不保留响应对象本身，因此内存占用与回答长度无关。
+    """
+
+    def __init__(self) -> None:
+        self.file_ids: List[dict] = []  # [{"fileId": str, "mimeType": str}, ...]
+        self.session_name = ""
+        self._seen_file_ids = set()  # 用于去重
+
+    def feed(self, data: dict) -> None:
+        """检查单个响应对象"""
+        sar = data.get("streamAssistResponse")
+        if not sar:
+            return
+
+        # 获取session信息（优先使用最新的）
+        session_info = sar.get("sessionInfo") or {}
+        if session_info.get("session"):
+            self.session_name = session_info["session"]
+
+        answer = sar.get("answer") or {}
+        for reply in answer.get("replies") or []:
+            content = (reply.get("groundedContent") or {}).get("content") or {}
+
+            # 检查file字段（图片生成的关键）
+            file_info = content.get("file")
+            if not file_info or not file_info.get("fileId"):
+                continue
+            file_id = file_info["fileId"]
+            # 去重：同一个 fileId 只处理一次
+            if file_id in self._seen_file_ids:
+                continue
+            self._seen_file_ids.add(file_id)
+
+            mime_type = file_info.get("mimeType", "image/png")
+            logger.debug(f"[PARSE] 解析文件: fileId={file_id}, mimeType={mime_type}")
+            self.file_ids.append({
+                "fileId": file_id,
+                "mimeType": mime_type
+            })
+
+
+def parse_images_from_response(data_list: list) -> tuple[list, str]:
+    """从API响应中解析图片文件引用
+    返回: (file_ids_list, session_name)
+    file_ids_list: [{"fileId": str, "mimeType": str}, ...]
+    """
+    collector = GeneratedFileCollector()
+    for data in data_list:
+        collector.feed(data)
+    return collector.file_ids, collector.session_name
+
+
 def build_image_download_url(session_name: str, file_id: str) -> str:
     """构造图片下载URL"""
     return f"{GEMINI_API_BASE}/{session_name}:downloadFile?fileId={file_id}&alt=media"
@@ -9,13 +9,15 @@ import hmac
 import json
 import logging
 import time
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Callable, Dict
 
 import httpx
 from fastapi import HTTPException
 
+from core import metrics
+
 if TYPE_CHECKING:
-    from main import AccountConfig
+    from core.account import AccountConfig, AccountManager
 
 logger = logging.getLogger(__name__)
 
@@ -52,10 +54,27 @@ def create_jwt(key_bytes: bytes, key_id: str, csesidx: str) -> str:
     return f"{message}.{urlsafe_b64encode(sig)}"
 
 
+# 密钥材料（getoxsrf 返回的 xsrfToken/keyId）的有效期（秒）
+KEY_MATERIAL_TTL_SECONDS = 270
+# 本地签发的 JWT 复用时长（秒，JWT 本身有效期为 300 秒）
+JWT_REUSE_SECONDS = 240
+# 后台提前刷新密钥材料的时间（秒）
+KEY_REFRESH_MARGIN_SECONDS = 60
+# 各账户刷新时间的错开范围（秒），避免所有账户同时请求 getoxsrf
+KEY_REFRESH_STAGGER_SECONDS = 30
+# 最近多久内使用过的账户视为活跃（秒）
+ACTIVE_ACCOUNT_WINDOW_SECONDS = 900
+# 后台刷新检查间隔（秒）
+REFRESH_CHECK_INTERVAL_SECONDS = 5
+# 后台刷新的最大并发数
+MAX_CONCURRENT_REFRESHES = 4
+
+
 class JWTManager:
     """JWT token管理器
 
-    负责JWT的获取、刷新和缓存
+    缓存 getoxsrf 返回的密钥材料，在其有效期内本地签发 JWT（无需网络请求）。
+    密钥材料由后台调度器在过期前刷新，请求路径只在冷启动（或密钥已过期）时等待 getoxsrf。
     """
     def __init__(self, config: "AccountConfig", http_client: httpx.AsyncClient, user_agent: str) -> None:
         self.config = config
@@ -63,39 +82,135 @@ class JWTManager:
         self.user_agent = user_agent
         self.jwt: str = ""
         self.expires: float = 0
+        # 密钥材料缓存
+        self.key_bytes: bytes = b""
+        self.key_id: str = ""
+        self.key_expires: float = 0
+        self.last_used: float = 0
+        # 错开各账户的后台刷新时间（同一账户保持稳定）
+        self.refresh_offset = int(hashlib.sha256(config.account_id.encode()).hexdigest()[:8], 16) % (KEY_REFRESH_STAGGER_SECONDS + 1)
         self._lock = asyncio.Lock()
 
     async def get(self, request_id: str = "") -> str:
-        """获取JWT token（自动刷新）"""
+        """获取JWT token（密钥有效时本地签发，仅冷启动时阻塞刷新）"""
+        now = time.time()
+        self.last_used = now
+        if now < self.key_expires:
+            if now > self.expires:
+                self._mint(now)
+            return self.jwt
+
         async with self._lock:
-            if time.time() > self.expires:
+            # 等待锁期间可能已被其他请求或后台任务刷新
+            if time.time() >= self.key_expires:
                 await self._refresh(request_id)
+            elif time.time() > self.expires:
+                self._mint(time.time())
             return self.jwt
 
+    def _mint(self, now: float) -> None:
+        """使用缓存的密钥材料本地签发 JWT"""
+        self.jwt = create_jwt(self.key_bytes, self.key_id, self.config.csesidx)
+        self.expires = min(now + JWT_REUSE_SECONDS, self.key_expires)
+
+    def invalidate(self) -> None:
+        """丢弃缓存的密钥材料（上游返回 401 时调用，下次获取将重新请求 getoxsrf）"""
+        self.key_expires = 0
+        self.expires = 0
+
+    def needs_background_refresh(self, now: float) -> bool:
+        """活跃账户的密钥材料即将过期时需要后台刷新"""
+        if not self.key_bytes or now - self.last_used > ACTIVE_ACCOUNT_WINDOW_SECONDS:
+            return False
+        return now >= self.key_expires - KEY_REFRESH_MARGIN_SECONDS + self.refresh_offset
+
+    async def refresh_in_background(self) -> None:
+        """后台刷新密钥材料（不与已在进行的刷新重复）"""
+        if self._lock.locked():
+            return
+        async with self._lock:
+            if not self.needs_background_refresh(time.time()):
+                return
+            await self._refresh()
+
     async def _refresh(self, request_id: str = "") -> None:
-        """刷新JWT token"""
+        """请求 getoxsrf 刷新密钥材料并签发新的 JWT"""
         cookie = f"__Secure-C_SES={self.config.secure_c_ses}"
         if self.config.host_c_oses:
             cookie += f"; __Host-C_OSES={self.config.host_c_oses}"
 
         req_tag = f"[req_{request_id}] " if request_id else ""
-        r = await self.http_client.get(
-            "https://business.gemini.google/auth/getoxsrf",
-            params={"csesidx": self.config.csesidx},
-            headers={
-                "cookie": cookie,
-                "user-agent": self.user_agent,
-                "referer": "https://business.gemini.google/"
-            },
-        )
+        start = time.perf_counter()
+        try:
+            r = await self.http_client.get(
+                "https://business.gemini.google/auth/getoxsrf",
+                params={"csesidx": self.config.csesidx},
+                headers={
+                    "cookie": cookie,
+                    "user-agent": self.user_agent,
+                    "referer": "https://business.gemini.google/"
+                },
+            )
+        except Exception:
+            metrics.JWT_REFRESH_TOTAL.labels("error").inc()
+            raise
+        metrics.JWT_REFRESH_SECONDS.observe(time.perf_counter() - start)
         if r.status_code != 200:
+            metrics.JWT_REFRESH_TOTAL.labels("error").inc()
             logger.error(f"[AUTH] [{self.config.account_id}] {req_tag}JWT 刷新失败: {r.status_code}")
             raise HTTPException(r.status_code, "getoxsrf failed")
+        metrics.JWT_REFRESH_TOTAL.labels("success").inc()
 
         txt = r.text[4:] if r.text.startswith(")]}'") else r.text
         data = json.loads(txt)
 
-        key_bytes = base64.urlsafe_b64decode(data["xsrfToken"] + "==")
-        self.jwt      = create_jwt(key_bytes, data["keyId"], self.config.csesidx)
-        self.expires = time.time() + 270
+        now = time.time()
+        self.key_bytes = base64.urlsafe_b64decode(data["xsrfToken"] + "==")
+        self.key_id = data["keyId"]
+        self.key_expires = now + KEY_MATERIAL_TTL_SECONDS
+        self._mint(now)
         logger.info(f"[AUTH] [{self.config.account_id}] {req_tag}JWT 刷新成功")
+
+
+async def start_background_refresh(get_accounts: Callable[[], Dict[str, "AccountManager"]]) -> None:
+    """后台任务：在活跃账户的密钥材料过期前错峰刷新，使请求路径无需等待 getoxsrf"""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REFRESHES)
+    tasks = set()
+    pending = set()
+    retry_after: Dict[str, float] = {}
+
+    async def refresh(account_mgr: "AccountManager") -> None:
+        account_id = account_mgr.config.account_id
+        try:
+            async with semaphore:
+                await account_mgr.jwt_manager.refresh_in_background()
+        except Exception as e:
+            # 后台刷新失败不影响账户状态，密钥过期后由请求路径重试并走正常错误处理
+            retry_after[account_id] = time.time() + KEY_REFRESH_MARGIN_SECONDS / 2
+            logger.warning(f"[AUTH] [{account_id}] 后台 JWT 刷新失败: {type(e).__name__}: {str(e)[:100]}")
+        finally:
+            pending.discard(account_id)
+
+    while True:
+        try:
+            await asyncio.sleep(REFRESH_CHECK_INTERVAL_SECONDS)
+        except asyncio.CancelledError:
+            logger.info("[AUTH] 后台 JWT 刷新任务已停止")
+            return
+        # 单次检查失败只记录日志，下一轮继续
+        try:
+            now = time.time()
+            for account_mgr in list(get_accounts().values()):
+                jwt_manager = account_mgr.jwt_manager
+                if jwt_manager is None or account_mgr.config.disabled or account_mgr.config.is_expired():
+                    continue
+                account_id = account_mgr.config.account_id
+                if account_id in pending or now < retry_after.get(account_id, 0):
+                    continue
+                if jwt_manager.needs_background_refresh(now):
+                    pending.add(account_id)
+                    task = asyncio.create_task(refresh(account_mgr))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+        except Exception as e:
+            logger.error(f"[AUTH] 后台 JWT 刷新检查异常: {type(e).__name__}: {e}")
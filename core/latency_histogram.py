@@ -0,0 +1,180 @@
+"""延迟分位数统计
+
+按模型和按账户记录 TTFT / 请求耗时的滚动窗口直方图，用于回答
+"某模型最近 1 小时的 p99 TTFT"、"哪些账户偏慢"，并为账户选择提供尾延迟：
+- LogHistogram：对数分桶（类似 HDR Histogram），相邻桶边界相差 LOG_BUCKET_GROWTH 倍，
+  分位数的相对误差不超过约 5%；所有直方图桶布局相同，可逐桶相加合并
+- RollingHistogram：WINDOW_SLOTS 个 SLOT_SECONDS 宽的时间槽组成的环（与 time_series 相同的槽位复用方式），
+  查询时合并最近 N 个槽位（当前未满的槽 + 之前 N-1 个完整槽，N = minutes / SLOT_SECONDS 向上取整），
+  实际覆盖 (N-1)×SLOT_SECONDS 到 N×SLOT_SECONDS 秒；1 分钟的槽宽使各窗口最多偏差 1 分钟，
+  每个序列约 68 KB，内存固定，与流量无关
+- LatencyHistograms：按 (维度, 名称, 指标) 管理序列，只在事件循环中更新，无需加锁
+"""
+import math
+import time
+from array import array
+from typing import Dict, Iterable, Optional, Tuple
+
+# 可区分的最小/最大延迟（毫秒），超出范围的值计入首/末桶
+MIN_LATENCY_MS = 1.0
+MAX_LATENCY_MS = 600_000.0
+# 相邻桶边界的倍数
+LOG_BUCKET_GROWTH = 1.1
+_LOG_GROWTH = math.log(LOG_BUCKET_GROWTH)
+# 桶 0 为 <= MIN_LATENCY_MS，桶 i 为 (MIN * GROWTH^(i-1), MIN * GROWTH^i]，最后一个桶包含超出上限的值
+BUCKET_COUNT = math.ceil(math.log(MAX_LATENCY_MS / MIN_LATENCY_MS) / _LOG_GROWTH) + 2
+
+# 时间槽宽度（秒）与数量：共保留最近 1 小时
+SLOT_SECONDS = 60
+WINDOW_SLOTS = 60
+# 可查询的窗口（分钟）
+WINDOW_CHOICES = (5, 15, 60)
+
+# 维度
+MODEL = "model"
+ACCOUNT = "account"
+# 指标
+TTFT = "ttft"
+DURATION = "duration"
+
+PERCENTILES = (50, 90, 99)
+
+
+def bucket_for(value_ms: float) -> int:
+    if value_ms <= MIN_LATENCY_MS:
+        return 0
+    return min(math.ceil(math.log(value_ms / MIN_LATENCY_MS) / _LOG_GROWTH), BUCKET_COUNT - 1)
+
+
+def bucket_value(bucket: int) -> float:
+    """桶的代表值（上下边界的几何中点）"""
+    if bucket <= 0:
+        return MIN_LATENCY_MS
+    return min(MIN_LATENCY_MS * LOG_BUCKET_GROWTH ** (bucket - 0.5), MAX_LATENCY_MS)
+
+
+def window_slots(minutes: int) -> int:
+    """minutes 分钟窗口对应的槽位数 N（含当前未满的槽）"""
+    return min(WINDOW_SLOTS, max(1, math.ceil(minutes * 60 / SLOT_SECONDS)))
+
+
+def window_covered_seconds(minutes: int, now: Optional[float] = None) -> float:
+    """最近 N 个槽位实际覆盖的时长（秒）：当前槽已过去的部分 + N-1 个完整槽"""
+    now = time.time() if now is None else now
+    return (window_slots(minutes) - 1) * SLOT_SECONDS + now % SLOT_SECONDS
+
+
+class LogHistogram:
+    """对数分桶直方图"""
+
+    __slots__ = ("counts", "total", "sum_ms")
+
+    def __init__(self) -> None:
+        self.counts = array("Q", bytes(8 * BUCKET_COUNT))
+        self.total = 0
+        self.sum_ms = 0.0
+
+    def record(self, value_ms: float) -> None:
+        self.counts[bucket_for(value_ms)] += 1
+        self.total += 1
+        self.sum_ms += value_ms
+
+    def reset(self) -> None:
+        for index in range(BUCKET_COUNT):
+            self.counts[index] = 0
+        self.total = 0
+        self.sum_ms = 0.0
+
+    def merge(self, other: "LogHistogram") -> None:
+        counts = self.counts
+        for index, count in enumerate(other.counts):
+            if count:
+                counts[index] += count
+        self.total += other.total
+        self.sum_ms += other.sum_ms
+
+    def percentile(self, percent: float) -> Optional[float]:
+        if not self.total:
+            return None
+        rank = max(1, math.ceil(self.total * percent / 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return bucket_value(index)
+        return bucket_value(BUCKET_COUNT - 1)
+
+    def summary(self) -> dict:
+        result = {"count": self.total, "mean_ms": round(self.sum_ms / self.total) if self.total else None}
+        for percent in PERCENTILES:
+            value = self.percentile(percent)
+            result[f"p{percent}_ms"] = None if value is None else round(value)
+        return result
+
+
+class RollingHistogram:
+    """按时间槽滚动的直方图"""
+
+    __slots__ = ("_slots", "_indexes")
+
+    def __init__(self) -> None:
+        self._slots = [LogHistogram() for _ in range(WINDOW_SLOTS)]
+        # 每个槽位当前保存的槽序号（-1 表示空）
+        self._indexes = array("q", [-1]) * WINDOW_SLOTS
+
+    def record(self, value_ms: float, ts: Optional[float] = None) -> None:
+        index = int((time.time() if ts is None else ts) // SLOT_SECONDS)
+        slot = index % WINDOW_SLOTS
+        if self._indexes[slot] != index:
+            if self._indexes[slot] > index:
+                return
+            self._indexes[slot] = index
+            self._slots[slot].reset()
+        self._slots[slot].record(value_ms)
+
+    def window(self, minutes: int, now: Optional[float] = None) -> LogHistogram:
+        """合并最近 N 个时间槽（N = window_slots(minutes)，含当前未满的槽）的直方图"""
+        current = int((time.time() if now is None else now) // SLOT_SECONDS)
+        slots = window_slots(minutes)
+        merged = LogHistogram()
+        for index in range(current - slots + 1, current + 1):
+            slot = index % WINDOW_SLOTS
+            if self._indexes[slot] == index:
+                merged.merge(self._slots[slot])
+        return merged
+
+
+class LatencyHistograms:
+    """按 (维度, 名称, 指标) 索引的滚动直方图"""
+
+    def __init__(self) -> None:
+        self._series: Dict[Tuple[str, str, str], RollingHistogram] = {}
+
+    def series(self, dimension: str, name: str, metric: str) -> RollingHistogram:
+        key = (dimension, name, metric)
+        histogram = self._series.get(key)
+        if histogram is None:
+            histogram = self._series[key] = RollingHistogram()
+        return histogram
+
+    def record(self, dimension: str, name: str, metric: str, value_ms: float) -> None:
+        self.series(dimension, name, metric).record(value_ms)
+
+    def forget(self, dimension: str, names: Iterable[str]) -> None:
+        """删除不再存在的模型/账户的序列"""
+        names = set(names)
+        for key in [key for key in self._series if key[0] == dimension and key[1] in names]:
+            del self._series[key]
+
+    def summary(self, window_minutes: int) -> dict:
+        """{维度: {名称: {指标: {count, mean_ms, p50_ms, p90_ms, p99_ms}}}}，窗口内无数据的序列不返回"""
+        now = time.time()
+        result: Dict[str, Dict[str, dict]] = {MODEL: {}, ACCOUNT: {}}
+        for (dimension, name, metric), histogram in sorted(self._series.items()):
+            merged = histogram.window(window_minutes, now)
+            if merged.total:
+                result.setdefault(dimension, {}).setdefault(name, {})[metric] = merged.summary()
+        return result
+
+
+latency_histograms = LatencyHistograms()
@@ -3,19 +3,25 @@
 负责消息的解析、文本提取和会话指纹生成
 """
 import asyncio
-import base64
 import hashlib
 import logging
 import re
-from typing import List, TYPE_CHECKING
+from typing import List, Tuple, TYPE_CHECKING
 
 import httpx
 
+from core.url_fetcher import url_fetcher
+
 if TYPE_CHECKING:
     from main import Message
 
 logger = logging.getLogger(__name__)
 
+# 上下文超出预算时插入的截断标记
+CONTEXT_TRUNCATED_MARKER = "[此前的 {count} 条对话已省略]\n\n"
+# 估算 token 时按单字计算的中日韩字符
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
 
 def get_conversation_key(messages: List[dict], client_identifier: str = "") -> str:
     """
@@ -60,6 +66,39 @@ def get_conversation_key(messages: List[dict], client_identifier: str = "") -> s
     return hashlib.md5(conversation_prefix.encode()).hexdigest()
 
 
+def get_conversation_prefix_keys(messages: List[dict], client_identifier: str = "") -> List[str]:
+    """
+    生成对话各前缀的滚动哈希：keys[i] 对应 messages[:i+1]
+
+    每个前缀的哈希由上一个前缀的哈希与当前消息链式计算，总耗时与消息总长度成线性关系。
+    与 get_conversation_key 不同，完整消息序列都参与计算，开头相同的不同对话不会冲突。
+    """
+    keys = []
+    digest = hashlib.blake2b(client_identifier.encode(), digest_size=16).digest()
+    for msg in messages:
+        content = msg.get("content", "")
+        text = extract_text_from_content(content).strip()
+        image_count = sum(1 for part in content if part.get("type") == "image_url") if isinstance(content, list) else 0
+        hasher = hashlib.blake2b(digest, digest_size=16)
+        hasher.update(f"{msg.get('role', '')}:{image_count}:".encode())
+        hasher.update(text.encode())
+        digest = hasher.digest()
+        keys.append(digest.hex())
+    return keys
+
+
+def get_new_turns(messages: List['Message'], prefix_len: int) -> List['Message']:
+    """
+    已绑定前缀之后需要补发的消息
+
+    紧随前缀的 assistant 消息就是该 Session 自己生成的回复，不再重复发送。
+    """
+    turns = messages[prefix_len:]
+    if turns and turns[0].role == "assistant":
+        turns = turns[1:]
+    return turns
+
+
 def extract_text_from_content(content) -> str:
     """
     从消息 content 中提取文本内容
@@ -103,29 +142,12 @@ async def parse_last_message(messages: List['Message'], http_client: httpx.Async
                 else:
                     logger.warning(f"[FILE] [req_{request_id}] 不支持的文件格式: {url[:30]}...")
 
-    # 并行下载所有 URL 文件（支持图片、PDF、文档等）
+    # 并行下载所有 URL 文件（支持图片、PDF、文档等；流式限流、带缓存）
     if image_urls:
-        async def download_url(url: str):
-            try:
-                resp = await http_client.get(url, timeout=30, follow_redirects=True)
-                if resp.status_code == 404:
-                    logger.warning(f"[FILE] [req_{request_id}] URL文件已失效(404)，已跳过: {url[:50]}...")
-                    return None
-                resp.raise_for_status()
-                content_type = resp.headers.get("content-type", "application/octet-stream").split(";")[0]
-                # 移除图片类型限制，支持所有文件类型
-                b64 = base64.b64encode(resp.content).decode()
-                logger.info(f"[FILE] [req_{request_id}] URL文件下载成功: {url[:50]}... ({len(resp.content)} bytes, {content_type})")
-                return {"mime": content_type, "data": b64}
-            except httpx.HTTPStatusError as e:
-                status_code = e.response.status_code if e.response else "unknown"
-                logger.warning(f"[FILE] [req_{request_id}] URL文件下载失败({status_code}): {url[:50]}... - {e}")
-                return None
-            except Exception as e:
-                logger.warning(f"[FILE] [req_{request_id}] URL文件下载失败: {url[:50]}... - {e}")
-                return None
-
-        results = await asyncio.gather(*[download_url(u) for u in image_urls], return_exceptions=True)
+        results = await asyncio.gather(
+            *[url_fetcher.fetch(u, http_client, request_id) for u in image_urls],
+            return_exceptions=True
+        )
         safe_results = []
         for result in results:
             if isinstance(result, Exception):
@@ -137,18 +159,65 @@ async def parse_last_message(messages: List['Message'], http_client: httpx.Async
     return text_content, images
 
 
-def build_full_context_text(messages: List['Message']) -> str:
-    """仅拼接历史文本，图片只处理当次请求的"""
-    prompt = ""
-    for msg in messages:
-        role = "User" if msg.role in ["user", "system"] else "Assistant"
-        content_str = extract_text_from_content(msg.content)
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中日韩字符按 1 个 token，其余按 4 个字符 1 个 token"""
+    cjk_count = len(text) - len(_CJK_RE.sub("", text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+
+def _format_context_message(msg: 'Message') -> str:
+    role = "User" if msg.role in ["user", "system"] else "Assistant"
+    content_str = extract_text_from_content(msg.content)
+
+    # 为多模态消息添加图片标记
+    if isinstance(msg.content, list):
+        image_count = sum(1 for part in msg.content if part.get("type") == "image_url")
+        if image_count > 0:
+            content_str += "[图片]" * image_count
+
+    return f"{role}: {content_str}\n\n"
 
-        # 为多模态消息添加图片标记
-        if isinstance(msg.content, list):
-            image_count = sum(1 for part in msg.content if part.get("type") == "image_url")
-            if image_count > 0:
-                content_str += "[图片]" * image_count
 
-        prompt += f"{role}: {content_str}\n\n"
-    return prompt
+def build_context_text(messages: List['Message'], max_chars: int = 0, max_tokens: int = 0) -> Tuple[str, int]:
+    """
+    拼接历史文本（图片只处理当次请求的），超出预算时省略较早的对话
+
+    - 系统提示与最后一条消息始终保留
+    - 其余消息从最近往前保留，直到字符/估算 token 预算用尽（0 表示不限制）
+    - 省略处插入明确的标记，告知模型之前的历史已截断
+
+    Returns:
+        (上下文文本, 省略的消息数)
+    """
+    pieces = [_format_context_message(msg) for msg in messages]
+    if not pieces or (not max_chars and not max_tokens):
+        return "".join(pieces), 0
+
+    last = len(pieces) - 1
+    system_indexes = [i for i in range(last) if messages[i].role == "system"]
+    always_kept = system_indexes + [last]
+    used_chars = sum(len(pieces[i]) for i in always_kept)
+    used_tokens = sum(estimate_tokens(pieces[i]) for i in always_kept) if max_tokens else 0
+
+    # 从最近往前保留连续的对话，遇到放不下的消息即停止（只估算实际检查到的消息）
+    keep_from = last
+    for i in range(last - 1, -1, -1):
+        if messages[i].role == "system":
+            continue
+        if max_chars and used_chars + len(pieces[i]) > max_chars:
+            break
+        if max_tokens:
+            tokens = estimate_tokens(pieces[i])
+            if used_tokens + tokens > max_tokens:
+                break
+            used_tokens += tokens
+        used_chars += len(pieces[i])
+        keep_from = i
+    else:
+        return "".join(pieces), 0
+
+    omitted = sum(1 for i in range(keep_from) if messages[i].role != "system")
+    kept = [pieces[i] for i in system_indexes if i < keep_from]
+    kept.append(CONTEXT_TRUNCATED_MARKER.format(count=omitted))
+    kept.extend(pieces[keep_from:])
+    return "".join(kept), omitted
@@ -0,0 +1,241 @@
+"""Prometheus 指标
+
+以文本格式（text exposition format 0.0.4）输出 /metrics，不依赖 prometheus_client：
+- Counter / Gauge：按标签值缓存子项，记录时只做一次字典查找和加法
+- Histogram：桶边界在定义时固定，每个子项预分配计数数组，观测时二分查找桶位置后计数加一
+- GaugeCallback：抓取时才调用回调计算（如可用账户数、会话缓存大小），请求路径无开销
+指标均在事件循环中更新，无需加锁。
+"""
+import math
+from array import array
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# 延迟类直方图的默认桶边界（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0, 120.0)
+# 建连/上传等较快阶段的桶边界（秒）
+FAST_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[tuple, object] = {}
+
+    def labels(self, *values):
+        """按标签值取子项（首次出现时创建并缓存）"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} 需要标签 {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def collect(self) -> List[str]:
+        raise NotImplementedError
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class _TrackInProgress:
+    """async with 期间计数加一（可与其他异步上下文写在同一条 async with 中）"""
+
+    __slots__ = ("_value",)
+
+    def __init__(self, value: _Value) -> None:
+        self._value = value
+
+    async def __aenter__(self) -> None:
+        self._value.inc()
+
+    async def __aexit__(self, *exc_info) -> None:
+        self._value.dec()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def collect(self) -> List[str]:
+        lines = self._header()
+        for values, child in self._children.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def track_inprogress(self) -> _TrackInProgress:
+        return _TrackInProgress(self.labels())
+
+
+class GaugeCallback(_Metric):
+    """抓取时由回调返回 [(标签值元组, 数值), ...]"""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        callback: Callable[[], Iterable[Tuple[tuple, float]]],
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def collect(self) -> List[str]:
+        lines = self._header()
+        for values, value in self.callback():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}")
+        return lines
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]) -> None:
+        self.bounds = bounds
+        # 最后一个槽位对应 +Inf
+        self.counts = array("Q", bytes(8 * (len(bounds) + 1)))
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.bounds = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def collect(self) -> List[str]:
+        lines = self._header()
+        les = [_format_value(bound) for bound in self.bounds] + ["+Inf"]
+        for values, child in self._children.items():
+            cumulative = 0
+            for le, count in zip(les, child.counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, values, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        if not metric.labelnames and not isinstance(metric, GaugeCallback):
+            # 无标签的指标预先创建，未记录过时也输出 0
+            metric.labels()
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+REQUESTS_TOTAL = registry.register(Counter(
+    "gemini_requests_total", "Chat completion requests by model, account and HTTP status",
+    ("model", "account", "status"),
+))
+TTFT_SECONDS = registry.register(Histogram(
+    "gemini_ttft_seconds", "Time from request start to the first upstream content", ("model",),
+))
+REQUEST_DURATION_SECONDS = registry.register(Histogram(
+    "gemini_request_duration_seconds", "Total chat completion request duration", ("model",),
+))
+UPSTREAM_CONNECT_SECONDS = registry.register(Histogram(
+    "gemini_upstream_connect_seconds", "Time until the upstream stream returns response headers",
+    buckets=FAST_BUCKETS,
+))
+UPLOAD_SECONDS = registry.register(Histogram(
+    "gemini_upload_seconds", "Attachment upload time per request", buckets=FAST_BUCKETS,
+))
+JWT_REFRESH_SECONDS = registry.register(Histogram(
+    "gemini_jwt_refresh_seconds", "getoxsrf key material refresh time", buckets=FAST_BUCKETS,
+))
+JWT_REFRESH_TOTAL = registry.register(Counter(
+    "gemini_jwt_refresh_total", "getoxsrf key material refreshes by result", ("result",),
+))
+ACCOUNT_SELECTIONS_TOTAL = registry.register(Counter(
+    "gemini_account_selections_total", "Accounts selected for a request", ("account",),
+))
+STREAMS_IN_FLIGHT = registry.register(Gauge(
+    "gemini_streams_in_flight", "Upstream streams currently open",
+))
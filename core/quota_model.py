@@ -0,0 +1,191 @@
+"""账户配额预测模型
+
+上游只在配额耗尽时返回 429。这里按账户、按配额类型记录请求数，
+在每次 429 时学习"一个配额周期内能发出多少请求、用了多长时间"，
+据此估算账户当前的剩余额度，供账户选择时优先避开即将耗尽的账户。
+
+- 周期：从上一次 429（或首次请求）之后的第一个请求到本次 429
+- 学习值：周期内请求数与周期时长的 EWMA
+- 当前用量：滑动窗口（学习到的周期时长）内、且在上一次 429 之后的请求数
+- 尚未学习到的账户使用全账户池的平均值作为先验
+"""
+from collections import deque
+from typing import Deque, Dict, Optional
+
+# EWMA 平滑系数
+LEARNING_ALPHA = 0.5
+# 同一配额在该时间内的多次 429 视为同一次耗尽（并发请求陆续失败）
+LIMIT_DEDUP_SECONDS = 60
+# 尚未学习到周期时长时，滑动窗口的最长跨度（秒）
+MAX_WINDOW_SECONDS = 24 * 3600
+# 滑动窗口保留的最大请求数
+MAX_WINDOW_ENTRIES = 10000
+# 预测用量达到学习上限的该比例时，视为接近配额上限
+NEAR_LIMIT_PRESSURE = 0.9
+
+
+class _PoolQuotaPrior:
+    """全账户池按配额类型的学习均值（未学习到的账户的先验）"""
+
+    def __init__(self) -> None:
+        # {quota_type: (limit, span_seconds, samples)}
+        self._priors: Dict[str, tuple] = {}
+
+    def observe(self, quota_type: str, limit: float, span: float) -> None:
+        prior = self._priors.get(quota_type)
+        if prior is None:
+            self._priors[quota_type] = (limit, span, 1)
+            return
+        prior_limit, prior_span, samples = prior
+        self._priors[quota_type] = (
+            prior_limit + LEARNING_ALPHA * (limit - prior_limit),
+            prior_span + LEARNING_ALPHA * (span - prior_span),
+            samples + 1,
+        )
+
+    def get(self, quota_type: str) -> Optional[tuple]:
+        return self._priors.get(quota_type)
+
+
+pool_quota_prior = _PoolQuotaPrior()
+
+
+class QuotaTypeModel:
+    """单个账户、单个配额类型的用量记录与学习值"""
+
+    __slots__ = ("window", "episode_count", "episode_started_at", "limit_at", "learned_limit", "learned_span", "samples")
+
+    def __init__(self) -> None:
+        self.window: Deque[float] = deque()
+        self.episode_count = 0
+        self.episode_started_at = 0.0
+        self.limit_at = 0.0  # 最近一次 429 的时间
+        self.learned_limit: Optional[float] = None
+        self.learned_span: Optional[float] = None
+        self.samples = 0
+
+    def record_request(self, now: float) -> None:
+        if self.episode_count == 0:
+            self.episode_started_at = now
+        self.episode_count += 1
+        self.window.append(now)
+        if len(self.window) > MAX_WINDOW_ENTRIES:
+            self.window.popleft()
+
+    def record_limit(self, quota_type: str, now: float) -> bool:
+        """记录一次 429，返回是否产生了新的学习样本"""
+        if now - self.limit_at < LIMIT_DEDUP_SECONDS:
+            return False
+        learned = False
+        if self.episode_count > 0:
+            span = max(now - self.episode_started_at, 1.0)
+            if self.learned_limit is None:
+                self.learned_limit = float(self.episode_count)
+                self.learned_span = span
+            else:
+                self.learned_limit += LEARNING_ALPHA * (self.episode_count - self.learned_limit)
+                self.learned_span += LEARNING_ALPHA * (span - self.learned_span)
+            self.samples += 1
+            pool_quota_prior.observe(quota_type, float(self.episode_count), span)
+            learned = True
+        # 配额已耗尽，之后的用量重新计数
+        self.limit_at = now
+        self.episode_count = 0
+        self.episode_started_at = 0.0
+        self.window.clear()
+        return learned
+
+    def _estimate(self, quota_type: str) -> Optional[tuple]:
+        """(预测上限, 周期时长, 是否来自账户池先验)"""
+        if self.learned_limit is not None:
+            return self.learned_limit, self.learned_span, False
+        prior = pool_quota_prior.get(quota_type)
+        if prior is None:
+            return None
+        return prior[0], prior[1], True
+
+    def used(self, span: float, now: float) -> int:
+        """滑动窗口内（且在上一次 429 之后）的请求数"""
+        window_start = now - span
+        window = self.window
+        while window and window[0] <= window_start:
+            window.popleft()
+        return len(window)
+
+    def pressure(self, quota_type: str, now: float) -> float:
+        """预测用量占上限的比例（0~1），无法预测时为 0"""
+        estimate = self._estimate(quota_type)
+        if estimate is None:
+            return 0.0
+        limit, span, _ = estimate
+        if limit <= 0:
+            return 1.0
+        return min(1.0, self.used(span, now) / limit)
+
+    def prediction(self, quota_type: str, now: float) -> Optional[dict]:
+        estimate = self._estimate(quota_type)
+        if estimate is None:
+            return None
+        limit, span, from_pool = estimate
+        used = self.used(span, now)
+        return {
+            "limit": round(limit),
+            "used": used,
+            "headroom": max(0, round(limit - used)),
+            "window_seconds": int(span),
+            "samples": self.samples,
+            "source": "pool" if from_pool else "account",
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "learned_limit": self.learned_limit,
+            "learned_span": self.learned_span,
+            "samples": self.samples,
+            "limit_at": self.limit_at,
+        }
+
+    def load(self, data: dict) -> None:
+        self.learned_limit = data.get("learned_limit")
+        self.learned_span = data.get("learned_span")
+        self.samples = int(data.get("samples") or 0)
+        self.limit_at = float(data.get("limit_at") or 0.0)
+
+
+class AccountQuotaModel:
+    """单个账户的配额预测（仅在事件循环内使用，无需加锁）"""
+
+    def __init__(self, quota_types) -> None:
+        self.models: Dict[str, QuotaTypeModel] = {quota_type: QuotaTypeModel() for quota_type in quota_types}
+
+    def record_request(self, quota_type: str, now: float) -> None:
+        model = self.models.get(quota_type)
+        if model is not None:
+            model.record_request(now)
+
+    def record_limit(self, quota_type: str, now: float) -> bool:
+        model = self.models.get(quota_type)
+        return model is not None and model.record_limit(quota_type, now)
+
+    def pressure(self, quota_type: str, now: float) -> float:
+        model = self.models.get(quota_type)
+        return model.pressure(quota_type, now) if model is not None else 0.0
+
+    def prediction(self, quota_type: str, now: float) -> Optional[dict]:
+        model = self.models.get(quota_type)
+        return model.prediction(quota_type, now) if model is not None else None
+
+    def to_dict(self) -> dict:
+        return {quota_type: model.to_dict() for quota_type, model in self.models.items() if model.samples}
+
+    def load(self, data: Optional[dict]) -> None:
+        """从持久化的学习值恢复，并计入账户池先验"""
+        if not isinstance(data, dict):
+            return
+        for quota_type, values in data.items():
+            model = self.models.get(quota_type)
+            if model is None or not isinstance(values, dict):
+                continue
+            model.load(values)
+            if model.learned_limit is not None and model.learned_span is not None:
+                pool_quota_prior.observe(quota_type, model.learned_limit, model.learned_span)
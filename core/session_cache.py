@@ -0,0 +1,258 @@
+"""对话会话缓存
+
+记录对话指纹（conv_key）到 (账户, Google Session) 的绑定，以及每个对话的串行化锁：
+- 按 conv_key 哈希分片，每个分片有独立的 asyncio.Lock，不同对话之间不争用同一把锁
+- 分片内用 OrderedDict 维护 LRU 顺序，插入/访问/淘汰均为 O(1)
+- 过期使用时间轮：条目按过期时间挂到对应的槽位，清理时只检查已到期的槽位
+- 对话锁归属于缓存条目，随绑定一起淘汰；持有中的锁所在条目不会被淘汰
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from core.config import config
+
+logger = logging.getLogger(__name__)
+
+# 分片数量
+SESSION_CACHE_SHARDS = 16
+# 时间轮槽位粒度（秒），也是后台清理的间隔
+WHEEL_TICK_SECONDS = 30
+
+
+class SessionEntry:
+    """单个对话的缓存条目（account_id 为 None 表示只有锁、尚未绑定账户）"""
+
+    __slots__ = ("conv_key", "account_id", "session_id", "updated_at", "expire_tick", "lock")
+
+    def __init__(self, conv_key: str) -> None:
+        self.conv_key = conv_key
+        self.account_id: Optional[str] = None
+        self.session_id: Optional[str] = None
+        self.updated_at = 0.0
+        self.expire_tick = 0
+        self.lock = asyncio.Lock()
+
+    @property
+    def is_bound(self) -> bool:
+        return self.account_id is not None
+
+
+class _Shard:
+    """一个分片：LRU 有序字典 + 时间轮（仅在持有分片锁或同步代码中修改）"""
+
+    __slots__ = ("lock", "entries", "wheel", "swept_tick")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.entries: "OrderedDict[str, SessionEntry]" = OrderedDict()
+        # {过期槽位: {conv_key}}
+        self.wheel: Dict[int, Set[str]] = {}
+        self.swept_tick = int(time.time() // WHEEL_TICK_SECONDS)
+
+
+class SessionCache:
+    """分片的 LRU + TTL 会话缓存"""
+
+    def __init__(self, ttl_seconds: int, shard_count: int = SESSION_CACHE_SHARDS) -> None:
+        self.ttl = ttl_seconds
+        self._shards: List[_Shard] = [_Shard() for _ in range(shard_count)]
+        self.hits = 0
+        self.misses = 0
+        self.evicted_lru = 0
+        self.evicted_expired = 0
+
+    def _shard(self, conv_key: str) -> _Shard:
+        return self._shards[hash(conv_key) % len(self._shards)]
+
+    def _shard_capacity(self) -> int:
+        max_entries = config.performance.session_cache_max_entries
+        return max(1, math.ceil(max_entries / len(self._shards)))
+
+    def _is_expired(self, entry: SessionEntry, now: float) -> bool:
+        # TTL 为 0 时不在读取时判断过期，由时间轮在下一个槽位清理（与原先的定时清理一致）
+        return self.ttl > 0 and entry.is_bound and now - entry.updated_at > self.ttl
+
+    def _schedule(self, shard: _Shard, entry: SessionEntry, now: float) -> None:
+        """把条目挂到新的过期槽位（槽位不变时不移动）"""
+        tick = int((now + max(self.ttl, 0)) // WHEEL_TICK_SECONDS) + 1
+        if tick == entry.expire_tick:
+            return
+        if entry.expire_tick:
+            slot = shard.wheel.get(entry.expire_tick)
+            if slot is not None:
+                slot.discard(entry.conv_key)
+                if not slot:
+                    del shard.wheel[entry.expire_tick]
+        shard.wheel.setdefault(tick, set()).add(entry.conv_key)
+        entry.expire_tick = tick
+
+    def _remove(self, shard: _Shard, entry: SessionEntry) -> None:
+        shard.entries.pop(entry.conv_key, None)
+        slot = shard.wheel.get(entry.expire_tick)
+        if slot is not None:
+            slot.discard(entry.conv_key)
+            if not slot:
+                del shard.wheel[entry.expire_tick]
+
+    def _evict_lru(self, shard: _Shard) -> None:
+        """超出分片容量时从最久未使用的一端淘汰（跳过锁被持有的条目）"""
+        capacity = self._shard_capacity()
+        entries = shard.entries
+        skipped = 0
+        while len(entries) > capacity and skipped < len(entries):
+            entry = next(iter(entries.values()))
+            if entry.lock.locked():
+                entries.move_to_end(entry.conv_key)
+                skipped += 1
+                continue
+            self._remove(shard, entry)
+            self.evicted_lru += 1
+
+    def _entry(self, shard: _Shard, conv_key: str, now: float) -> SessionEntry:
+        entry = shard.entries.get(conv_key)
+        if entry is None:
+            entry = shard.entries[conv_key] = SessionEntry(conv_key)
+            entry.updated_at = now
+            self._schedule(shard, entry, now)
+            self._evict_lru(shard)
+        else:
+            shard.entries.move_to_end(conv_key)
+        return entry
+
+    async def acquire_lock(self, conv_key: str) -> asyncio.Lock:
+        """获取对话锁（条目不存在时创建未绑定的条目）"""
+        shard = self._shard(conv_key)
+        async with shard.lock:
+            return self._entry(shard, conv_key, time.time()).lock
+
+    def _lookup(self, conv_key: str, now: float) -> Optional[SessionEntry]:
+        shard = self._shard(conv_key)
+        entry = shard.entries.get(conv_key)
+        if entry is None or not entry.is_bound:
+            return None
+        if self._is_expired(entry, now):
+            entry.account_id = entry.session_id = None
+            self.evicted_expired += 1
+            return None
+        shard.entries.move_to_end(conv_key)
+        return entry
+
+    def get(self, conv_key: str) -> Optional[SessionEntry]:
+        """返回已绑定的条目；过期的绑定视为未命中"""
+        entry = self._lookup(conv_key, time.time())
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def find_longest(self, keys: List[str]) -> Tuple[int, Optional[SessionEntry]]:
+        """从后往前查找第一个已绑定的键，返回 (下标, 条目)；均未绑定返回 (-1, None)"""
+        now = time.time()
+        for index in range(len(keys) - 1, -1, -1):
+            entry = self._lookup(keys[index], now)
+            if entry is not None:
+                self.hits += 1
+                return index, entry
+        self.misses += 1
+        return -1, None
+
+    async def bind(
+        self, conv_key: str, account_id: str, session_id: str, updated_at: Optional[float] = None
+    ) -> SessionEntry:
+        """绑定对话（updated_at 用于从持久化记录恢复时保留原时间）"""
+        shard = self._shard(conv_key)
+        async with shard.lock:
+            now = time.time()
+            entry = self._entry(shard, conv_key, now)
+            entry.account_id = account_id
+            entry.session_id = session_id
+            entry.updated_at = now if updated_at is None else updated_at
+            self._schedule(shard, entry, entry.updated_at)
+            return entry
+
+    def unbind(self, conv_key: str) -> None:
+        """解除绑定但保留条目（调用方可能正持有该对话的锁）"""
+        entry = self._shard(conv_key).entries.get(conv_key)
+        if entry is not None:
+            entry.account_id = entry.session_id = None
+
+    def discard(self, conv_key: str) -> None:
+        """删除条目；锁被持有时只解除绑定，条目随锁保留"""
+        shard = self._shard(conv_key)
+        entry = shard.entries.get(conv_key)
+        if entry is None:
+            return
+        if entry.lock.locked():
+            entry.account_id = entry.session_id = None
+        else:
+            self._remove(shard, entry)
+
+    def unbind_accounts(self, account_ids: Set[str]) -> int:
+        """解除指定账户的全部绑定（锁保留，进行中的请求不受影响），返回解除数量"""
+        cleared = 0
+        if not account_ids:
+            return cleared
+        for shard in self._shards:
+            for entry in shard.entries.values():
+                if entry.account_id in account_ids:
+                    entry.account_id = entry.session_id = None
+                    cleared += 1
+        return cleared
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """清理已到期槽位中的条目，返回清理数量"""
+        now = time.time() if now is None else now
+        current_tick = int(now // WHEEL_TICK_SECONDS)
+        removed = 0
+        for shard in self._shards:
+            if current_tick <= shard.swept_tick:
+                continue
+            # 间隔过长（如进程挂起）时直接遍历现有槽位，避免逐个空槽位检查
+            if current_tick - shard.swept_tick > len(shard.wheel):
+                due_ticks = sorted(tick for tick in shard.wheel if tick <= current_tick)
+            else:
+                due_ticks = range(shard.swept_tick + 1, current_tick + 1)
+            shard.swept_tick = current_tick
+            for tick in due_ticks:
+                slot = shard.wheel.pop(tick, None)
+                if not slot:
+                    continue
+                for conv_key in slot:
+                    entry = shard.entries.get(conv_key)
+                    if entry is None:
+                        continue
+                    entry.expire_tick = 0
+                    # 锁正被持有：顺延到下一个周期
+                    if entry.lock.locked():
+                        self._schedule(shard, entry, now)
+                        continue
+                    # TTL 调大后尚未过期：按新的 TTL 重新挂到后续槽位
+                    if self.ttl > 0 and now - entry.updated_at <= self.ttl:
+                        self._schedule(shard, entry, entry.updated_at)
+                        continue
+                    shard.entries.pop(conv_key, None)
+                    removed += 1
+        self.evicted_expired += removed
+        return removed
+
+    def __len__(self) -> int:
+        return sum(len(shard.entries) for shard in self._shards)
+
+    def get_stats(self) -> dict:
+        lookups = self.hits + self.misses
+        bound = sum(1 for shard in self._shards for entry in shard.entries.values() if entry.is_bound)
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+            "entries": len(self),
+            "bound": bound,
+            "max_entries": config.performance.session_cache_max_entries,
+            "evicted_lru": self.evicted_lru,
+            "evicted_expired": self.evicted_expired,
+        }
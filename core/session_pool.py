@@ -0,0 +1,216 @@
+"""Google Session 预热池
+
+为每个活跃账户在后台预先创建少量未使用的 Session（widgetCreateSession），
+新对话或切换账户时直接从池中取用，省去首个 token 前的一次往返。
+
+- 池大小按账户最近的请求速率自适应（空闲账户不预热）
+- 预热 Session 闲置超过 TTL 后丢弃，避免使用已被 Google 失效的 Session
+- 池中没有可用 Session 时回退为同步创建
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Callable, Deque, Dict, Set, Tuple
+
+from core.config import config
+from core.google_api import create_google_session
+
+if TYPE_CHECKING:
+    from core.account import AccountManager
+
+logger = logging.getLogger(__name__)
+
+# 请求速率统计窗口（秒）
+RATE_WINDOW_SECONDS = 300
+# 预热提前量：按当前速率，池中应能覆盖这段时间内的新会话需求（秒）
+REFILL_HORIZON_SECONDS = 60
+# 后台维护间隔（秒）
+MAINTENANCE_INTERVAL_SECONDS = 15
+# 预热失败后的退避时间（秒）
+REFILL_FAILURE_BACKOFF_SECONDS = 60
+
+
+class GoogleSessionPool:
+    """按账户维护的预热 Session 池（仅在事件循环内使用，无需加锁）"""
+
+    def __init__(self, user_agent: str) -> None:
+        self.user_agent = user_agent
+        # {account_id: deque[(session_name, created_at)]}
+        self._pools: Dict[str, Deque[Tuple[str, float]]] = {}
+        # {account_id: deque[acquire_time]}，用于估算请求速率
+        self._demand: Dict[str, Deque[float]] = {}
+        self._refilling: Set[str] = set()
+        self._backoff_until: Dict[str, float] = {}
+        # 账户被丢弃的次数，进行中的补充任务据此放弃用旧凭据创建的 Session
+        self._epochs: Dict[str, int] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+        self.expired = 0
+        self.refill_failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        return config.performance.session_pool_max_size > 0
+
+    def _record_demand(self, account_id: str, now: float) -> None:
+        demand = self._demand.setdefault(account_id, deque())
+        demand.append(now)
+        cutoff = now - RATE_WINDOW_SECONDS
+        while demand and demand[0] < cutoff:
+            demand.popleft()
+
+    def target_size(self, account_id: str) -> int:
+        """根据最近的请求速率计算账户的目标池大小"""
+        max_size = config.performance.session_pool_max_size
+        demand = self._demand.get(account_id)
+        if max_size <= 0 or not demand:
+            return 0
+        cutoff = time.time() - RATE_WINDOW_SECONDS
+        while demand and demand[0] < cutoff:
+            demand.popleft()
+        if not demand:
+            return 0
+        rate = len(demand) / RATE_WINDOW_SECONDS
+        return max(1, min(max_size, math.ceil(rate * REFILL_HORIZON_SECONDS)))
+
+    def _pop_fresh(self, account_id: str, now: float):
+        pool = self._pools.get(account_id)
+        if not pool:
+            return None
+        ttl = config.performance.session_pool_ttl_seconds
+        while pool:
+            session_name, created_at = pool.popleft()
+            if now - created_at < ttl:
+                return session_name
+            self.expired += 1
+        return None
+
+    async def acquire(self, account_manager: "AccountManager", http_client, request_id: str = "") -> str:
+        """取出一个预热 Session；池为空时同步创建，并在后台补充"""
+        if not self.enabled:
+            return await create_google_session(account_manager, http_client, self.user_agent, request_id)
+
+        account_id = account_manager.config.account_id
+        now = time.time()
+        self._record_demand(account_id, now)
+
+        session_name = self._pop_fresh(account_id, now)
+        if session_name:
+            self.hits += 1
+            req_tag = f"[req_{request_id}] " if request_id else ""
+            logger.info(f"[SESSION] [{account_id}] {req_tag}使用预热 Session: {session_name[-12:]}")
+        else:
+            self.misses += 1
+            session_name = await create_google_session(account_manager, http_client, self.user_agent, request_id)
+
+        self.schedule_refill(account_manager)
+        return session_name
+
+    def schedule_refill(self, account_manager: "AccountManager") -> None:
+        """若池未达到目标大小，启动后台补充任务（每个账户最多一个）"""
+        account_id = account_manager.config.account_id
+        if account_id in self._refilling:
+            return
+        if time.time() < self._backoff_until.get(account_id, 0):
+            return
+        if len(self._pools.get(account_id, ())) >= self.target_size(account_id):
+            return
+        self._refilling.add(account_id)
+        task = asyncio.create_task(self._refill(account_manager))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refill(self, account_manager: "AccountManager") -> None:
+        account_id = account_manager.config.account_id
+        epoch = self._epochs.get(account_id, 0)
+        try:
+            while len(self._pools.get(account_id, ())) < self.target_size(account_id):
+                if not _is_account_usable(account_manager):
+                    break
+                session_name = await create_google_session(
+                    account_manager, account_manager.http_client, self.user_agent
+                )
+                if self._epochs.get(account_id, 0) != epoch:
+                    break
+                self._pools.setdefault(account_id, deque()).append((session_name, time.time()))
+                self.created += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 预热失败不计入账户错误，由真实请求的错误处理负责冷却
+            self.refill_failures += 1
+            self._backoff_until[account_id] = time.time() + REFILL_FAILURE_BACKOFF_SECONDS
+            logger.warning(f"[SESSION] [{account_id}] 预热 Session 失败: {type(e).__name__}: {str(e)[:100]}")
+        finally:
+            self._refilling.discard(account_id)
+
+    def discard_account(self, account_id: str) -> None:
+        """丢弃账户的所有预热 Session（账户删除或凭据变更时由 reload_accounts 回调，维护任务也会清理已删除账户）"""
+        self._epochs[account_id] = self._epochs.get(account_id, 0) + 1
+        self._pools.pop(account_id, None)
+        self._demand.pop(account_id, None)
+        self._backoff_until.pop(account_id, None)
+
+    def _evict_expired(self) -> None:
+        now = time.time()
+        ttl = config.performance.session_pool_ttl_seconds
+        for pool in self._pools.values():
+            while pool and now - pool[0][1] >= ttl:
+                pool.popleft()
+                self.expired += 1
+
+    async def start_background_maintenance(self, get_accounts: Callable[[], Dict[str, "AccountManager"]]) -> None:
+        """后台维护任务：清理过期 Session、移除已删除账户、为活跃账户补充预热"""
+        while True:
+            try:
+                await asyncio.sleep(MAINTENANCE_INTERVAL_SECONDS)
+            except asyncio.CancelledError:
+                logger.info("[SESSION] 预热池维护任务已停止")
+                return
+            # 单次维护失败只记录日志，下一轮继续
+            try:
+                self._maintain(get_accounts())
+            except Exception as e:
+                logger.error(f"[SESSION] 预热池维护异常: {type(e).__name__}: {e}")
+
+    def _maintain(self, accounts: Dict[str, "AccountManager"]) -> None:
+        for account_id in list(self._pools.keys() | self._demand.keys()):
+            if account_id not in accounts:
+                self.discard_account(account_id)
+        self._evict_expired()
+        if not self.enabled:
+            self._pools.clear()
+            return
+        for account_id in list(self._demand.keys()):
+            account_manager = accounts.get(account_id)
+            if account_manager is None:
+                continue
+            if _is_account_usable(account_manager):
+                self.schedule_refill(account_manager)
+            else:
+                self._pools.pop(account_id, None)
+
+    def get_stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+            "pooled": sum(len(pool) for pool in self._pools.values()),
+            "created": self.created,
+            "expired": self.expired,
+            "refill_failures": self.refill_failures,
+        }
+
+
+def _is_account_usable(account_manager: "AccountManager") -> bool:
+    return (
+        account_manager.should_retry()
+        and not account_manager.config.is_expired()
+        and not account_manager.config.disabled
+    )
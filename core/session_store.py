@@ -0,0 +1,169 @@
+"""对话绑定持久化
+
+把会话缓存中的 conv_key -> (账户, Session) 绑定写后（write-behind）持久化到数据库：
+- 绑定/更新/解除只记入待写队列（同一对话多次变化只保留最后一次），由后台任务定期批量写入
+- 内存缓存未命中时按 conv_key 从数据库懒加载，重启或部署后进行中的对话可继续复用原 Session
+- 超过会话缓存时间的记录按 updated_at 索引定期清理
+
+多 worker 共享状态模式下（shared=True），数据库是绑定的唯一来源：查找直接读库，变更立即写入。
+未配置数据库时不做任何持久化。
+"""
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from core import storage
+from core.config import config
+
+logger = logging.getLogger(__name__)
+
+# 过期记录的清理间隔（秒）
+PURGE_INTERVAL_SECONDS = 600
+# 共享模式下按前缀查找时最多查询的键数（只看最近的若干个前缀）
+SHARED_LOOKUP_MAX_KEYS = 256
+
+
+class SessionBindingStore:
+    """对话绑定的写后持久化（待写队列仅在事件循环内修改，无需加锁）"""
+
+    def __init__(self) -> None:
+        # {conv_key: (account_id, session_id, updated_at)}，None 表示待删除
+        self._pending: Dict[str, Optional[tuple]] = {}
+        # 已移除账户：下次写入时删除其全部绑定
+        self._removed_accounts: Set[str] = set()
+        self._flush_lock = asyncio.Lock()
+        self._last_purge_at = 0.0
+        # 多 worker 共享模式：由共享状态后端启动时设置
+        self.shared = False
+        self.restored = 0
+        self.restore_misses = 0
+        self.written = 0
+        self.flush_failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        return storage.is_database_enabled()
+
+    def record(self, conv_key: str, account_id: str, session_id: str, updated_at: float) -> None:
+        if self.enabled:
+            self._pending[conv_key] = (account_id, session_id, updated_at)
+
+    def record_delete(self, conv_key: str) -> None:
+        if self.enabled:
+            self._pending[conv_key] = None
+
+    def forget_accounts(self, account_ids: Iterable[str]) -> None:
+        """账户被移除：丢弃其待写绑定，并在下次写入时删除已持久化的绑定"""
+        account_ids = set(account_ids)
+        if not account_ids or not self.enabled:
+            return
+        self._removed_accounts |= account_ids
+        for conv_key, value in list(self._pending.items()):
+            if value is not None and value[0] in account_ids:
+                self._pending[conv_key] = None
+
+    async def load(self, conv_key: str, ttl_seconds: int) -> Optional[dict]:
+        """懒加载单个绑定（优先使用尚未写入的待写值），过期或不存在返回 None"""
+        if not self.enabled or ttl_seconds <= 0:
+            return None
+        if conv_key in self._pending:
+            value = self._pending[conv_key]
+            if value is None:
+                return None
+            account_id, session_id, updated_at = value
+            return {"account_id": account_id, "session_id": session_id, "updated_at": updated_at}
+        binding = await asyncio.to_thread(
+            storage.load_session_binding_sync, conv_key, time.time() - ttl_seconds
+        )
+        if binding is None or binding["account_id"] in self._removed_accounts:
+            self.restore_misses += 1
+            return None
+        self.restored += 1
+        return binding
+
+    async def load_longest(self, conv_keys: List[str], ttl_seconds: int) -> Tuple[int, Optional[dict]]:
+        """
+        共享模式：一次查询取回各前缀的绑定，返回最长的 (下标, 绑定)；未找到为 (-1, None)
+
+        本进程尚未写入的变更优先于数据库中的记录。
+        """
+        if not self.enabled or ttl_seconds <= 0 or not conv_keys:
+            return -1, None
+        first = max(0, len(conv_keys) - SHARED_LOOKUP_MAX_KEYS)
+        bindings = await asyncio.to_thread(
+            storage.load_session_bindings_sync, conv_keys[first:], time.time() - ttl_seconds
+        ) or {}
+        for index in range(len(conv_keys) - 1, first - 1, -1):
+            conv_key = conv_keys[index]
+            if conv_key in self._pending:
+                value = self._pending[conv_key]
+                if value is None:
+                    continue
+                account_id, session_id, updated_at = value
+                return index, {"account_id": account_id, "session_id": session_id, "updated_at": updated_at}
+            binding = bindings.get(conv_key)
+            if binding is not None:
+                self.restored += 1
+                return index, binding
+        self.restore_misses += 1
+        return -1, None
+
+    async def flush(self, ttl_seconds: int) -> int:
+        """写入待写队列（并按间隔清理过期记录），返回写入的变更数"""
+        if not self.enabled:
+            return 0
+        async with self._flush_lock:
+            now = time.time()
+            purge_due = now - self._last_purge_at >= PURGE_INTERVAL_SECONDS
+            if not self._pending and not self._removed_accounts and not purge_due:
+                return 0
+            pending, self._pending = self._pending, {}
+            removed_accounts, self._removed_accounts = self._removed_accounts, set()
+            upserts = [(conv_key,) + value for conv_key, value in pending.items() if value is not None]
+            deletes = [conv_key for conv_key, value in pending.items() if value is None]
+            try:
+                saved = await asyncio.to_thread(storage.save_session_bindings_sync, upserts, deletes)
+                if saved and (purge_due or removed_accounts):
+                    purged = await asyncio.to_thread(
+                        storage.purge_session_bindings_sync,
+                        now - max(ttl_seconds, 0),
+                        sorted(removed_accounts),
+                    )
+                    self._last_purge_at = now
+                    if purged:
+                        logger.info(f"[CACHE] 清理 {purged} 条过期/失效的对话绑定记录")
+            except Exception as e:
+                logger.error(f"[CACHE] 对话绑定写入异常: {e}")
+                saved = False
+            if not saved:
+                # 写入失败：放回队列（期间产生的新变更优先）
+                for conv_key, value in pending.items():
+                    self._pending.setdefault(conv_key, value)
+                self._removed_accounts |= removed_accounts
+                self.flush_failures += 1
+                return 0
+            self.written += len(pending)
+            return len(pending)
+
+    async def run_flusher(self, get_ttl: Callable[[], int]) -> None:
+        """后台定期写入（间隔读取 performance.session_binding_flush_seconds）"""
+        try:
+            while True:
+                await asyncio.sleep(config.performance.session_binding_flush_seconds)
+                await self.flush(get_ttl())
+        except asyncio.CancelledError:
+            logger.info("[CACHE] 对话绑定持久化任务已停止")
+        except Exception as e:
+            logger.error(f"[CACHE] 对话绑定持久化任务异常: {e}")
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "shared": self.shared,
+            "pending": len(self._pending),
+            "restored": self.restored,
+            "restore_misses": self.restore_misses,
+            "written": self.written,
+            "flush_failures": self.flush_failures,
+        }
@@ -0,0 +1,255 @@
+"""运行时状态后端
+
+单进程时账户熔断/错误计数、对话绑定和统计计数都只保存在本进程内存中（进程内后端，默认）。
+以 --workers N 运行多个进程时使用共享后端，让多个 worker 表现为同一个网关：
+- 账户运行时状态（熔断、错误计数、可用性）：本地变化后写入 state_accounts，
+  定期拉取其他 worker 写入的状态并应用（最终一致，延迟约为同步间隔）
+- 统计计数：本地增量定期原子累加到 state_counters，再以共享总数覆盖本地值
+- 对话绑定：查找直接读库、变更立即写入（见 SessionBindingStore.shared）
+- 单例后台任务（如账户刷新轮询）通过租约只在一个 worker 上运行；续约失败（租约过期被其他 worker 接管）时
+  立即取消本地任务并重新等待租约，避免两个 worker 同时运行
+不共享的状态：单账户并发上限、令牌桶与预留在每个 worker 内独立计算，实际上限为 worker 数 × 配置值；
+对话锁、日志与管理面板修改的设置同样只在当前 worker 生效。
+
+共享后端复用 core/storage 的数据库：SQLite（WAL 模式，单机多进程）或 PostgreSQL（跨主机）。
+通过环境变量 STATE_BACKEND=memory|shared 选择；WORKERS>1 启动时默认 shared。
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from core import storage
+from core.config import config
+
+logger = logging.getLogger(__name__)
+
+# 多 worker 之间共享的统计计数
+SHARED_COUNTERS = ("total_requests", "success_count", "failed_count", "total_visitors")
+# 按账户的共享统计计数：(global_stats 键, AccountManager 属性)
+SHARED_ACCOUNT_COUNTERS = (
+    ("account_conversations", "conversation_count"),
+    ("account_failures", "failure_count"),
+)
+# 单例任务租约时长（秒），持有者每个同步周期续约
+LEASE_SECONDS = 30
+# 拉取账户状态时回看的时间（秒），容忍 worker 之间的时钟差与写入延迟
+PULL_OVERLAP_SECONDS = 5
+
+
+class InProcessStateBackend:
+    """进程内状态后端（单 worker）：状态只保存在本进程，所有同步操作均为空操作"""
+
+    name = "memory"
+    shared = False
+
+    def __init__(self) -> None:
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    async def start(self, get_manager: Callable, get_stats: Callable[[], dict]) -> None:
+        return None
+
+    async def run_as_leader(self, lease_name: str, task: Callable[[], Awaitable]) -> None:
+        """单进程时直接运行单例任务"""
+        await task()
+
+    def get_status(self) -> dict:
+        return {"backend": self.name, "worker_id": self.worker_id}
+
+
+class SharedStateBackend(InProcessStateBackend):
+    """数据库共享状态后端（SQLite WAL / PostgreSQL）"""
+
+    name = "shared"
+    shared = True
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._get_manager: Optional[Callable] = None
+        self._get_stats: Optional[Callable[[], dict]] = None
+        # 上次写入/应用的账户状态：{account_id: state}
+        self._account_snapshots: Dict[str, dict] = {}
+        # 已应用的其他 worker 状态时间戳：{account_id: updated_at}
+        self._applied_at: Dict[str, float] = {}
+        self._pulled_until = 0.0
+        # 上次与共享总数对齐后的本地计数（本地值减去它即为待累加的增量）
+        self._counter_baseline: Dict[str, int] = {}
+        # 持有租约时正在运行的单例任务：{租约名: Task}
+        self._leader_tasks: Dict[str, asyncio.Task] = {}
+        self.syncs = 0
+        self.sync_failures = 0
+        self.remote_updates = 0
+        self.last_sync_ms = 0.0
+
+    async def start(self, get_manager: Callable, get_stats: Callable[[], dict]) -> None:
+        self._get_manager = get_manager
+        self._get_stats = get_stats
+        get_manager().binding_store.shared = True
+        # 首个 worker 以本地加载的统计值作为共享计数初值，之后只累加增量
+        local = self._collect_counters()
+        totals = await asyncio.to_thread(storage.sync_counters_sync, {}, local)
+        if totals is not None:
+            self._apply_counters(totals, local)
+        await self.sync()
+        asyncio.create_task(self._run())
+        logger.info(f"[STATE] 共享状态后端已启动（worker: {self.worker_id}）")
+
+    async def _run(self) -> None:
+        try:
+            while True:
+                await asyncio.sleep(config.performance.state_sync_interval_ms / 1000)
+                await self.sync()
+        except asyncio.CancelledError:
+            logger.info("[STATE] 共享状态同步任务已停止")
+
+    async def sync(self) -> None:
+        """推送本地变化并拉取其他 worker 的变化"""
+        start = time.perf_counter()
+        # 先续约：账户/计数同步变慢或失败时不影响续约
+        await self._renew_leases()
+        try:
+            await self._sync_accounts()
+            await self._sync_counters()
+            self.syncs += 1
+        except Exception as e:
+            self.sync_failures += 1
+            logger.error(f"[STATE] 共享状态同步失败: {type(e).__name__}: {str(e)[:100]}")
+        self.last_sync_ms = (time.perf_counter() - start) * 1000
+
+    # ---------- 账户运行时状态 ----------
+
+    async def _sync_accounts(self) -> None:
+        manager = self._get_manager()
+        now = time.time()
+        changed = []
+        for account_id, account in manager.accounts.items():
+            state = account.export_runtime_state()
+            if self._account_snapshots.get(account_id) != state:
+                changed.append((account_id, state))
+        if changed:
+            rows = [(account_id, state, self.worker_id, now) for account_id, state in changed]
+            if await asyncio.to_thread(storage.save_account_states_sync, rows):
+                for account_id, state in changed:
+                    self._account_snapshots[account_id] = state
+                    self._applied_at[account_id] = now
+
+        remote = await asyncio.to_thread(
+            storage.load_account_states_sync, self._pulled_until - PULL_OVERLAP_SECONDS, self.worker_id
+        )
+        for row in remote or ():
+            self._pulled_until = max(self._pulled_until, row["updated_at"])
+            account_id = row["account_id"]
+            if row["updated_at"] <= self._applied_at.get(account_id, 0.0):
+                continue
+            account = manager.accounts.get(account_id)
+            if account is None:
+                continue
+            account.apply_runtime_state(row["data"])
+            self._applied_at[account_id] = row["updated_at"]
+            self._account_snapshots[account_id] = account.export_runtime_state()
+            self.remote_updates += 1
+
+    # ---------- 统计计数 ----------
+
+    def _collect_counters(self) -> Dict[str, int]:
+        stats = self._get_stats()
+        counters = {name: int(stats.get(name, 0) or 0) for name in SHARED_COUNTERS}
+        for stats_key, _ in SHARED_ACCOUNT_COUNTERS:
+            for account_id, value in (stats.get(stats_key) or {}).items():
+                counters[f"{stats_key}:{account_id}"] = int(value or 0)
+        return counters
+
+    def _apply_counters(self, totals: Dict[str, int], pushed: Dict[str, int]) -> None:
+        """
+        以共享总数覆盖本地计数
+
+        pushed 是推送时的本地值；推送期间本地新增的计数保留在本地，下个周期再推送。
+        """
+        stats = self._get_stats()
+        manager = self._get_manager()
+        current = self._collect_counters()
+        for name, total in totals.items():
+            local = total + current.get(name, 0) - pushed.get(name, 0)
+            if ":" in name:
+                stats_key, account_id = name.split(":", 1)
+                attr = dict(SHARED_ACCOUNT_COUNTERS).get(stats_key)
+                if attr is None:
+                    continue
+                stats.setdefault(stats_key, {})[account_id] = local
+                account = manager.accounts.get(account_id)
+                if account is not None:
+                    setattr(account, attr, local)
+            elif name in SHARED_COUNTERS:
+                stats[name] = local
+        self._counter_baseline = dict(totals)
+        for name, value in pushed.items():
+            self._counter_baseline.setdefault(name, value)
+
+    async def _sync_counters(self) -> None:
+        local = self._collect_counters()
+        deltas = {name: value - self._counter_baseline.get(name, 0) for name, value in local.items()}
+        totals = await asyncio.to_thread(storage.sync_counters_sync, deltas)
+        if totals is not None:
+            self._apply_counters(totals, local)
+
+    # ---------- 单例任务 ----------
+
+    async def _renew_leases(self) -> None:
+        """续约所有运行中的单例任务；续约失败视为租约丢失，取消本地任务"""
+        for lease_name, runner in list(self._leader_tasks.items()):
+            held = await asyncio.to_thread(storage.acquire_lease_sync, lease_name, self.worker_id, LEASE_SECONDS)
+            if not held and self._leader_tasks.get(lease_name) is runner:
+                del self._leader_tasks[lease_name]
+                runner.cancel()
+                logger.warning(f"[STATE] 单例任务租约续约失败，已停止本地任务: {lease_name}")
+
+    async def run_as_leader(self, lease_name: str, task: Callable[[], Awaitable]) -> None:
+        """
+        持有租约期间运行单例任务（持有者退出后租约过期，由其他 worker 接管）
+
+        租约丢失时任务被取消，之后重新等待租约；任务自行结束时返回。
+        """
+        while True:
+            while not await asyncio.to_thread(storage.acquire_lease_sync, lease_name, self.worker_id, LEASE_SECONDS):
+                await asyncio.sleep(LEASE_SECONDS / 2)
+            logger.info(f"[STATE] 已取得单例任务租约: {lease_name}")
+            runner = asyncio.create_task(task())
+            self._leader_tasks[lease_name] = runner
+            try:
+                await runner
+            except asyncio.CancelledError:
+                # 本协程被取消（进程关闭）时 runner 一并取消；租约丢失导致的取消则继续等待租约
+                if self._leader_tasks.get(lease_name) is runner:
+                    del self._leader_tasks[lease_name]
+                    raise
+                continue
+            if self._leader_tasks.get(lease_name) is runner:
+                # 任务自行结束
+                del self._leader_tasks[lease_name]
+                return
+            # 任务捕获了取消并正常返回（租约已丢失）：继续等待租约
+
+    def get_status(self) -> dict:
+        return {
+            "backend": self.name,
+            "worker_id": self.worker_id,
+            "syncs": self.syncs,
+            "sync_failures": self.sync_failures,
+            "remote_updates": self.remote_updates,
+            "last_sync_ms": round(self.last_sync_ms, 1),
+            "leases": list(self._leader_tasks),
+        }
+
+
+def create_state_backend() -> InProcessStateBackend:
+    """按 STATE_BACKEND 环境变量创建状态后端（shared 需要已配置数据库）"""
+    backend = os.environ.get("STATE_BACKEND", "memory").strip().lower()
+    if backend == "shared":
+        if storage.is_database_enabled():
+            return SharedStateBackend()
+        logger.warning("[STATE] STATE_BACKEND=shared 需要配置数据库，已回退为进程内状态")
+    elif backend not in ("", "memory"):
+        logger.warning(f"[STATE] 未知的 STATE_BACKEND: {backend}，使用进程内状态")
+    return InProcessStateBackend()
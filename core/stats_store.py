@@ -0,0 +1,211 @@
+"""统计数据写后持久化
+
+请求只在内存中更新 global_stats 并标记为脏（同步代码，O(1)，无需加锁），
+后台任务按 performance.stats_flush_seconds 定期写入数据库，关闭时再写一次：
+- 每小时汇总（请求数、失败数、429 数、TTFT 总和与次数，按模型和账户）以增量 UPSERT 累加到 stats_hourly，
+  管理面板的趋势图按小时范围查询该表；超过 performance.stats_retention_days 的行定期清理
+- 其余统计（总数、访客、最近对话等）写入 kv_stats；只在内存中使用的计数序列不写入
+- 进程异常退出时最多丢失一个写入间隔内的统计
+- 写入失败时保留待写数据，下个周期重试
+未配置数据库时不做任何持久化。
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from core import storage
+from core.config import config
+from core.time_series import TimeSeries
+
+logger = logging.getLogger(__name__)
+
+# 过期汇总行的清理间隔（秒）
+ROLLUP_PURGE_INTERVAL_SECONDS = 3600
+
+# 汇总行：[请求数, 失败数, 429 数, TTFT 总和（毫秒）, TTFT 次数]
+_REQUESTS, _FAILURES, _RATE_LIMITED, _TTFT_SUM, _TTFT_COUNT = range(5)
+
+
+def _plain_copy(value: Any) -> Any:
+    """复制容器（deque 转为 list，计数序列转为 dict），写入线程序列化时不受事件循环中的修改影响"""
+    if isinstance(value, TimeSeries):
+        return value.to_dict()
+    if isinstance(value, dict):
+        return {key: _plain_copy(item) for key, item in value.items()}
+    if isinstance(value, (list, deque)):
+        return [_plain_copy(item) for item in value]
+    return value
+
+
+def hour_start(ts: float) -> int:
+    return int(ts // 3600) * 3600
+
+
+class StatsStore:
+    """统计数据的脏标记、每小时汇总与定期写入（仅在事件循环内修改，无需加锁）"""
+
+    def __init__(self, get_stats: Callable[[], dict], transient_keys: Iterable[str] = ()) -> None:
+        self._get_stats = get_stats
+        # 只在内存中使用、不写入 kv_stats 的键
+        self._transient_keys = frozenset(transient_keys)
+        # 脏版本号：每次标记加一，写入成功后记录已写入的版本
+        self._version = 0
+        self._flushed_version = 0
+        # 尚未写入的汇总增量：{(hour_ts, model, account_id): 汇总行}
+        self._rollups: Dict[Tuple[int, str, str], list] = {}
+        self._flush_lock = asyncio.Lock()
+        self._last_purge_at = 0.0
+        self.flushes = 0
+        self.flush_failures = 0
+        self.last_flush_at = 0.0
+        self.last_flush_ms = 0.0
+
+    @property
+    def dirty(self) -> bool:
+        return self._version != self._flushed_version
+
+    def mark_dirty(self) -> None:
+        self._version += 1
+
+    def record_request(
+        self,
+        model: str,
+        account_id: str,
+        failed: bool,
+        rate_limited: bool,
+        ttft_ms: Optional[float],
+        ts: Optional[float] = None,
+    ) -> None:
+        """把一次请求的结果计入所在小时的汇总"""
+        key = (hour_start(time.time() if ts is None else ts), model, account_id)
+        row = self._rollups.get(key)
+        if row is None:
+            row = self._rollups[key] = [0, 0, 0, 0.0, 0]
+        row[_REQUESTS] += 1
+        if failed:
+            row[_FAILURES] += 1
+        if rate_limited:
+            row[_RATE_LIMITED] += 1
+        if ttft_ms is not None:
+            row[_TTFT_SUM] += ttft_ms
+            row[_TTFT_COUNT] += 1
+        self.mark_dirty()
+
+    def snapshot(self) -> dict:
+        """当前统计的可序列化副本（在事件循环内同步生成）"""
+        return {
+            key: _plain_copy(value)
+            for key, value in self._get_stats().items()
+            if key not in self._transient_keys
+        }
+
+    async def flush(self) -> bool:
+        """写入待写的汇总增量，有变化时写入 kv_stats，返回是否写入"""
+        if not storage.is_database_enabled():
+            return False
+        async with self._flush_lock:
+            if not self.dirty and not self._rollups:
+                return False
+            version = self._version
+            rollups, self._rollups = self._rollups, {}
+            start = time.perf_counter()
+            try:
+                saved = await asyncio.to_thread(
+                    storage.save_stats_hourly_sync,
+                    [key + tuple(row) for key, row in rollups.items()],
+                )
+            except Exception as e:
+                logger.error(f"[STATS] 每小时统计写入异常: {str(e)[:50]}")
+                saved = False
+            if not saved:
+                self._restore_rollups(rollups)
+                self.flush_failures += 1
+                return False
+            try:
+                saved = await asyncio.to_thread(storage.save_stats_sync, self.snapshot())
+                await self._purge_expired()
+            except Exception as e:
+                logger.error(f"[STATS] 数据库保存失败: {str(e)[:50]}")
+                saved = False
+            if not saved:
+                # 汇总增量已写入，只保留脏标记
+                self.flush_failures += 1
+                return False
+            self._flushed_version = version
+            self.flushes += 1
+            self.last_flush_at = time.time()
+            self.last_flush_ms = (time.perf_counter() - start) * 1000
+            return True
+
+    def _restore_rollups(self, rollups: Dict[Tuple[int, str, str], list]) -> None:
+        """写入失败：把增量合并回待写数据（期间新增的增量一并累加）"""
+        for key, row in rollups.items():
+            current = self._rollups.get(key)
+            if current is None:
+                self._rollups[key] = row
+            else:
+                for index, value in enumerate(row):
+                    current[index] += value
+
+    async def _purge_expired(self) -> None:
+        now = time.time()
+        if now - self._last_purge_at < ROLLUP_PURGE_INTERVAL_SECONDS:
+            return
+        self._last_purge_at = now
+        cutoff = hour_start(now - config.performance.stats_retention_days * 86400)
+        purged = await asyncio.to_thread(storage.purge_stats_hourly_sync, cutoff)
+        if purged:
+            logger.info(f"[STATS] 清理 {purged} 条过期的每小时统计")
+
+    async def hourly_trend(self, start_ts: float, hours: int) -> Optional[dict]:
+        """
+        从 stats_hourly 按小时范围查询趋势（含尚未写入的增量）
+
+        返回 {"requests": [...], "failures": [...], "rate_limited": [...], "models": {model: [...]}}；
+        未配置数据库或查询失败时返回 None。
+        """
+        if not storage.is_database_enabled():
+            return None
+        first_hour = hour_start(start_ts)
+        rows = await asyncio.to_thread(storage.query_stats_hourly_sync, first_hour, first_hour + hours * 3600)
+        if rows is None:
+            return None
+        trend = {"requests": [0] * hours, "failures": [0] * hours, "rate_limited": [0] * hours, "models": {}}
+
+        def add(hour_ts: int, model: str, requests: int, failures: int, rate_limited: int) -> None:
+            index = (hour_ts - first_hour) // 3600
+            if not 0 <= index < hours:
+                return
+            trend["requests"][index] += requests
+            trend["failures"][index] += failures
+            trend["rate_limited"][index] += rate_limited
+            if model:
+                trend["models"].setdefault(model, [0] * hours)[index] += requests
+
+        for row in rows:
+            add(row["hour_ts"], row["model"], row["requests"], row["failures"], row["rate_limited"])
+        for (hour_ts, model, _), row in list(self._rollups.items()):
+            add(hour_ts, model, row[_REQUESTS], row[_FAILURES], row[_RATE_LIMITED])
+        return trend
+
+    async def run_flusher(self) -> None:
+        """后台定期写入（间隔读取 performance.stats_flush_seconds）"""
+        try:
+            while True:
+                await asyncio.sleep(config.performance.stats_flush_seconds)
+                await self.flush()
+        except asyncio.CancelledError:
+            logger.info("[STATS] 统计数据持久化任务已停止")
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": storage.is_database_enabled(),
+            "dirty": self.dirty,
+            "pending_rollups": len(self._rollups),
+            "flushes": self.flushes,
+            "flush_failures": self.flush_failures,
+            "last_flush_at": self.last_flush_at,
+            "last_flush_ms": round(self.last_flush_ms, 1),
+        }
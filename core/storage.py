@@ -176,8 +176,11 @@ def _get_sqlite_conn():
         if not sqlite_path:
             raise ValueError("SQLITE_PATH is not set")
         os.makedirs(os.path.dirname(sqlite_path) or ".", exist_ok=True)
-        conn = sqlite3.connect(sqlite_path, check_same_thread=False)
+        conn = sqlite3.connect(sqlite_path, check_same_thread=False, timeout=10)
         conn.row_factory = sqlite3.Row
+        # WAL: readers do not block the writer, so several worker processes can share the file
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
         _init_sqlite_tables(conn)
         _sqlite_conn = conn
         logger.info(f"[STORAGE] SQLite initialized at {sqlite_path}")
@@ -268,6 +271,71 @@ async def _init_tables(pool) -> None:
             ON task_history(created_at DESC)
             """
         )
+        await conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS session_bindings (
+                conv_key TEXT PRIMARY KEY,
+                account_id TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                updated_at DOUBLE PRECISION NOT NULL
+            )
+            """
+        )
+        await conn.execute(
+            """
+            CREATE INDEX IF NOT EXISTS session_bindings_updated_at_idx
+            ON session_bindings(updated_at)
+            """
+        )
+        await conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS state_accounts (
+                account_id TEXT PRIMARY KEY,
+                data JSONB NOT NULL,
+                worker_id TEXT NOT NULL,
+                updated_at DOUBLE PRECISION NOT NULL
+            )
+            """
+        )
+        await conn.execute(
+            """
+            CREATE INDEX IF NOT EXISTS state_accounts_updated_at_idx
+            ON state_accounts(updated_at)
+            """
+        )
+        await conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS state_counters (
+                name TEXT PRIMARY KEY,
+                value BIGINT NOT NULL
+            )
+            """
+        )
+        await conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS state_leases (
+                name TEXT PRIMARY KEY,
+                holder TEXT NOT NULL,
+                expires_at DOUBLE PRECISION NOT NULL
+            )
+            """
+        )
+        # Primary key leads with hour_ts, so range queries and retention use it as the index
+        await conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS stats_hourly (
+                hour_ts BIGINT NOT NULL,
+                model TEXT NOT NULL,
+                account_id TEXT NOT NULL,
+                requests BIGINT NOT NULL DEFAULT 0,
+                failures BIGINT NOT NULL DEFAULT 0,
+                rate_limited BIGINT NOT NULL DEFAULT 0,
+                ttft_ms_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+                ttft_count BIGINT NOT NULL DEFAULT 0,
+                PRIMARY KEY (hour_ts, model, account_id)
+            )
+            """
+        )
         logger.info("[STORAGE] Database tables initialized")
 
 def _init_sqlite_tables(conn: sqlite3.Connection) -> None:
@@ -322,6 +390,70 @@ def _init_sqlite_tables(conn: sqlite3.Connection) -> None:
             ON task_history(created_at)
             """
         )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS session_bindings (
+                conv_key TEXT PRIMARY KEY,
+                account_id TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE INDEX IF NOT EXISTS session_bindings_updated_at_idx
+            ON session_bindings(updated_at)
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS state_accounts (
+                account_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                worker_id TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE INDEX IF NOT EXISTS state_accounts_updated_at_idx
+            ON state_accounts(updated_at)
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS state_counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS state_leases (
+                name TEXT PRIMARY KEY,
+                holder TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS stats_hourly (
+                hour_ts INTEGER NOT NULL,
+                model TEXT NOT NULL,
+                account_id TEXT NOT NULL,
+                requests INTEGER NOT NULL DEFAULT 0,
+                failures INTEGER NOT NULL DEFAULT 0,
+                rate_limited INTEGER NOT NULL DEFAULT 0,
+                ttft_ms_sum REAL NOT NULL DEFAULT 0,
+                ttft_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (hour_ts, model, account_id)
+            )
+            """
+        )
 
 
 # ==================== Accounts storage ====================
@@ -839,6 +971,143 @@ def save_stats_sync(stats: dict) -> bool:
     return _run_in_db_loop(save_stats(stats))
 
 
+# ==================== Stats hourly rollups ====================
+
+_STATS_HOURLY_COLUMNS = ("requests", "failures", "rate_limited", "ttft_ms_sum", "ttft_count")
+
+
+async def save_stats_hourly(rows: list) -> bool:
+    """
+    Add rollup deltas: rows are
+    (hour_ts, model, account_id, requests, failures, rate_limited, ttft_ms_sum, ttft_count).
+    """
+    if not is_database_enabled():
+        return False
+    if not rows:
+        return True
+    backend = _get_backend()
+    try:
+        if backend == "postgres":
+            pool = await _get_pool()
+            async with pool.acquire() as conn:
+                await conn.executemany(
+                    """
+                    INSERT INTO stats_hourly
+                        (hour_ts, model, account_id, requests, failures, rate_limited, ttft_ms_sum, ttft_count)
+                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+                    ON CONFLICT (hour_ts, model, account_id) DO UPDATE SET
+                        requests = stats_hourly.requests + EXCLUDED.requests,
+                        failures = stats_hourly.failures + EXCLUDED.failures,
+                        rate_limited = stats_hourly.rate_limited + EXCLUDED.rate_limited,
+                        ttft_ms_sum = stats_hourly.ttft_ms_sum + EXCLUDED.ttft_ms_sum,
+                        ttft_count = stats_hourly.ttft_count + EXCLUDED.ttft_count
+                    """,
+                    rows,
+                )
+            return True
+        if backend == "sqlite":
+            conn = _get_sqlite_conn()
+            with _sqlite_lock, conn:
+                conn.executemany(
+                    """
+                    INSERT INTO stats_hourly
+                        (hour_ts, model, account_id, requests, failures, rate_limited, ttft_ms_sum, ttft_count)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(hour_ts, model, account_id) DO UPDATE SET
+                        requests = stats_hourly.requests + excluded.requests,
+                        failures = stats_hourly.failures + excluded.failures,
+                        rate_limited = stats_hourly.rate_limited + excluded.rate_limited,
+                        ttft_ms_sum = stats_hourly.ttft_ms_sum + excluded.ttft_ms_sum,
+                        ttft_count = stats_hourly.ttft_count + excluded.ttft_count
+                    """,
+                    rows,
+                )
+            return True
+    except Exception as e:
+        logger.error(f"[STORAGE] Stats rollup write failed: {e}")
+    return False
+
+
+async def query_stats_hourly(since_hour: int, until_hour: int) -> Optional[list]:
+    """Rollups per (hour_ts, model) for since_hour <= hour_ts < until_hour, summed over accounts."""
+    if not is_database_enabled():
+        return None
+    sums = ", ".join(f"SUM({column})" for column in _STATS_HOURLY_COLUMNS)
+    backend = _get_backend()
+    try:
+        if backend == "postgres":
+            pool = await _get_pool()
+            async with pool.acquire() as conn:
+                rows = await conn.fetch(
+                    f"""
+                    SELECT hour_ts, model, {sums} FROM stats_hourly
+                    WHERE hour_ts >= $1 AND hour_ts < $2
+                    GROUP BY hour_ts, model ORDER BY hour_ts
+                    """,
+                    since_hour,
+                    until_hour,
+                )
+        elif backend == "sqlite":
+            conn = _get_sqlite_conn()
+            with _sqlite_lock:
+                rows = conn.execute(
+                    f"""
+                    SELECT hour_ts, model, {sums} FROM stats_hourly
+                    WHERE hour_ts >= ? AND hour_ts < ?
+                    GROUP BY hour_ts, model ORDER BY hour_ts
+                    """,
+                    (since_hour, until_hour),
+                ).fetchall()
+        else:
+            return None
+        result = []
+        for row in rows:
+            row = tuple(row)
+            # Postgres returns SUM(BIGINT) as numeric
+            item = {"hour_ts": int(row[0]), "model": row[1]}
+            for column, value in zip(_STATS_HOURLY_COLUMNS, row[2:]):
+                item[column] = float(value or 0) if column == "ttft_ms_sum" else int(value or 0)
+            result.append(item)
+        return result
+    except Exception as e:
+        logger.error(f"[STORAGE] Stats rollup query failed: {e}")
+    return None
+
+
+async def purge_stats_hourly(before_hour: int) -> int:
+    """Delete rollup rows older than the retention cutoff."""
+    if not is_database_enabled():
+        return 0
+    backend = _get_backend()
+    try:
+        if backend == "postgres":
+            pool = await _get_pool()
+            async with pool.acquire() as conn:
+                result = await conn.execute("DELETE FROM stats_hourly WHERE hour_ts < $1", before_hour)
+            parts = result.split()
+            return int(parts[-1]) if result.startswith("DELETE") and parts else 0
+        if backend == "sqlite":
+            conn = _get_sqlite_conn()
+            with _sqlite_lock, conn:
+                cur = conn.execute("DELETE FROM stats_hourly WHERE hour_ts < ?", (before_hour,))
+                return cur.rowcount or 0
+    except Exception as e:
+        logger.error(f"[STORAGE] Stats rollup purge failed: {e}")
+    return 0
+
+
+def save_stats_hourly_sync(rows: list) -> bool:
+    return _run_in_db_loop(save_stats_hourly(rows))
+
+
+def query_stats_hourly_sync(since_hour: int, until_hour: int) -> Optional[list]:
+    return _run_in_db_loop(query_stats_hourly(since_hour, until_hour))
+
+
+def purge_stats_hourly_sync(before_hour: int) -> int:
+    return _run_in_db_loop(purge_stats_hourly(before_hour))
+
+
 # ==================== Task history storage ====================
 
 async def save_task_history_entry(entry: dict) -> bool:
@@ -978,3 +1247,399 @@ def load_task_history_sync(limit: int = 100) -> Optional[list]:
 
 def clear_task_history_sync() -> int:
     return _run_in_db_loop(clear_task_history())
+
+
+# ==================== Session bindings storage ====================
+
+async def save_session_bindings(upserts: list, deletes: list) -> bool:
+    """Batch write conversation bindings: upserts are (conv_key, account_id, session_id, updated_at)."""
+    if not is_database_enabled():
+        return False
+    if not upserts and not deletes:
+        return True
+    backend = _get_backend()
+    try:
+        if backend == "postgres":
+            pool = await _get_pool()
+            async with pool.acquire() as conn:
+                async with conn.transaction():
+                    if upserts:
+                        await conn.executemany(
+                            """
+                            INSERT INTO session_bindings (conv_key, account_id, session_id, updated_at)
+                            VALUES ($1, $2, $3, $4)
+                            ON CONFLICT (conv_key) DO UPDATE SET
+                                account_id = EXCLUDED.account_id,
+                                session_id = EXCLUDED.session_id,
+                                updated_at = EXCLUDED.updated_at
+                            WHERE EXCLUDED.updated_at >= session_bindings.updated_at
+                            """,
+                            upserts,
+                        )
+                    if deletes:
+                        await conn.execute(
+                            "DELETE FROM session_bindings WHERE conv_key = ANY($1::text[])",
+                            list(deletes),
+                        )
+            return True
+        if backend == "sqlite":
+            conn = _get_sqlite_conn()
+            with _sqlite_lock, conn:
+                if upserts:
+                    conn.executemany(
+                        """
+                        INSERT INTO session_bindings (conv_key, account_id, session_id, updated_at)
+                        VALUES (?, ?, ?, ?)
+                        ON CONFLICT(conv_key) DO UPDATE SET
+                            account_id = excluded.account_id,
+                            session_id = excluded.session_id,
+                            updated_at = excluded.updated_at
+                        WHERE excluded.updated_at >= session_bindings.updated_at
+                        """,
+                        upserts,
+                    )
+                if deletes:
+                    conn.executemany(
+                        "DELETE FROM session_bindings WHERE conv_key = ?",
+                        [(conv_key,) for conv_key in deletes],
+                    )
+            return True
+    except Exception as e:
+        logger.error(f"[STORAGE] Session bindings write failed: {e}")
+    return False
+
+
+async def load_session_binding(conv_key: str, min_updated_at: float) -> Optional[dict]:
+    """Load one conversation binding that was updated at or after min_updated_at."""
+    if not is_database_enabled():
+        return None
+    backend = _get_backend()
+    try:
+        if backend == "postgres":
+            pool = await _get_pool()
+            async with pool.acquire() as conn:
+                row = await conn.fetchrow(
+                    """
+                    SELECT account_id, session_id, updated_at FROM session_bindings
+                    WHERE conv_key = $1 AND updated_at >= $2
+                    """,
+                    conv_key,
+                    min_updated_at,
+                )
+        elif backend == "sqlite":
+            conn = _get_sqlite_conn()
+            with _sqlite_lock:
+                row = conn.execute(
+                    """
+                    SELECT account_id, session_id, updated_at FROM session_bindings
+                    WHERE conv_key = ? AND updated_at >= ?
+                    """,
+                    (conv_key, min_updated_at),
+                ).fetchone()
+        else:
+            return None
+        if not row:
+            return None
+        return {
+            "account_id": row["account_id"],
+            "session_id": row["session_id"],
+            "updated_at": float(row["updated_at"]),
+        }
+    except Exception as e:
+        logger.error(f"[STORAGE] Session binding read failed: {e}")
+    return None
+
+
+async def load_session_bindings(conv_keys: list, min_updated_at: float) -> Optional[dict]:
+    """Load bindings for several keys at once: {conv_key: binding}."""
+    if not is_database_enabled():
+        return None
+    if not conv_keys:
+        return {}
+    backend = _get_backend()
+    try:
+        if backend == "postgres":
+            pool = await _get_pool()
+            async with pool.acquire() as conn:
+                rows = await conn.fetch(
+                    """
+                    SELECT conv_key, account_id, session_id, updated_at FROM session_bindings
+                    WHERE conv_key = ANY($1::text[]) AND updated_at >= $2
+                    """,
+                    list(conv_keys),
+                    min_updated_at,
+                )
+        elif backend == "sqlite":
+            conn = _get_sqlite_conn()
+            placeholders = ",".join("?" for _ in conv_keys)
+            with _sqlite_lock:
+                rows = conn.execute(
+                    f"""
+                    SELECT conv_key, account_id, session_id, updated_at FROM session_bindings
+                    WHERE conv_key IN ({placeholders}) AND updated_at >= ?
+                    """,
+                    (*conv_keys, min_updated_at),
+                ).fetchall()
+        else:
+            return None
+        return {
+            row["conv_key"]: {
+                "account_id": row["account_id"],
+                "session_id": row["session_id"],
+                "updated_at": float(row["updated_at"]),
+            }
+            for row in rows
+        }
+    except Exception as e:
+        logger.error(f"[STORAGE] Session bindings read failed: {e}")
+    return None
+
+
+async def purge_session_bindings(before: float, account_ids: Optional[list] = None) -> int:
+    """Delete bindings updated before the cutoff, or all bindings of the given accounts."""
+    if not is_database_enabled():
+        return 0
+    backend = _get_backend()
+    try:
+        if backend == "postgres":
+            pool = await _get_pool()
+            async with pool.acquire() as conn:
+                if account_ids:
+                    result = await conn.execute(
+                        "DELETE FROM session_bindings WHERE updated_at < $1 OR account_id = ANY($2::text[])",
+                        before,
+                        list(account_ids),
+                    )
+                else:
+                    result = await conn.execute("DELETE FROM session_bindings WHERE updated_at < $1", before)
+            parts = result.split()
+            return int(parts[-1]) if result.startswith("DELETE") and parts else 0
+        if backend == "sqlite":
+            conn = _get_sqlite_conn()
+            with _sqlite_lock, conn:
+                cur = conn.execute("DELETE FROM session_bindings WHERE updated_at < ?", (before,))
+                deleted = cur.rowcount or 0
+                if account_ids:
+                    cur = conn.executemany(
+                        "DELETE FROM session_bindings WHERE account_id = ?",
+                        [(account_id,) for account_id in account_ids],
+                    )
+                    deleted += cur.rowcount or 0
+                return deleted
+    except Exception as e:
+        logger.error(f"[STORAGE] Session bindings purge failed: {e}")
+    return 0
+
+
+def save_session_bindings_sync(upserts: list, deletes: list) -> bool:
+    return _run_in_db_loop(save_session_bindings(upserts, deletes))
+
+
+def load_session_binding_sync(conv_key: str, min_updated_at: float) -> Optional[dict]:
+    return _run_in_db_loop(load_session_binding(conv_key, min_updated_at))
+
+
+def load_session_bindings_sync(conv_keys: list, min_updated_at: float) -> Optional[dict]:
+    return _run_in_db_loop(load_session_bindings(conv_keys, min_updated_at))
+
+
+def purge_session_bindings_sync(before: float, account_ids: Optional[list] = None) -> int:
+    return _run_in_db_loop(purge_session_bindings(before, account_ids))
+
+
+# ==================== Shared runtime state (multi-worker) ====================
+
+async def save_account_states(rows: list) -> bool:
+    """Upsert account runtime states: rows are (account_id, data, worker_id, updated_at)."""
+    if not is_database_enabled():
+        return False
+    if not rows:
+        return True
+    payloads = [
+        (account_id, json.dumps(data, ensure_ascii=False), worker_id, updated_at)
+        for account_id, data, worker_id, updated_at in rows
+    ]
+    backend = _get_backend()
+    try:
+        if backend == "postgres":
+            pool = await _get_pool()
+            async with pool.acquire() as conn:
+                await conn.executemany(
+                    """
+                    INSERT INTO state_accounts (account_id, data, worker_id, updated_at)
+                    VALUES ($1, $2, $3, $4)
+                    ON CONFLICT (account_id) DO UPDATE SET
+                        data = EXCLUDED.data,
+                        worker_id = EXCLUDED.worker_id,
+                        updated_at = EXCLUDED.updated_at
+                    """,
+                    payloads,
+                )
+            return True
+        if backend == "sqlite":
+            conn = _get_sqlite_conn()
+            with _sqlite_lock, conn:
+                conn.executemany(
+                    """
+                    INSERT INTO state_accounts (account_id, data, worker_id, updated_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(account_id) DO UPDATE SET
+                        data = excluded.data,
+                        worker_id = excluded.worker_id,
+                        updated_at = excluded.updated_at
+                    """,
+                    payloads,
+                )
+            return True
+    except Exception as e:
+        logger.error(f"[STORAGE] Account state write failed: {e}")
+    return False
+
+
+async def load_account_states(since: float, exclude_worker: str) -> Optional[list]:
+    """Load account runtime states written by other workers after `since`."""
+    if not is_database_enabled():
+        return None
+    backend = _get_backend()
+    try:
+        if backend == "postgres":
+            pool = await _get_pool()
+            async with pool.acquire() as conn:
+                rows = await conn.fetch(
+                    """
+                    SELECT account_id, data, updated_at FROM state_accounts
+                    WHERE updated_at > $1 AND worker_id <> $2
+                    """,
+                    since,
+                    exclude_worker,
+                )
+        elif backend == "sqlite":
+            conn = _get_sqlite_conn()
+            with _sqlite_lock:
+                rows = conn.execute(
+                    """
+                    SELECT account_id, data, updated_at FROM state_accounts
+                    WHERE updated_at > ? AND worker_id <> ?
+                    """,
+                    (since, exclude_worker),
+                ).fetchall()
+        else:
+            return None
+        results = []
+        for row in rows:
+            data = _parse_account_value(row["data"])
+            if data is not None:
+                results.append({"account_id": row["account_id"], "data": data, "updated_at": float(row["updated_at"])})
+        return results
+    except Exception as e:
+        logger.error(f"[STORAGE] Account state read failed: {e}")
+    return None
+
+
+async def sync_counters(deltas: dict, seed: Optional[dict] = None) -> Optional[dict]:
+    """
+    Atomically add counter deltas and return all counter totals.
+    `seed` values are only inserted for counters that do not exist yet.
+    """
+    if not is_database_enabled():
+        return None
+    backend = _get_backend()
+    seed_rows = [(name, int(value)) for name, value in (seed or {}).items()]
+    delta_rows = [(name, int(value)) for name, value in deltas.items() if value]
+    try:
+        if backend == "postgres":
+            pool = await _get_pool()
+            async with pool.acquire() as conn:
+                async with conn.transaction():
+                    if seed_rows:
+                        await conn.executemany(
+                            "INSERT INTO state_counters (name, value) VALUES ($1, $2) ON CONFLICT (name) DO NOTHING",
+                            seed_rows,
+                        )
+                    if delta_rows:
+                        await conn.executemany(
+                            """
+                            INSERT INTO state_counters (name, value) VALUES ($1, $2)
+                            ON CONFLICT (name) DO UPDATE SET value = state_counters.value + EXCLUDED.value
+                            """,
+                            delta_rows,
+                        )
+                    rows = await conn.fetch("SELECT name, value FROM state_counters")
+            return {row["name"]: int(row["value"]) for row in rows}
+        if backend == "sqlite":
+            conn = _get_sqlite_conn()
+            with _sqlite_lock, conn:
+                if seed_rows:
+                    conn.executemany(
+                        "INSERT INTO state_counters (name, value) VALUES (?, ?) ON CONFLICT(name) DO NOTHING",
+                        seed_rows,
+                    )
+                if delta_rows:
+                    conn.executemany(
+                        """
+                        INSERT INTO state_counters (name, value) VALUES (?, ?)
+                        ON CONFLICT(name) DO UPDATE SET value = state_counters.value + excluded.value
+                        """,
+                        delta_rows,
+                    )
+                rows = conn.execute("SELECT name, value FROM state_counters").fetchall()
+            return {row["name"]: int(row["value"]) for row in rows}
+    except Exception as e:
+        logger.error(f"[STORAGE] Counter sync failed: {e}")
+    return None
+
+
+async def acquire_lease(name: str, holder: str, ttl_seconds: float) -> bool:
+    """Acquire or renew a named lease; returns True when `holder` owns it."""
+    if not is_database_enabled():
+        return False
+    now = time.time()
+    backend = _get_backend()
+    try:
+        if backend == "postgres":
+            pool = await _get_pool()
+            async with pool.acquire() as conn:
+                row = await conn.fetchrow(
+                    """
+                    INSERT INTO state_leases (name, holder, expires_at) VALUES ($1, $2, $3)
+                    ON CONFLICT (name) DO UPDATE SET holder = EXCLUDED.holder, expires_at = EXCLUDED.expires_at
+                    WHERE state_leases.holder = EXCLUDED.holder OR state_leases.expires_at < $4
+                    RETURNING holder
+                    """,
+                    name,
+                    holder,
+                    now + ttl_seconds,
+                    now,
+                )
+            return row is not None
+        if backend == "sqlite":
+            conn = _get_sqlite_conn()
+            with _sqlite_lock, conn:
+                cur = conn.execute(
+                    """
+                    INSERT INTO state_leases (name, holder, expires_at) VALUES (?, ?, ?)
+                    ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+                    WHERE state_leases.holder = excluded.holder OR state_leases.expires_at < ?
+                    """,
+                    (name, holder, now + ttl_seconds, now),
+                )
+                return cur.rowcount > 0
+    except Exception as e:
+        logger.error(f"[STORAGE] Lease acquire failed: {e}")
+    return False
+
+
+def save_account_states_sync(rows: list) -> bool:
+    return _run_in_db_loop(save_account_states(rows))
+
+
+def load_account_states_sync(since: float, exclude_worker: str) -> Optional[list]:
+    return _run_in_db_loop(load_account_states(since, exclude_worker))
+
+
+def sync_counters_sync(deltas: dict, seed: Optional[dict] = None) -> Optional[dict]:
+    return _run_in_db_loop(sync_counters(deltas, seed))
+
+
+def acquire_lease_sync(name: str, holder: str, ttl_seconds: float) -> bool:
+    return _run_in_db_loop(acquire_lease(name, holder, ttl_seconds))
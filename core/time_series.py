@@ -0,0 +1,102 @@
+"""时间分桶计数器
+
+替代按请求保存时间戳的列表：每个指标用固定长度的环形数组按分钟/小时计数，
+记录为 O(1)，查询为 O(桶数)，内存占用与流量无关。
+- 槽位按绝对桶序号（时间戳 // 桶宽）取模复用，槽位记录所属桶序号，过期的槽位在写入时清零、读取时视为 0
+- 小时桶以 UTC 整点对齐（北京时间同样是整点）
+"""
+import time
+from array import array
+from typing import List, Optional
+
+# 分钟桶数量（最近 1 小时）
+MINUTE_BUCKETS = 60
+# 小时桶数量（最近 24 小时）
+HOUR_BUCKETS = 24
+
+
+class RingCounter:
+    """固定槽位的环形分桶计数器"""
+
+    __slots__ = ("bucket_seconds", "size", "_counts", "_indexes")
+
+    def __init__(self, bucket_seconds: int, size: int) -> None:
+        self.bucket_seconds = bucket_seconds
+        self.size = size
+        self._counts = array("Q", bytes(8 * size))
+        # 每个槽位当前保存的桶序号（-1 表示空）
+        self._indexes = array("q", [-1]) * size
+
+    def bucket_index(self, ts: float) -> int:
+        return int(ts // self.bucket_seconds)
+
+    def add(self, ts: float, amount: int = 1) -> None:
+        index = int(ts // self.bucket_seconds)
+        slot = index % self.size
+        if self._indexes[slot] != index:
+            if self._indexes[slot] > index:
+                # 早于槽位中已有数据的旧时间戳（已超出保留范围）
+                return
+            self._indexes[slot] = index
+            self._counts[slot] = 0
+        self._counts[slot] += amount
+
+    def get(self, index: int) -> int:
+        slot = index % self.size
+        return self._counts[slot] if self._indexes[slot] == index else 0
+
+    def series(self, first_index: int, count: int) -> List[int]:
+        """从 first_index 开始连续 count 个桶的计数"""
+        return [self.get(first_index + offset) for offset in range(count)]
+
+    def to_dict(self) -> dict:
+        buckets = [
+            [self._indexes[slot], self._counts[slot]]
+            for slot in range(self.size)
+            if self._indexes[slot] >= 0 and self._counts[slot]
+        ]
+        buckets.sort()
+        return {"bucket_seconds": self.bucket_seconds, "buckets": buckets}
+
+    def load(self, data: Optional[dict]) -> None:
+        if not isinstance(data, dict) or data.get("bucket_seconds") != self.bucket_seconds:
+            return
+        for index, count in data.get("buckets") or ():
+            self.add(int(index) * self.bucket_seconds, int(count))
+
+
+class TimeSeries:
+    """单个指标的分钟/小时计数"""
+
+    __slots__ = ("minutes", "hours")
+
+    def __init__(self) -> None:
+        self.minutes = RingCounter(60, MINUTE_BUCKETS)
+        self.hours = RingCounter(3600, HOUR_BUCKETS)
+
+    def add(self, ts: Optional[float] = None, amount: int = 1) -> None:
+        ts = time.time() if ts is None else ts
+        self.minutes.add(ts, amount)
+        self.hours.add(ts, amount)
+
+    def per_minute(self, now: Optional[float] = None) -> int:
+        """最近 60 秒的请求数（当前分钟 + 上一分钟按未过去的比例折算）"""
+        now = time.time() if now is None else now
+        index = self.minutes.bucket_index(now)
+        elapsed = (now % 60) / 60
+        return round(self.minutes.get(index) + self.minutes.get(index - 1) * (1 - elapsed))
+
+    def hourly(self, start_ts: float, count: int) -> List[int]:
+        """从 start_ts 所在小时开始连续 count 个小时的计数"""
+        return self.hours.series(self.hours.bucket_index(start_ts), count)
+
+    def to_dict(self) -> dict:
+        return {"minutes": self.minutes.to_dict(), "hours": self.hours.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data: Optional[dict]) -> "TimeSeries":
+        series = cls()
+        if isinstance(data, dict):
+            series.minutes.load(data.get("minutes"))
+            series.hours.load(data.get("hours"))
+        return series
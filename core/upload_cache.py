@@ -0,0 +1,165 @@
+"""附件上传缓存
+
+按 (Session 名称, 内容 sha256, MIME) 记录已上传文件的 fileId。
+同一 Session 内重复发送的附件（聊天前端每轮都会重发历史图片/PDF）直接复用 fileId，
+Session 变化时只上传缺失的文件。
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import httpx
+
+from core.config import config
+from core.google_api import upload_context_file
+
+if TYPE_CHECKING:
+    from core.account import AccountManager
+
+logger = logging.getLogger(__name__)
+
+# 最大缓存条目数（LRU 淘汰）
+UPLOAD_CACHE_MAX_ENTRIES = 4096
+# 超过该大小的附件在线程中计算哈希，避免阻塞事件循环
+HASH_IN_THREAD_THRESHOLD = 1024 * 1024
+
+
+def _sha256_hex(data: str) -> str:
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+async def attachment_digest(attachment: dict) -> str:
+    """计算附件内容（base64 文本）的 sha256，结果缓存在附件字典中"""
+    digest = attachment.get("sha256")
+    if digest is None:
+        data = attachment["data"]
+        if len(data) > HASH_IN_THREAD_THRESHOLD:
+            digest = await asyncio.to_thread(_sha256_hex, data)
+        else:
+            digest = _sha256_hex(data)
+        attachment["sha256"] = digest
+    return digest
+
+
+class UploadCache:
+    """内容寻址的附件上传缓存（仅在事件循环内使用，无需加锁）"""
+
+    def __init__(self, max_entries: int = UPLOAD_CACHE_MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        # {(session_name, sha256, mime): (file_id, stored_at)}
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[str, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        # 每个账户的上传并发限制：{account_id: (limit, semaphore)}
+        self._account_semaphores: Dict[str, Tuple[int, asyncio.Semaphore]] = {}
+
+    def get(self, session_name: str, digest: str, mime: str) -> Optional[str]:
+        key = (session_name, digest, mime)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        file_id, stored_at = entry
+        if time.time() - stored_at > config.retry.session_cache_ttl_seconds:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return file_id
+
+    def put(self, session_name: str, digest: str, mime: str, file_id: str) -> None:
+        key = (session_name, digest, mime)
+        self._entries[key] = (file_id, time.time())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def upload(
+        self,
+        session_name: str,
+        attachment: dict,
+        account_manager: "AccountManager",
+        http_client: httpx.AsyncClient,
+        user_agent: str,
+        request_id: str = ""
+    ) -> str:
+        """返回附件在该 Session 中的 fileId，未上传过时才调用 upload_context_file"""
+        mime = attachment["mime"]
+        digest = await attachment_digest(attachment)
+        file_id = self.get(session_name, digest, mime)
+        if file_id:
+            self.hits += 1
+            self.bytes_saved += len(attachment["data"]) * 3 // 4
+            req_tag = f"[req_{request_id}] " if request_id else ""
+            logger.info(f"[FILE] [{account_manager.config.account_id}] {req_tag}复用已上传文件: {mime} ({digest[:8]})")
+            return file_id
+
+        self.misses += 1
+        file_id = await upload_context_file(
+            session_name, mime, attachment["data"], account_manager, http_client, user_agent, request_id
+        )
+        if file_id:
+            self.put(session_name, digest, mime, file_id)
+        return file_id
+
+    def _account_semaphore(self, account_id: str) -> asyncio.Semaphore:
+        limit = config.performance.upload_concurrency_per_account
+        entry = self._account_semaphores.get(account_id)
+        if entry is None or entry[0] != limit:
+            # 限制变更后新建信号量，已在进行中的上传仍持有旧信号量直至完成
+            entry = (limit, asyncio.Semaphore(limit))
+            self._account_semaphores[account_id] = entry
+        return entry[1]
+
+    def forget_account(self, account_id: str) -> None:
+        """删除账户的上传信号量（账户删除或凭据变更时由 reload_accounts 回调），进行中的上传仍持有旧信号量直至完成"""
+        self._account_semaphores.pop(account_id, None)
+
+    async def upload_all(
+        self,
+        session_name: str,
+        attachments: List[dict],
+        account_manager: "AccountManager",
+        http_client: httpx.AsyncClient,
+        user_agent: str,
+        request_id: str = ""
+    ) -> List[str]:
+        """
+        并发上传多个附件，返回与输入顺序一致的 fileId 列表。
+
+        并发数同时受单请求和单账户限制；任一上传失败时取消其余上传并抛出该异常。
+        """
+        if len(attachments) == 1:
+            return [await self.upload(session_name, attachments[0], account_manager, http_client, user_agent, request_id)]
+
+        request_semaphore = asyncio.Semaphore(config.performance.upload_concurrency_per_request)
+        account_semaphore = self._account_semaphore(account_manager.config.account_id)
+
+        async def upload_one(attachment: dict) -> str:
+            async with request_semaphore, account_semaphore:
+                return await self.upload(session_name, attachment, account_manager, http_client, user_agent, request_id)
+
+        tasks = [asyncio.create_task(upload_one(attachment)) for attachment in attachments]
+        try:
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if task.exception() is not None:
+                    raise task.exception()
+            return [task.result() for task in tasks]
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get_stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+            "entries": len(self._entries),
+            "bytes_saved": self.bytes_saved,
+        }
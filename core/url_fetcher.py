@@ -0,0 +1,209 @@
+"""URL 附件下载模块
+
+负责下载消息中以 URL 形式给出的附件（图片、PDF、文档等）：
+- 流式下载并限制最大字节数，超限立即中断
+- base64 编码在线程中执行，不阻塞事件循环
+- 按字节预算的 LRU 缓存，记录 ETag/Last-Modified 并通过条件请求重新验证
+- 同一 URL 的并发下载合并为一次
+"""
+import asyncio
+import base64
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import httpx
+
+from core.config import config
+
+logger = logging.getLogger(__name__)
+
+# 下载超时（秒）
+FETCH_TIMEOUT_SECONDS = 30
+# Cache-Control max-age 的上限（秒），超过按该值处理
+MAX_FRESHNESS_SECONDS = 3600
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+# 条件请求返回 304 时缓存条目已不在，需要无条件重新下载
+_STALE_REVALIDATION = object()
+
+
+class AttachmentTooLarge(Exception):
+    """附件超过大小上限"""
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+
+def _freshness_seconds(headers: httpx.Headers) -> int:
+    cache_control = headers.get("cache-control", "").lower()
+    if "no-cache" in cache_control or "no-store" in cache_control:
+        return 0
+    match = _MAX_AGE_RE.search(cache_control)
+    if not match:
+        return 0
+    return min(int(match.group(1)), MAX_FRESHNESS_SECONDS)
+
+
+class UrlAttachmentFetcher:
+    """带缓存的 URL 附件下载器（仅在事件循环内使用，无需加锁）"""
+
+    def __init__(self) -> None:
+        # {url: entry}，entry 包含 mime/data/etag/last_modified/expires_at
+        self._cache: "OrderedDict[str, dict]" = OrderedDict()
+        self._cache_bytes = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.rejected = 0
+
+    @property
+    def max_bytes(self) -> int:
+        return config.performance.url_fetch_max_mb * 1024 * 1024
+
+    @property
+    def cache_budget_bytes(self) -> int:
+        return config.performance.url_fetch_cache_mb * 1024 * 1024
+
+    async def fetch(self, url: str, http_client: httpx.AsyncClient, request_id: str = "") -> Optional[dict]:
+        """下载 URL 附件，返回 {"mime": str, "data": str_base64}；失败或跳过时返回 None"""
+        inflight = self._inflight.get(url)
+        if inflight is not None:
+            # 其他请求正在下载同一 URL，等待其结果
+            result = await asyncio.shield(inflight)
+            return dict(result) if result else None
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[url] = future
+        try:
+            result = await self._fetch(url, http_client, request_id)
+            future.set_result(result)
+            return dict(result) if result else None
+        except BaseException as e:
+            future.set_result(None)
+            if isinstance(e, Exception):
+                logger.warning(f"[FILE] [req_{request_id}] URL文件下载失败: {url[:50]}... - {e}")
+                return None
+            raise
+        finally:
+            self._inflight.pop(url, None)
+
+    async def _fetch(self, url: str, http_client: httpx.AsyncClient, request_id: str) -> Optional[dict]:
+        entry = self._cache.get(url)
+        if entry is not None and time.time() < entry["expires_at"]:
+            self.hits += 1
+            self._cache.move_to_end(url)
+            return {"mime": entry["mime"], "data": entry["data"]}
+
+        if entry is not None:
+            result = await self._download(url, http_client, request_id, entry)
+            if result is not _STALE_REVALIDATION:
+                return result
+            # 等待 304 期间缓存条目已被淘汰或替换，改为无条件重新下载
+            logger.info(f"[FILE] [req_{request_id}] URL文件缓存已失效，重新下载: {url[:50]}...")
+        return await self._download(url, http_client, request_id, None)
+
+    async def _download(
+        self, url: str, http_client: httpx.AsyncClient, request_id: str, entry: Optional[dict]
+    ) -> Optional[dict]:
+        """下载 URL；entry 不为空时带校验字段发起条件请求"""
+        headers = {}
+        if entry is not None:
+            if entry["etag"]:
+                headers["if-none-match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["if-modified-since"] = entry["last_modified"]
+
+        max_bytes = self.max_bytes
+        async with http_client.stream(
+            "GET", url, headers=headers, timeout=FETCH_TIMEOUT_SECONDS, follow_redirects=True
+        ) as resp:
+            if resp.status_code == 304:
+                if entry is None:
+                    logger.warning(f"[FILE] [req_{request_id}] URL文件下载失败(非条件请求返回304): {url[:50]}...")
+                    return None
+                # 重新读取缓存：等待响应期间条目可能已被其他下载淘汰或替换
+                if self._cache.get(url) is not entry:
+                    return _STALE_REVALIDATION
+                self.revalidated += 1
+                entry["expires_at"] = time.time() + _freshness_seconds(resp.headers)
+                self._cache.move_to_end(url)
+                logger.info(f"[FILE] [req_{request_id}] URL文件未变化，使用缓存: {url[:50]}...")
+                return {"mime": entry["mime"], "data": entry["data"]}
+            if resp.status_code == 404:
+                logger.warning(f"[FILE] [req_{request_id}] URL文件已失效(404)，已跳过: {url[:50]}...")
+                self._evict(url)
+                return None
+            if resp.status_code >= 400:
+                logger.warning(f"[FILE] [req_{request_id}] URL文件下载失败({resp.status_code}): {url[:50]}...")
+                return None
+
+            content_length = resp.headers.get("content-length")
+            if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+                self.rejected += 1
+                raise AttachmentTooLarge(f"文件大小 {content_length} 字节超过上限 {max_bytes} 字节")
+
+            body = bytearray()
+            async for chunk in resp.aiter_bytes():
+                body += chunk
+                if len(body) > max_bytes:
+                    self.rejected += 1
+                    raise AttachmentTooLarge(f"文件大小超过上限 {max_bytes} 字节")
+
+            self.misses += 1
+            content_type = resp.headers.get("content-type", "application/octet-stream").split(";")[0]
+            data = await asyncio.to_thread(_b64encode, bytes(body))
+            logger.info(f"[FILE] [req_{request_id}] URL文件下载成功: {url[:50]}... ({len(body)} bytes, {content_type})")
+
+            self._store(url, content_type, data, resp.headers)
+            return {"mime": content_type, "data": data}
+
+    def _store(self, url: str, mime: str, data: str, headers: httpx.Headers) -> None:
+        etag = headers.get("etag")
+        last_modified = headers.get("last-modified")
+        freshness = _freshness_seconds(headers)
+        self._evict(url)
+        # 既无校验字段又无有效期的响应无法安全复用，不缓存
+        if not (etag or last_modified or freshness):
+            return
+        size = len(data)
+        budget = self.cache_budget_bytes
+        if size > budget:
+            return
+        self._cache[url] = {
+            "mime": mime,
+            "data": data,
+            "size": size,
+            "etag": etag,
+            "last_modified": last_modified,
+            "expires_at": time.time() + freshness,
+        }
+        self._cache_bytes += size
+        while self._cache_bytes > budget:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= evicted["size"]
+
+    def _evict(self, url: str) -> None:
+        entry = self._cache.pop(url, None)
+        if entry is not None:
+            self._cache_bytes -= entry["size"]
+
+    def get_stats(self) -> dict:
+        lookups = self.hits + self.revalidated + self.misses
+        return {
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.revalidated) / lookups, 3) if lookups else 0,
+            "rejected": self.rejected,
+            "entries": len(self._cache),
+            "cached_bytes": self._cache_bytes,
+        }
+
+
+# 全局下载器实例（进程内共享缓存）
+url_fetcher = UrlAttachmentFetcher()
@@ -1,8 +1,43 @@
 // API 类型定义
 
+export interface QuotaPrediction {
+  limit: number
+  used: number
+  headroom: number
+  window_seconds: number
+  samples: number
+  source: 'account' | 'pool'
+}
+
 export interface QuotaStatus {
   available: boolean
   remaining_seconds?: number
+  state?: CircuitState
+  predicted?: QuotaPrediction | null
+}
+
+export type CircuitState = 'closed' | 'open' | 'half_open'
+
+export interface CircuitTransition {
+  time: number
+  from: CircuitState
+  to: CircuitState
+  reason: string | null
+}
+
+export interface CircuitBreakerStatus {
+  state: CircuitState
+  reason: string | null
+  trips: number
+  open_seconds: number
+  retry_in_seconds: number
+  probing: boolean
+  transitions: CircuitTransition[]
+}
+
+export interface AccountCircuitStatus {
+  global: CircuitBreakerStatus
+  quotas: Record<string, CircuitBreakerStatus>
 }
 
 export interface AccountQuotaStatus {
@@ -16,6 +51,23 @@ export interface AccountQuotaStatus {
   is_expired: boolean
 }
 
+export interface AccountQuotaLimitStatus {
+  in_flight: number
+  pending: number
+  max_in_flight: number
+}
+
+export interface AccountSelectionStatus {
+  in_flight: number
+  pending: number
+  ttft_ewma_ms: number
+  ttft_p90_ms: number | null
+  error_rate: number
+  score: number
+  samples: number
+  limits: Record<string, AccountQuotaLimitStatus>
+}
+
 export interface AdminAccount {
   id: string
   status: string
@@ -30,6 +82,8 @@ export interface AdminAccount {
   cooldown_reason: string | null
   conversation_count: number
   quota_status: AccountQuotaStatus
+  selection?: AccountSelectionStatus
+  circuit?: AccountCircuitStatus
 }
 
 export interface AccountsListResponse {
@@ -104,6 +158,7 @@ export interface Settings {
     text_rate_limit_cooldown_seconds: number
     images_rate_limit_cooldown_seconds: number
     videos_rate_limit_cooldown_seconds: number
+    circuit_probe_seconds?: number
     session_cache_ttl_seconds: number
     auto_refresh_accounts_seconds: number
     scheduled_refresh_enabled?: boolean
@@ -121,6 +176,35 @@ export interface Settings {
   session: {
     expire_hours: number
   }
+  performance?: {
+    stream_coalesce_window_ms: number
+    stream_coalesce_max_chars: number
+    stream_parser_engine: 'bytes' | 'legacy'
+    session_pool_max_size: number
+    session_pool_ttl_seconds: number
+    upload_concurrency_per_request: number
+    upload_concurrency_per_account: number
+    url_fetch_max_mb: number
+    url_fetch_cache_mb: number
+    account_selection_policy: 'round_robin' | 'least_in_flight' | 'p2c'
+    account_max_in_flight_text: number
+    account_max_in_flight_images: number
+    account_max_in_flight_videos: number
+    account_rate_per_minute_text: number
+    account_rate_per_minute_images: number
+    account_rate_per_minute_videos: number
+    account_rate_burst: number
+    account_queue_max_waiters: number
+    account_queue_timeout_seconds: number
+    quota_prediction_enabled: boolean
+    session_cache_max_entries: number
+    session_binding_flush_seconds: number
+    context_max_chars: number
+    context_max_tokens: number
+    state_sync_interval_ms: number
+    stats_flush_seconds: number
+    stats_retention_days: number
+  }
 }
 
 export interface LogEntry {
@@ -197,6 +281,80 @@ export interface AdminStats {
   success_count?: number
   failed_count?: number
   trend: AdminStatsTrend
+  stream?: {
+    frames_per_second: number
+    bytes_per_frame: number
+    total_frames: number
+    total_bytes: number
+  }
+  session_pool?: {
+    enabled: boolean
+    hits: number
+    misses: number
+    hit_rate: number
+    pooled: number
+    created: number
+    expired: number
+    refill_failures: number
+  }
+  upload_cache?: {
+    hits: number
+    misses: number
+    hit_rate: number
+    entries: number
+    bytes_saved: number
+  }
+  url_fetch?: {
+    hits: number
+    revalidated: number
+    misses: number
+    hit_rate: number
+    rejected: number
+    entries: number
+    cached_bytes: number
+  }
+  account_queue?: {
+    waiting: number
+    queued_total: number
+    rejected: number
+  }
+  session_cache?: {
+    hits: number
+    misses: number
+    hit_rate: number
+    entries: number
+    bound: number
+    max_entries: number
+    evicted_lru: number
+    evicted_expired: number
+  }
+  session_bindings?: {
+    enabled: boolean
+    shared: boolean
+    pending: number
+    restored: number
+    restore_misses: number
+    written: number
+    flush_failures: number
+  }
+  state_backend?: {
+    backend: 'memory' | 'shared'
+    worker_id: string
+    syncs?: number
+    sync_failures?: number
+    remote_updates?: number
+    last_sync_ms?: number
+    leases?: string[]
+  }
+  stats_store?: {
+    enabled: boolean
+    dirty: boolean
+    pending_rollups: number
+    flushes: number
+    flush_failures: number
+    last_flush_at: number
+    last_flush_ms: number
+  }
 }
 
 export interface PublicStats {
@@ -1,4 +1,4 @@
-import json, time, os, asyncio, uuid, ssl, re, yaml, base64
+import time, os, asyncio, uuid, ssl, re, yaml, base64
 from datetime import datetime, timezone, timedelta
 from typing import List, Optional, Union, Dict, Any
 from pathlib import Path
@@ -9,10 +9,22 @@ import httpx
 import aiofiles
 from fastapi import FastAPI, HTTPException, Header, Request, Body, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse, FileResponse
+from fastapi.responses import StreamingResponse, JSONResponse, FileResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from util.streaming_parser import parse_json_array_stream_async
+from util.streaming_parser import parse_json_array_stream_async, parse_json_array_bytes_async
+from util.sse import (
+    ChatDelta,
+    SSEChunkEncoder,
+    SSEFrameStats,
+    coalesce_deltas,
+    encode_sse_stream,
+    DELTA_CONTENT,
+    DELTA_REASONING,
+    DELTA_ERROR,
+    ROLE_DELTA,
+    FINISH_DELTA,
+)
 from collections import deque
 from threading import Lock
 
@@ -39,20 +51,24 @@ from core.session_auth import is_logged_in, login_user, logout_user, require_log
 # 导入核心模块
 from core.message import (
     get_conversation_key,
+    get_conversation_prefix_keys,
+    get_new_turns,
     parse_last_message,
-    build_full_context_text
+    build_context_text
 )
 from core.google_api import (
     get_common_headers,
-    create_google_session,
-    upload_context_file,
     get_session_file_metadata,
     download_image_with_jwt,
-    save_image_to_hf
+    save_image_to_hf,
+    GeneratedFileCollector
 )
 from core.account import (
     AccountManager,
+    AccountReservation,
+    AccountsSaturatedError,
     MultiAccountManager,
+    QUOTA_TYPES,
     RetryPolicy,
     CooldownConfig,
     format_account_expiration,
@@ -66,6 +82,19 @@ from core.account import (
     bulk_delete_accounts as _bulk_delete_accounts
 )
 from core.proxy_utils import parse_proxy_setting
+from core.session_pool import GoogleSessionPool
+from core.upload_cache import UploadCache
+from core.session_cache import WHEEL_TICK_SECONDS
+from core.state_backend import create_state_backend
+from core.stats_store import StatsStore
+from core import metrics
+from core.latency_histogram import (
+    ACCOUNT, DURATION, MODEL, SLOT_SECONDS, TTFT, WINDOW_CHOICES,
+    latency_histograms, window_covered_seconds, window_slots,
+)
+from core.time_series import TimeSeries
+from core.url_fetcher import url_fetcher
+from core.jwt import start_background_refresh as start_jwt_background_refresh
 
 # 导入 Uptime 追踪器
 from core import uptime as uptime_tracker
@@ -89,7 +118,12 @@ log_buffer = deque(maxlen=1000)
 log_lock = Lock()
 
 # 统计数据持久化
-stats_lock = asyncio.Lock()  # 改为异步锁
+# 计数序列键 -> 旧版时间戳列表键
+STATS_SERIES_KEYS = {
+    "request_series": "request_timestamps",
+    "failure_series": "failure_timestamps",
+    "rate_limit_series": "rate_limit_timestamps",
+}
 
 async def load_stats():
     """加载统计数据（异步）。数据库不可用时使用内存默认值。"""
@@ -110,59 +144,41 @@ async def load_stats():
             "total_requests": 0,
             "success_count": 0,
             "failed_count": 0,
-            "request_timestamps": [],
-            "model_request_timestamps": {},
-            "failure_timestamps": [],
-            "rate_limit_timestamps": [],
             "visitor_ips": {},
             "account_conversations": {},
             "account_failures": {},
             "recent_conversations": []
         }
 
-    if isinstance(data.get("request_timestamps"), list):
-        data["request_timestamps"] = deque(data["request_timestamps"], maxlen=20000)
-    if isinstance(data.get("failure_timestamps"), list):
-        data["failure_timestamps"] = deque(data["failure_timestamps"], maxlen=10000)
-    if isinstance(data.get("rate_limit_timestamps"), list):
-        data["rate_limit_timestamps"] = deque(data["rate_limit_timestamps"], maxlen=10000)
+    # 计数序列只在内存中使用（趋势图来自 stats_hourly），丢弃旧版保存的时间戳列表
+    for series_key, legacy_key in STATS_SERIES_KEYS.items():
+        data.pop(legacy_key, None)
+        data[series_key] = TimeSeries()
+    data.pop("model_request_timestamps", None)
+    data["model_request_series"] = {}
 
     return data
 
-async def save_stats(stats):
-    """保存统计数据（异步）。数据库不可用时不落盘。"""
-    stats_to_save = stats.copy()
-    if isinstance(stats_to_save.get("request_timestamps"), deque):
-        stats_to_save["request_timestamps"] = list(stats_to_save["request_timestamps"])
-    if isinstance(stats_to_save.get("failure_timestamps"), deque):
-        stats_to_save["failure_timestamps"] = list(stats_to_save["failure_timestamps"])
-    if isinstance(stats_to_save.get("rate_limit_timestamps"), deque):
-        stats_to_save["rate_limit_timestamps"] = list(stats_to_save["rate_limit_timestamps"])
-
-    if storage.is_database_enabled():
-        try:
-            saved = await asyncio.to_thread(storage.save_stats_sync, stats_to_save)
-            if saved:
-                return
-        except Exception as e:
-            logger.error(f"[STATS] 数据库保存失败: {str(e)[:50]}")
-    return
-
 # 初始化统计数据（需要在启动时异步加载）
 global_stats = {
     "total_visitors": 0,
     "total_requests": 0,
     "success_count": 0,
     "failed_count": 0,
-    "request_timestamps": deque(maxlen=20000),
-    "model_request_timestamps": {},
-    "failure_timestamps": deque(maxlen=10000),
-    "rate_limit_timestamps": deque(maxlen=10000),
+    "request_series": TimeSeries(),
+    "model_request_series": {},
+    "failure_series": TimeSeries(),
+    "rate_limit_series": TimeSeries(),
     "visitor_ips": {},
     "account_conversations": {},
     "account_failures": {},
     "recent_conversations": []
 }
+# 请求只更新内存统计并标记为脏，由后台任务定期写入数据库（计数序列只在内存中使用）
+stats_store = StatsStore(lambda: global_stats, transient_keys=list(STATS_SERIES_KEYS) + ["model_request_series"])
+
+# SSE 帧发送统计（内存，重启后清空）
+sse_frame_stats = SSEFrameStats()
 
 # 任务历史记录（内存存储，容器重启后清空）
 task_history = deque(maxlen=100)  # 最多保留100条历史记录
@@ -244,6 +260,7 @@ def build_recent_conversation_entry(
     status: str,
     duration_s: Optional[float] = None,
     error_detail: Optional[str] = None,
+    timing: Optional[dict] = None,
 ) -> dict:
     start_time = get_beijing_time_str(start_ts)
     if model:
@@ -292,13 +309,28 @@ def build_recent_conversation_entry(
             "content": detail[:120],
         })
 
-    return {
+    entry = {
         "request_id": request_id,
         "start_time": start_time,
         "start_ts": start_ts,
         "status": status,
         "events": events,
     }
+    if timing:
+        entry["timing"] = {name: round(value) for name, value in timing.items()}
+    return entry
+
+
+def add_request_timing(request: Request, name: str, value: float) -> None:
+    """累加请求耗时明细（request.state.timing，重试时同名阶段累计）"""
+    timing = getattr(request.state, "timing", None)
+    if timing is None:
+        timing = request.state.timing = {}
+    timing[name] = timing.get(name, 0) + value
+
+
+def format_request_timing(timing: dict) -> str:
+    return " | ".join(f"{name}={int(value)}" for name, value in timing.items())
 
 class MemoryLogHandler(logging.Handler):
     """自定义日志处理器，将日志写入内存缓冲区"""
@@ -418,6 +450,7 @@ def build_retry_policy() -> RetryPolicy:
             text=config.retry.text_rate_limit_cooldown_seconds,
             images=config.retry.images_rate_limit_cooldown_seconds,
             videos=config.retry.videos_rate_limit_cooldown_seconds,
+            probe_seconds=config.retry.circuit_probe_seconds,
         ),
     )
 
@@ -506,6 +539,16 @@ multi_account_mgr = load_multi_account_config(
     global_stats
 )
 
+# Google Session 预热池（新对话/切换账户时优先取用）
+session_pool = GoogleSessionPool(USER_AGENT)
+multi_account_mgr.account_retired_listeners.append(session_pool.discard_account)
+# 运行时状态后端（多 worker 运行时在 worker 之间共享账户状态、对话绑定和统计计数）
+state_backend = create_state_backend()
+
+# 附件上传缓存（同一 Session 内相同内容只上传一次）
+upload_cache = UploadCache()
+multi_account_mgr.account_retired_listeners.append(upload_cache.forget_account)
+
 # ---------- 自动注册/刷新服务 ----------
 register_service = None
 login_service = None
@@ -769,26 +812,42 @@ async def startup_event():
 
     # 加载统计数据
     global_stats = await load_stats()
-    global_stats.setdefault("request_timestamps", [])
-    global_stats.setdefault("model_request_timestamps", {})
-    global_stats.setdefault("failure_timestamps", [])
-    global_stats.setdefault("rate_limit_timestamps", [])
     global_stats.setdefault("recent_conversations", [])
     global_stats.setdefault("success_count", 0)
     global_stats.setdefault("failed_count", 0)
     global_stats.setdefault("account_conversations", {})
     global_stats.setdefault("account_failures", {})
+    global_stats.setdefault("account_quota_models", {})
     uptime_tracker.configure_storage(os.path.join(DATA_DIR, "uptime.json"))
     uptime_tracker.load_heartbeats()
     for account_id, account_mgr in multi_account_mgr.accounts.items():
         account_mgr.conversation_count = global_stats["account_conversations"].get(account_id, 0)
         account_mgr.failure_count = global_stats["account_failures"].get(account_id, 0)
+        account_mgr.quota_model.load(global_stats["account_quota_models"].get(account_id))
     logger.info("[SYSTEM] 已恢复账户成功/失败统计")
     logger.info(f"[SYSTEM] 统计数据已加载: {global_stats['total_requests']} 次请求, {global_stats['total_visitors']} 位访客")
 
+    # 启动共享状态同步（仅多 worker 共享模式有效）
+    await state_backend.start(lambda: multi_account_mgr, lambda: global_stats)
+
     # 启动缓存清理任务
     asyncio.create_task(multi_account_mgr.start_background_cleanup())
-    logger.info("[SYSTEM] 后台缓存清理任务已启动（间隔: 5分钟）")
+    logger.info(f"[SYSTEM] 后台缓存清理任务已启动（间隔: {WHEEL_TICK_SECONDS}秒）")
+
+    # 启动对话绑定与统计数据持久化任务（仅数据库模式有效）
+    if storage.is_database_enabled():
+        asyncio.create_task(multi_account_mgr.binding_store.run_flusher(lambda: multi_account_mgr.cache_ttl))
+        logger.info("[SYSTEM] 对话绑定持久化任务已启动")
+        asyncio.create_task(stats_store.run_flusher())
+        logger.info(f"[SYSTEM] 统计数据持久化任务已启动（间隔: {config.performance.stats_flush_seconds}秒）")
+
+    # 启动 JWT 密钥材料后台刷新任务
+    asyncio.create_task(start_jwt_background_refresh(lambda: multi_account_mgr.accounts))
+    logger.info("[SYSTEM] JWT 后台刷新任务已启动")
+
+    # 启动 Session 预热池维护任务
+    asyncio.create_task(session_pool.start_background_maintenance(lambda: multi_account_mgr.accounts))
+    logger.info("[SYSTEM] Session 预热池维护任务已启动")
 
     # 启动自动刷新账号任务（仅数据库模式有效）
     if os.environ.get("ACCOUNTS_CONFIG"):
@@ -802,13 +861,23 @@ async def startup_event():
     # 启动自动登录刷新轮询（始终启动，但默认禁用）
     if login_service:
         try:
-            asyncio.create_task(login_service.start_polling())
+            # 多 worker 时只在取得租约的一个 worker 上轮询
+            asyncio.create_task(state_backend.run_as_leader("login_polling", login_service.start_polling))
             logger.info("[SYSTEM] 账户刷新轮询服务已启动（默认禁用，可在设置中启用）")
         except Exception as e:
             logger.error(f"[SYSTEM] 启动登录服务失败: {e}")
     else:
         logger.info("[SYSTEM] 自动登录刷新未启用或依赖不可用")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时写入尚未持久化的对话绑定和统计数据"""
+    written = await multi_account_mgr.binding_store.flush(multi_account_mgr.cache_ttl)
+    if written:
+        logger.info(f"[SYSTEM] 已写入 {written} 条对话绑定")
+    if await stats_store.flush():
+        logger.info("[SYSTEM] 已写入统计数据")
+
 # ---------- 日志脱敏函数 ----------
 def get_sanitized_logs(limit: int = 100) -> list:
     """获取脱敏后的日志列表，按请求ID分组并提取关键事件"""
@@ -1025,21 +1094,6 @@ class ChatRequest(BaseModel):
     temperature: Optional[float] = 0.7
     top_p: Optional[float] = 1.0
 
-def create_chunk(id: str, created: int, model: str, delta: dict, finish_reason: Union[str, None]) -> str:
-    chunk = {
-        "id": id,
-        "object": "chat.completion.chunk",
-        "created": created,
-        "model": model,
-        "choices": [{
-            "index": 0,
-            "delta": delta,
-            "logprobs": None,  # OpenAI 标准字段
-            "finish_reason": finish_reason
-        }],
-        "system_fingerprint": None  # OpenAI 标准字段（可选）
-    }
-    return json.dumps(chunk)
 # ---------- Auth endpoints (API) ----------
 
 @app.post("/login")
@@ -1066,9 +1120,6 @@ async def admin_logout(request: Request):
 @app.get("/admin/stats")
 @require_login()
 async def admin_stats(request: Request):
-    now = time.time()
-    window_seconds = 12 * 3600
-
     active_accounts = 0
     failed_accounts = 0
     rate_limited_accounts = 0
@@ -1100,52 +1151,19 @@ async def admin_stats(request: Request):
     start_ts = start_dt.timestamp()
     labels = [(start_dt + timedelta(hours=i)).strftime("%H:00") for i in range(12)]
 
-    def bucketize(timestamps: list) -> list:
-        buckets = [0] * 12
-        for ts in timestamps:
-            idx = int((ts - start_ts) // 3600)
-            if 0 <= idx < 12:
-                buckets[idx] += 1
-        return buckets
-
-    async with stats_lock:
-        global_stats.setdefault("request_timestamps", deque(maxlen=20000))
-        global_stats.setdefault("failure_timestamps", deque(maxlen=10000))
-        global_stats.setdefault("rate_limit_timestamps", deque(maxlen=10000))
-        global_stats.setdefault("model_request_timestamps", {})
-        global_stats.setdefault("success_count", 0)
-        global_stats.setdefault("failed_count", 0)
-
-        # 清理过期数据，保持 deque 类型
-        cleaned_request_ts = [ts for ts in global_stats["request_timestamps"] if now - ts < window_seconds]
-        global_stats["request_timestamps"] = deque(cleaned_request_ts, maxlen=20000)
-
-        cleaned_failure_ts = [ts for ts in global_stats["failure_timestamps"] if now - ts < window_seconds]
-        global_stats["failure_timestamps"] = deque(cleaned_failure_ts, maxlen=10000)
-
-        cleaned_rate_limit_ts = [ts for ts in global_stats["rate_limit_timestamps"] if now - ts < window_seconds]
-        global_stats["rate_limit_timestamps"] = deque(cleaned_rate_limit_ts, maxlen=10000)
-
-        model_request_timestamps = {}
-        for model, timestamps in global_stats["model_request_timestamps"].items():
-            model_request_timestamps[model] = [
-                ts for ts in timestamps
-                if now - ts < window_seconds
-            ]
-        global_stats["model_request_timestamps"] = model_request_timestamps
-
-        await save_stats(global_stats)
-
-        request_timestamps = list(global_stats["request_timestamps"])
-        failure_timestamps = list(global_stats["failure_timestamps"])
-        rate_limit_timestamps = list(global_stats["rate_limit_timestamps"])
-        model_request_timestamps = global_stats.get("model_request_timestamps", {})
-        model_requests = {}
-        for model in MODEL_MAPPING.keys():
-            model_requests[model] = bucketize(model_request_timestamps.get(model, []))
-        for model, timestamps in model_request_timestamps.items():
-            if model not in model_requests:
-                model_requests[model] = bucketize(timestamps)
+    # 数据库模式从每小时汇总表查询（多 worker 共享），否则使用本进程的计数序列
+    trend = await stats_store.hourly_trend(start_ts, 12)
+    if trend is None:
+        model_series = global_stats["model_request_series"]
+        trend = {
+            "requests": global_stats["request_series"].hourly(start_ts, 12),
+            "failures": global_stats["failure_series"].hourly(start_ts, 12),
+            "rate_limited": global_stats["rate_limit_series"].hourly(start_ts, 12),
+            "models": {model: series.hourly(start_ts, 12) for model, series in model_series.items()},
+        }
+    model_requests = {model: trend["models"].get(model, [0] * 12) for model in MODEL_MAPPING.keys()}
+    for model, counts in trend["models"].items():
+        model_requests.setdefault(model, counts)
 
     return {
         "total_accounts": total_accounts,
@@ -1157,11 +1175,38 @@ async def admin_stats(request: Request):
         "failed_count": global_stats.get("failed_count", 0),
         "trend": {
             "labels": labels,
-            "total_requests": bucketize(request_timestamps),
-            "failed_requests": bucketize(failure_timestamps),
-            "rate_limited_requests": bucketize(rate_limit_timestamps),
+            "total_requests": trend["requests"],
+            "failed_requests": trend["failures"],
+            "rate_limited_requests": trend["rate_limited"],
             "model_requests": model_requests,
-        }
+        },
+        "stream": sse_frame_stats.snapshot(),
+        "session_pool": session_pool.get_stats(),
+        "upload_cache": upload_cache.get_stats(),
+        "url_fetch": url_fetcher.get_stats(),
+        "account_queue": multi_account_mgr.get_queue_stats(),
+        "session_cache": multi_account_mgr.session_cache.get_stats(),
+        "session_bindings": multi_account_mgr.binding_store.get_stats(),
+        "state_backend": state_backend.get_status(),
+        "stats_store": stats_store.get_stats(),
+    }
+
+@app.get("/admin/latency")
+@require_login()
+async def admin_latency(request: Request, window_minutes: int = 60):
+    """按模型/账户的 TTFT 与请求耗时分位数（本进程的滚动窗口，按最近 N 个时间槽统计）"""
+    if window_minutes not in WINDOW_CHOICES:
+        raise HTTPException(400, f"window_minutes 可选值: {', '.join(map(str, WINDOW_CHOICES))}")
+    now = time.time()
+    summary = latency_histograms.summary(window_minutes)
+    return {
+        "window_minutes": window_minutes,
+        # 窗口为最近 window_slots 个时间槽（含当前未满的槽），实际覆盖 covered_seconds 秒
+        "window_slots": window_slots(window_minutes),
+        "slot_seconds": SLOT_SECONDS,
+        "covered_seconds": round(window_covered_seconds(window_minutes, now)),
+        "models": summary[MODEL],
+        "accounts": summary[ACCOUNT],
     }
 
 @app.get("/admin/accounts")
@@ -1190,7 +1235,9 @@ async def admin_get_accounts(request: Request):
             "cooldown_reason": cooldown_reason,
             "conversation_count": account_manager.conversation_count,
             "session_usage_count": account_manager.session_usage_count,
-            "quota_status": quota_status  # 新增配额状态
+            "quota_status": quota_status,  # 新增配额状态
+            "selection": account_manager.get_selection_status(),
+            "circuit": account_manager.get_circuit_status()
         })
 
     return {"total": len(accounts_info), "accounts": accounts_info}
@@ -1386,7 +1433,7 @@ async def admin_enable_account(request: Request, account_id: str):
             account_mgr = multi_account_mgr.accounts[account_id]
             account_mgr.is_available = True
             account_mgr.error_count = 0
-            account_mgr.last_429_time = 0.0
+            account_mgr.reset_circuit_breakers()
             logger.info(f"[CONFIG] 账户 {account_id} 错误状态已重置")
 
         return {"status": "success", "message": f"账户 {account_id} 已启用", "account_count": len(multi_account_mgr.accounts)}
@@ -1408,7 +1455,7 @@ async def admin_bulk_enable_accounts(request: Request, account_ids: list[str]):
             account_mgr = multi_account_mgr.accounts[account_id]
             account_mgr.is_available = True
             account_mgr.error_count = 0
-            account_mgr.last_429_time = 0.0
+            account_mgr.reset_circuit_breakers()
     return {"status": "success", "success_count": success_count, "errors": errors}
 
 @app.put("/admin/accounts/bulk-disable")
@@ -1470,6 +1517,7 @@ async def admin_get_settings(request: Request):
             "text_rate_limit_cooldown_seconds": config.retry.text_rate_limit_cooldown_seconds,
             "images_rate_limit_cooldown_seconds": config.retry.images_rate_limit_cooldown_seconds,
             "videos_rate_limit_cooldown_seconds": config.retry.videos_rate_limit_cooldown_seconds,
+            "circuit_probe_seconds": config.retry.circuit_probe_seconds,
             "session_cache_ttl_seconds": config.retry.session_cache_ttl_seconds,
             "auto_refresh_accounts_seconds": config.retry.auto_refresh_accounts_seconds,
             "scheduled_refresh_enabled": config.retry.scheduled_refresh_enabled,
@@ -1481,6 +1529,35 @@ async def admin_get_settings(request: Request):
         },
         "session": {
             "expire_hours": config.session.expire_hours
+        },
+        "performance": {
+            "stream_coalesce_window_ms": config.performance.stream_coalesce_window_ms,
+            "stream_coalesce_max_chars": config.performance.stream_coalesce_max_chars,
+            "stream_parser_engine": config.performance.stream_parser_engine,
+            "session_pool_max_size": config.performance.session_pool_max_size,
+            "session_pool_ttl_seconds": config.performance.session_pool_ttl_seconds,
+            "upload_concurrency_per_request": config.performance.upload_concurrency_per_request,
+            "upload_concurrency_per_account": config.performance.upload_concurrency_per_account,
+            "url_fetch_max_mb": config.performance.url_fetch_max_mb,
+            "url_fetch_cache_mb": config.performance.url_fetch_cache_mb,
+            "account_selection_policy": config.performance.account_selection_policy,
+            "account_max_in_flight_text": config.performance.account_max_in_flight_text,
+            "account_max_in_flight_images": config.performance.account_max_in_flight_images,
+            "account_max_in_flight_videos": config.performance.account_max_in_flight_videos,
+            "account_rate_per_minute_text": config.performance.account_rate_per_minute_text,
+            "account_rate_per_minute_images": config.performance.account_rate_per_minute_images,
+            "account_rate_per_minute_videos": config.performance.account_rate_per_minute_videos,
+            "account_rate_burst": config.performance.account_rate_burst,
+            "account_queue_max_waiters": config.performance.account_queue_max_waiters,
+            "account_queue_timeout_seconds": config.performance.account_queue_timeout_seconds,
+            "quota_prediction_enabled": config.performance.quota_prediction_enabled,
+            "session_cache_max_entries": config.performance.session_cache_max_entries,
+            "session_binding_flush_seconds": config.performance.session_binding_flush_seconds,
+            "context_max_chars": config.performance.context_max_chars,
+            "context_max_tokens": config.performance.context_max_tokens,
+            "state_sync_interval_ms": config.performance.state_sync_interval_ms,
+            "stats_flush_seconds": config.performance.stats_flush_seconds,
+            "stats_retention_days": config.performance.stats_retention_days
         }
     }
 
@@ -1543,8 +1620,14 @@ async def admin_update_settings(request: Request, new_settings: dict = Body(...)
         retry.setdefault("text_rate_limit_cooldown_seconds", config.retry.text_rate_limit_cooldown_seconds)
         retry.setdefault("images_rate_limit_cooldown_seconds", config.retry.images_rate_limit_cooldown_seconds)
         retry.setdefault("videos_rate_limit_cooldown_seconds", config.retry.videos_rate_limit_cooldown_seconds)
+        retry.setdefault("circuit_probe_seconds", config.retry.circuit_probe_seconds)
         new_settings["retry"] = retry
 
+        performance = dict(new_settings.get("performance") or {})
+        for key, value in config.performance.model_dump().items():
+            performance.setdefault(key, value)
+        new_settings["performance"] = performance
+
         # 保存旧配置用于对比
         old_proxy_for_auth = PROXY_FOR_AUTH
         old_proxy_for_chat = PROXY_FOR_CHAT
@@ -1553,6 +1636,7 @@ async def admin_update_settings(request: Request, new_settings: dict = Body(...)
             "text_rate_limit_cooldown_seconds": RETRY_POLICY.cooldowns.text,
             "images_rate_limit_cooldown_seconds": RETRY_POLICY.cooldowns.images,
             "videos_rate_limit_cooldown_seconds": RETRY_POLICY.cooldowns.videos,
+            "circuit_probe_seconds": RETRY_POLICY.cooldowns.probe_seconds,
             "session_cache_ttl_seconds": SESSION_CACHE_TTL_SECONDS
         }
 
@@ -1646,6 +1730,7 @@ async def admin_update_settings(request: Request, new_settings: dict = Body(...)
             old_retry_config["text_rate_limit_cooldown_seconds"] != RETRY_POLICY.cooldowns.text or
             old_retry_config["images_rate_limit_cooldown_seconds"] != RETRY_POLICY.cooldowns.images or
             old_retry_config["videos_rate_limit_cooldown_seconds"] != RETRY_POLICY.cooldowns.videos or
+            old_retry_config["circuit_probe_seconds"] != RETRY_POLICY.cooldowns.probe_seconds or
             old_retry_config["session_cache_ttl_seconds"] != SESSION_CACHE_TTL_SECONDS
         )
 
@@ -1818,10 +1903,20 @@ async def chat_impl(
 
     start_ts = time.time()
     request.state.first_response_time = None
+    request.state.timing = {}
     message_count = len(req.messages)
 
     monitor_recorded = False
     account_manager: Optional[AccountManager] = None
+    # get_account 预留的名额，acquire_slot 消耗前放弃账户或请求结束时归还
+    reservation: Optional[AccountReservation] = None
+
+    def hold_reservation(new_reservation: Optional[AccountReservation]) -> None:
+        """持有新的账户预留，尚未被消耗的旧预留归还"""
+        nonlocal reservation
+        if reservation is not None:
+            reservation.cancel()
+        reservation = new_reservation
 
     async def finalize_result(
         status: str,
@@ -1829,6 +1924,7 @@ async def chat_impl(
         error_detail: Optional[str] = None
     ) -> None:
         nonlocal monitor_recorded
+        hold_reservation(None)
         if monitor_recorded:
             return
         monitor_recorded = True
@@ -1850,43 +1946,65 @@ async def chat_impl(
             status=status,
             duration_s=duration_s if status == "success" else None,
             error_detail=error_detail,
+            timing=request.state.timing,
         )
+        if request.state.timing:
+            logger.info(f"[CHAT] [req_{request_id}] 耗时明细: {format_request_timing(request.state.timing)}")
 
-        async with stats_lock:
-            global_stats.setdefault("failure_timestamps", [])
-            global_stats.setdefault("rate_limit_timestamps", [])
-            global_stats.setdefault("recent_conversations", [])
-            global_stats.setdefault("success_count", 0)
-            global_stats.setdefault("failed_count", 0)
-            global_stats.setdefault("account_conversations", {})
-            global_stats.setdefault("account_failures", {})
-            if status != "success":
-                global_stats["failed_count"] += 1
-                global_stats["failure_timestamps"].append(time.time())
-                if status_code == 429:
-                    global_stats["rate_limit_timestamps"].append(time.time())
-                failure_account_id = None
-                if account_manager:
-                    account_manager.failure_count += 1
-                    failure_account_id = account_manager.config.account_id
-                    global_stats["account_failures"][failure_account_id] = account_manager.failure_count
-                else:
-                    failure_account_id = getattr(request.state, "last_account_id", None)
-                    if failure_account_id and failure_account_id in multi_account_mgr.accounts:
-                        account_mgr = multi_account_mgr.accounts[failure_account_id]
-                        account_mgr.failure_count += 1
-                        global_stats["account_failures"][failure_account_id] = account_mgr.failure_count
-                    elif failure_account_id:
-                        global_stats["account_failures"][failure_account_id] = (
-                            global_stats["account_failures"].get(failure_account_id, 0) + 1
-                        )
+        global_stats.setdefault("recent_conversations", [])
+        global_stats.setdefault("success_count", 0)
+        global_stats.setdefault("failed_count", 0)
+        global_stats.setdefault("account_conversations", {})
+        global_stats.setdefault("account_failures", {})
+        if status != "success":
+            global_stats["failed_count"] += 1
+            global_stats["failure_series"].add()
+            if status_code == 429:
+                global_stats["rate_limit_series"].add()
+            failure_account_id = None
+            if account_manager:
+                account_manager.failure_count += 1
+                failure_account_id = account_manager.config.account_id
+                global_stats["account_failures"][failure_account_id] = account_manager.failure_count
             else:
-                global_stats["success_count"] += 1
-                if account_manager:
-                    global_stats["account_conversations"][account_manager.config.account_id] = account_manager.conversation_count
-            global_stats["recent_conversations"].append(entry)
-            global_stats["recent_conversations"] = global_stats["recent_conversations"][-60:]
-            await save_stats(global_stats)
+                failure_account_id = getattr(request.state, "last_account_id", None)
+                if failure_account_id and failure_account_id in multi_account_mgr.accounts:
+                    account_mgr = multi_account_mgr.accounts[failure_account_id]
+                    account_mgr.failure_count += 1
+                    global_stats["account_failures"][failure_account_id] = account_mgr.failure_count
+                elif failure_account_id:
+                    global_stats["account_failures"][failure_account_id] = (
+                        global_stats["account_failures"].get(failure_account_id, 0) + 1
+                    )
+        else:
+            global_stats["success_count"] += 1
+            if account_manager:
+                global_stats["account_conversations"][account_manager.config.account_id] = account_manager.conversation_count
+        global_stats["recent_conversations"].append(entry)
+        global_stats["recent_conversations"] = global_stats["recent_conversations"][-60:]
+        if account_manager:
+            rollup_account_id = account_manager.config.account_id
+        else:
+            rollup_account_id = getattr(request.state, "last_account_id", None) or ""
+        rollup_model = req.model if req and (req.model in MODEL_MAPPING or req.model in VIRTUAL_MODELS) else ""
+        stats_store.record_request(
+            model=rollup_model,
+            account_id=rollup_account_id,
+            failed=status != "success",
+            rate_limited=status_code == 429,
+            ttft_ms=latency_ms if first_response_time else None,
+        )
+
+        metrics_model = rollup_model or "unknown"
+        metrics.REQUESTS_TOTAL.labels(metrics_model, rollup_account_id or "none", str(status_code)).inc()
+        metrics.REQUEST_DURATION_SECONDS.labels(metrics_model).observe(duration_s)
+        if first_response_time:
+            metrics.TTFT_SECONDS.labels(metrics_model).observe(first_response_time - start_ts)
+        if rollup_model:
+            if first_response_time:
+                latency_histograms.record(MODEL, rollup_model, TTFT, (first_response_time - start_ts) * 1000)
+            if status == "success":
+                latency_histograms.record(MODEL, rollup_model, DURATION, duration_s * 1000)
 
     def classify_error_status(status_code: Optional[int], error: Exception) -> str:
         if status_code == 504:
@@ -1904,13 +2022,16 @@ async def chat_impl(
         client_ip = request.client.host if request.client else "unknown"
 
     # 记录请求统计
-    async with stats_lock:
-        timestamp = time.time()
-        global_stats["total_requests"] += 1
-        global_stats["request_timestamps"].append(timestamp)
-        global_stats.setdefault("model_request_timestamps", {})
-        global_stats["model_request_timestamps"].setdefault(req.model, []).append(timestamp)
-        await save_stats(global_stats)
+    timestamp = time.time()
+    global_stats["total_requests"] += 1
+    global_stats["request_series"].add(timestamp)
+    # 只按已支持的模型分别计数（不支持的模型随后被拒绝，避免任意模型名占用内存）
+    if req.model in MODEL_MAPPING or req.model in VIRTUAL_MODELS:
+        model_series = global_stats["model_request_series"]
+        if req.model not in model_series:
+            model_series[req.model] = TimeSeries()
+        model_series[req.model].add(timestamp)
+    stats_store.mark_dirty()
 
     # 2. 模型校验
 
@@ -1927,30 +2048,50 @@ async def chat_impl(
     request.state.model = req.model
 
     required_quota_types = get_required_quota_types(req.model)
+    quota_type = get_request_quota_type(req.model)
 
-    # 3. 生成会话指纹，获取Session锁（防止同一对话的并发请求冲突）
-    conv_key = get_conversation_key([m.model_dump() for m in req.messages], client_ip)
-    session_lock = await multi_account_mgr.acquire_session_lock(conv_key)
+    # 3. 生成各前缀哈希，获取Session锁（防止同一对话的并发请求冲突）
+    message_dicts = [m.model_dump() for m in req.messages]
+    # 绑定按完整消息序列的前缀哈希索引：本次请求完成后 Session 位于 binding_key 对应的前缀
+    prefix_keys = get_conversation_prefix_keys(message_dicts, client_ip)
+    binding_key = prefix_keys[-1] if prefix_keys else get_conversation_key(message_dicts, client_ip)
+    # 锁属于将要持有绑定的条目（锁被持有时条目不会被淘汰）；开头相同的不同对话互不阻塞
+    session_lock = await multi_account_mgr.acquire_session_lock(binding_key)
 
     # 4. 在锁的保护下检查缓存和处理Session（保证同一对话的请求串行化）
     async with session_lock:
-        cached_session = multi_account_mgr.global_session_cache.get(conv_key)
+        # 查找已绑定的最长历史前缀，复用其 Session，只补发之后的新消息
+        prefix_len, cached_session = await multi_account_mgr.find_session_prefix(prefix_keys)
+        if not cached_session and not multi_account_mgr.binding_store.shared:
+            # 内存未命中（如重启后）：尝试从持久化记录恢复上一轮的绑定
+            prefix_len = len(req.messages) - 2
+            if prefix_len >= 1 and req.messages[prefix_len].role == "assistant":
+                cached_session = await multi_account_mgr.restore_session_cache(prefix_keys[prefix_len - 1])
+                if cached_session:
+                    logger.info(f"[CHAT] [{cached_session.account_id}] [req_{request_id}] 已从持久化记录恢复会话绑定")
 
         if cached_session:
             # 使用已绑定的账户
-            account_id = cached_session["account_id"]
+            account_id = cached_session.account_id
+            google_session = cached_session.session_id
+            # 查找后立即（同步）认领旧前缀的绑定：Session 无法回退，同一前缀的其他分支请求不会再复用它
+            multi_account_mgr.invalidate_session_cache(prefix_keys[prefix_len - 1])
             try:
-                account_manager = await multi_account_mgr.get_account(account_id, request_id, required_quota_types)
-                google_session = cached_session["session_id"]
+                hold_reservation(await multi_account_mgr.get_account(account_id, request_id, required_quota_types))
+                account_manager = reservation.account
+                await multi_account_mgr.set_session_cache(binding_key, account_id, google_session)
                 is_new_conversation = False
                 request.state.last_account_id = account_manager.config.account_id
                 logger.info(f"[CHAT] [{account_id}] [req_{request_id}] 继续会话: {google_session[-12:]}")
             except HTTPException as e:
+                hold_reservation(None)
                 logger.warning(
                     f"[CHAT] [req_{request_id}] 缓存会话账户不可用，切换新账户: {account_id} ({str(e.detail)})"
                 )
-                multi_account_mgr.global_session_cache.pop(conv_key, None)
                 cached_session = None
+            except BaseException:
+                hold_reservation(None)
+                raise
 
         if not cached_session:
             # 新对话：轮询选择可用账户，失败时尝试其他账户
@@ -1958,12 +2099,14 @@ async def chat_impl(
             last_error = None
 
             for attempt in range(max_account_tries):
+                account_manager = None
                 try:
-                    account_manager = await multi_account_mgr.get_account(None, request_id, required_quota_types)
-                    google_session = await create_google_session(account_manager, http_client, USER_AGENT, request_id)
+                    hold_reservation(await multi_account_mgr.get_account(None, request_id, required_quota_types))
+                    account_manager = reservation.account
+                    google_session = await session_pool.acquire(account_manager, http_client, request_id)
                     # 线程安全地绑定账户到此对话
                     await multi_account_mgr.set_session_cache(
-                        conv_key,
+                        binding_key,
                         account_manager.config.account_id,
                         google_session
                     )
@@ -1973,11 +2116,16 @@ async def chat_impl(
                     # 记录账号池状态（账户可用）
                     uptime_tracker.record_request("account_pool", True)
                     break
+                except AccountsSaturatedError as e:
+                    # 所有账户均达到并发上限且排队超时：直接拒绝，不再轮换账户
+                    await finalize_result("error", 429, f"HTTP 429: {e.detail}")
+                    raise
                 except Exception as e:
                     last_error = e
                     error_type = type(e).__name__
+                    hold_reservation(None)
                     # 安全获取账户ID
-                    account_id = account_manager.config.account_id if 'account_manager' in locals() and account_manager else 'unknown'
+                    account_id = account_manager.config.account_id if account_manager else 'unknown'
                     logger.error(f"[CHAT] [req_{request_id}] 账户 {account_id} 创建会话失败 (尝试 {attempt + 1}/{max_account_tries}) - {error_type}: {str(e)}")
                     # 记录账号池状态（单个账户失败）
                     status_code = e.status_code if isinstance(e, HTTPException) else None
@@ -2027,11 +2175,17 @@ async def chat_impl(
         text_to_send = last_text
         is_retry_mode = True
     else:
-        # 继续对话只发送当前消息
-        text_to_send = last_text
+        # 继续对话只发送已绑定前缀之后的新消息（通常只有当前这一条）
+        new_turns = get_new_turns(req.messages, prefix_len)
+        if len(new_turns) > 1:
+            text_to_send, _ = build_context_text(
+                new_turns, config.performance.context_max_chars, config.performance.context_max_tokens
+            )
+        else:
+            text_to_send = last_text
         is_retry_mode = False
-        # 线程安全地更新时间戳
-        await multi_account_mgr.update_session_time(conv_key)
+        if len(new_turns) > 1:
+            logger.info(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] 补发前缀之后的 {len(new_turns)} 条消息")
 
     chat_id = f"chatcmpl-{uuid.uuid4()}"
     created_time = int(time.time())
@@ -2049,196 +2203,236 @@ async def chat_impl(
         # 图片 ID 列表 (每次 Session 变化都需要重新上传，因为 fileId 绑定在 Session 上)
         current_file_ids = []
 
+        # 完整上下文只构建一次，多次重试复用
+        full_context_text = None
+
         # 记录已失败的账户，避免重复使用
         failed_accounts = set()
 
         # 重试逻辑：最多尝试 max_retries+1 次（初次+重试）
-        while retry_count <= max_retries:
-            try:
-                # 安全：使用.get()防止缓存被清理导致KeyError
-                cached = multi_account_mgr.global_session_cache.get(conv_key)
-                if not cached:
-                    logger.warning(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] 缓存已清理，重建Session")
-                    new_sess = await create_google_session(account_manager, http_client, USER_AGENT, request_id)
-                    await multi_account_mgr.set_session_cache(
-                        conv_key,
-                        account_manager.config.account_id,
-                        new_sess
-                    )
-                    current_session = new_sess
-                    current_retry_mode = True
-                    current_file_ids = []
-                else:
-                    current_session = cached["session_id"]
-
-                # A. 如果有图片且还没上传到当前 Session，先上传
-                # 注意：每次重试如果是新 Session，都需要重新上传图片
-                if current_images and not current_file_ids:
-                    for img in current_images:
-                        fid = await upload_context_file(current_session, img["mime"], img["data"], account_manager, http_client, USER_AGENT, request_id)
-                        current_file_ids.append(fid)
-
-                # B. 准备文本 (重试模式下发全文)
-                if current_retry_mode:
-                    current_text = build_full_context_text(req.messages)
-
-                # C. 发起对话
-                async for chunk in stream_chat_generator(
-                    current_session,
-                    current_text,
-                    current_file_ids,
-                    req.model,
-                    chat_id,
-                    created_time,
-                    account_manager,
-                    req.stream,
-                    request_id,
-                    request
-                ):
-                    yield chunk
-
-                if getattr(request.state, "first_response_time", None) is None:
-                    account_manager.handle_non_http_error("空响应", request_id)
-                    uptime_tracker.record_request("account_pool", False, status_code=502)
-                    await finalize_result("error", 502, "Empty response")
-                    return
-
-                # 请求成功，重置账户失败计数
-                account_manager.is_available = True
-                account_manager.error_count = 0
-                account_manager.conversation_count += 1  # 增加成功次数
-
-                # 记录账号池状态（请求成功）
-                uptime_tracker.record_request("account_pool", True)
-                await finalize_result("success", 200, None)
-
-                break
-
-            except (httpx.HTTPError, ssl.SSLError, HTTPException) as e:
-                # 提取错误信息
-                is_http_exception = isinstance(e, HTTPException)
-                status_code = e.status_code if is_http_exception else None
-                error_detail = (
-                    f"HTTP {e.status_code}: {e.detail}"
-                    if is_http_exception
-                    else f"{type(e).__name__}: {str(e)[:200]}"
-                )
-
-                # 记录当前失败的账户
-                failed_accounts.add(account_manager.config.account_id)
-
-                # 记录账号池状态（请求失败）
-                uptime_tracker.record_request("account_pool", False, status_code=status_code)
-
-                # 判断请求类型以传递 quota_type
-                quota_type = get_request_quota_type(req.model)
-
-                # 使用统一的错误处理入口
-                if is_http_exception:
-                    account_manager.handle_http_error(status_code, str(e.detail) if hasattr(e, 'detail') else "", request_id, quota_type)
-                else:
-                    account_manager.handle_non_http_error("聊天请求", request_id)
-
-                retry_count += 1
-
-                # 检查是否还能继续重试
-                if retry_count <= max_retries:
-                    logger.warning(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] 正在重试 ({retry_count}/{max_retries})")
+        try:
+            while retry_count <= max_retries:
+                try:
+                    # 绑定可能已过期或被清理（如账户重载）
+                    cached = multi_account_mgr.get_session_cache(binding_key)
+                    if not cached:
+                        logger.warning(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] 缓存已清理，重建Session")
+                        new_sess = await session_pool.acquire(account_manager, http_client, request_id)
+                        await multi_account_mgr.set_session_cache(
+                            binding_key,
+                            account_manager.config.account_id,
+                            new_sess
+                        )
+                        current_session = new_sess
+                        current_retry_mode = True
+                        current_file_ids = []
+                    else:
+                        current_session = cached.session_id
+
+                    # A. 如果有图片且还没上传到当前 Session，先上传
+                    # 注意：每次重试如果是新 Session，都需要重新上传图片
+                    if current_images and not current_file_ids:
+                        upload_start = time.time()
+                        try:
+                            current_file_ids = await upload_cache.upload_all(
+                                current_session, current_images, account_manager, http_client, USER_AGENT, request_id
+                            )
+                        finally:
+                            upload_seconds = time.time() - upload_start
+                            add_request_timing(request, "upload_ms", upload_seconds * 1000)
+                            metrics.UPLOAD_SECONDS.observe(upload_seconds)
+
+                    # B. 准备文本 (重试模式下发全文，超出预算时省略较早的对话)
+                    if current_retry_mode:
+                        if full_context_text is None:
+                            full_context_text, omitted_count = build_context_text(
+                                req.messages, config.performance.context_max_chars, config.performance.context_max_tokens
+                            )
+                            if omitted_count:
+                                logger.info(
+                                    f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] "
+                                    f"上下文超出预算，省略较早的 {omitted_count} 条消息"
+                                )
+                        current_text = full_context_text
+                    add_request_timing(request, "payload_chars", len(current_text))
+
+                    # C. 发起对话（占用账户并发槽与令牌，并记录 TTFT，用于负载感知选择）
+                    if not await account_manager.acquire_slot(
+                        quota_type, config.performance.account_queue_timeout_seconds, reservation
+                    ):
+                        logger.warning(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] 等待账户并发槽超时")
+                        await finalize_result("error", 429, "Account concurrency limit reached")
+                        yield ChatDelta(DELTA_ERROR, "Account is busy, please retry later")
+                        return
+                    attempt_start = time.time()
+                    try:
+                        async for delta in stream_chat_generator(
+                            current_session,
+                            current_text,
+                            current_file_ids,
+                            req.model,
+                            chat_id,
+                            account_manager,
+                            request_id,
+                            request
+                        ):
+                            yield delta
+                    finally:
+                        account_manager.release_slot(quota_type)
+
+                    if getattr(request.state, "first_response_time", None) is None:
+                        account_manager.handle_non_http_error("空响应", request_id)
+                        account_manager.latency.record_failure()
+                        uptime_tracker.record_request("account_pool", False, status_code=502)
+                        await finalize_result("error", 502, "Empty response")
+                        return
 
-                    # 快速失败：检查是否还有可用账户（避免无效重试）
-                    available_count = sum(
-                        1 for acc in multi_account_mgr.accounts.values()
-                        if (acc.should_retry() and
-                            not acc.config.is_expired() and
-                            not acc.config.disabled and
-                            acc.are_quotas_available(required_quota_types) and
-                            acc.config.account_id not in failed_accounts)
+                    # 请求成功，重置账户失败计数
+                    first_response_time = request.state.first_response_time
+                    account_manager.latency.record_success(
+                        (first_response_time - attempt_start) * 1000 if first_response_time >= attempt_start else None
                     )
+                    account_manager.record_success(required_quota_types)  # 重置错误计数，关闭半开的熔断器
+                    account_manager.conversation_count += 1  # 增加成功次数
 
-                    if available_count == 0:
-                        logger.error(f"[CHAT] [req_{request_id}] 所有账户均不可用，快速失败")
-                        await finalize_result("error", 503, "All accounts unavailable")
-                        if req.stream: yield f"data: {json.dumps({'error': {'message': 'All accounts unavailable'}})}\n\n"
-                        return
+                    # 记录账号池状态（请求成功）
+                    uptime_tracker.record_request("account_pool", True)
+                    await finalize_result("success", 200, None)
 
-                    # 尝试切换到其他账户（客户端会传递完整上下文）
-                    try:
-                        # 获取新账户，跳过已失败的账户
-                        max_account_tries = min(MAX_ACCOUNT_SWITCH_TRIES, available_count)  # 限制尝试次数
-                        new_account = None
-
-                        for _ in range(max_account_tries):
-                            candidate = await multi_account_mgr.get_account(None, request_id, required_quota_types)
-                            if candidate.config.account_id not in failed_accounts:
-                                new_account = candidate
-                                break
-
-                        if not new_account:
-                            logger.error(f"[CHAT] [req_{request_id}] 所有可用账户均已失败")
-                            await finalize_result("error", 503, "All available accounts failed")
-                            if req.stream: yield f"data: {json.dumps({'error': {'message': 'All available accounts failed'}})}\n\n"
-                            return
+                    break
 
-                        logger.info(f"[CHAT] [req_{request_id}] 切换账户: {account_manager.config.account_id} -> {new_account.config.account_id}")
+                except (httpx.HTTPError, ssl.SSLError, HTTPException) as e:
+                    # 提取错误信息
+                    is_http_exception = isinstance(e, HTTPException)
+                    status_code = e.status_code if is_http_exception else None
+                    error_detail = (
+                        f"HTTP {e.status_code}: {e.detail}"
+                        if is_http_exception
+                        else f"{type(e).__name__}: {str(e)[:200]}"
+                    )
 
-                        # 创建新 Session
-                        new_sess = await create_google_session(new_account, http_client, USER_AGENT, request_id)
+                    # 记录当前失败的账户
+                    failed_accounts.add(account_manager.config.account_id)
+                    account_manager.latency.record_failure()
 
-                        # 更新缓存绑定到新账户
-                        await multi_account_mgr.set_session_cache(
-                            conv_key,
-                            new_account.config.account_id,
-                            new_sess
-                        )
+                    # 记录账号池状态（请求失败）
+                    uptime_tracker.record_request("account_pool", False, status_code=status_code)
 
-                        # 更新账户管理器
-                        account_manager = new_account
-                        request.state.last_account_id = account_manager.config.account_id
+                    # 使用统一的错误处理入口
+                    if is_http_exception:
+                        account_manager.handle_http_error(status_code, str(e.detail) if hasattr(e, 'detail') else "", request_id, quota_type)
+                        if status_code == 429:
+                            # 持久化学习到的配额上限（随统计数据保存）
+                            global_stats.setdefault("account_quota_models", {})[account_manager.config.account_id] = (
+                                account_manager.quota_model.to_dict()
+                            )
+                    else:
+                        account_manager.handle_non_http_error("聊天请求", request_id)
 
-                        # 设置重试模式（发送完整上下文）
-                        current_retry_mode = True
-                        current_file_ids = []  # 清空 ID，强制重新上传到新 Session
+                    retry_count += 1
 
-                    except Exception as create_err:
-                        error_type = type(create_err).__name__
-                        logger.error(f"[CHAT] [req_{request_id}] 账户切换失败 ({error_type}): {str(create_err)}")
-                        # 记录账号池状态（账户切换失败）
-                        status_code = create_err.status_code if isinstance(create_err, HTTPException) else None
+                    # 检查是否还能继续重试
+                    if retry_count <= max_retries:
+                        logger.warning(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] 正在重试 ({retry_count}/{max_retries})")
 
-                        uptime_tracker.record_request("account_pool", False, status_code=status_code)
+                        # 快速失败：检查是否还有可用账户（避免无效重试）
+                        available_count = multi_account_mgr.count_available(required_quota_types, failed_accounts)
 
-                        status = classify_error_status(status_code, create_err)
+                        if available_count == 0:
+                            logger.error(f"[CHAT] [req_{request_id}] 所有账户均不可用，快速失败")
+                            await finalize_result("error", 503, "All accounts unavailable")
+                            yield ChatDelta(DELTA_ERROR, "All accounts unavailable")
+                            return
 
-                        await finalize_result(status, status_code, f"Account Failover Failed: {str(create_err)[:200]}")
-                        if req.stream: yield f"data: {json.dumps({'error': {'message': 'Account Failover Failed'}})}\n\n"
+                        # 尝试切换到其他账户（客户端会传递完整上下文）
+                        try:
+                            # 获取新账户，跳过已失败的账户
+                            max_account_tries = min(MAX_ACCOUNT_SWITCH_TRIES, available_count)  # 限制尝试次数
+                            new_account = None
+
+                            for _ in range(max_account_tries):
+                                candidate = await multi_account_mgr.get_account(
+                                    None, request_id, required_quota_types, exclude=failed_accounts
+                                )
+                                if candidate.account.config.account_id not in failed_accounts:
+                                    # 归还当前账户未消耗的预留（如上传失败时尚未占用并发槽）
+                                    hold_reservation(candidate)
+                                    new_account = candidate.account
+                                    break
+                                candidate.cancel()
+
+                            if not new_account:
+                                logger.error(f"[CHAT] [req_{request_id}] 所有可用账户均已失败")
+                                await finalize_result("error", 503, "All available accounts failed")
+                                yield ChatDelta(DELTA_ERROR, "All available accounts failed")
+                                return
+
+                            logger.info(f"[CHAT] [req_{request_id}] 切换账户: {account_manager.config.account_id} -> {new_account.config.account_id}")
+
+                            # 创建新 Session
+                            new_sess = await session_pool.acquire(new_account, http_client, request_id)
+
+                            # 更新缓存绑定到新账户
+                            await multi_account_mgr.set_session_cache(
+                                binding_key,
+                                new_account.config.account_id,
+                                new_sess
+                            )
+
+                            # 更新账户管理器
+                            account_manager = new_account
+                            request.state.last_account_id = account_manager.config.account_id
+
+                            # 设置重试模式（发送完整上下文）
+                            current_retry_mode = True
+                            current_file_ids = []  # 清空 ID，强制重新上传到新 Session
+
+                        except Exception as create_err:
+                            error_type = type(create_err).__name__
+                            logger.error(f"[CHAT] [req_{request_id}] 账户切换失败 ({error_type}): {str(create_err)}")
+                            # 记录账号池状态（账户切换失败）
+                            status_code = create_err.status_code if isinstance(create_err, HTTPException) else None
+
+                            uptime_tracker.record_request("account_pool", False, status_code=status_code)
+
+                            status = classify_error_status(status_code, create_err)
+
+                            await finalize_result(status, status_code, f"Account Failover Failed: {str(create_err)[:200]}")
+                            yield ChatDelta(DELTA_ERROR, "Account Failover Failed")
+                            return
+                    else:
+                        # 已达到最大重试次数
+                        logger.error(f"[CHAT] [req_{request_id}] 已达到最大重试次数 ({max_retries})，请求失败")
+                        status = classify_error_status(status_code, e)
+                        await finalize_result(status, status_code, error_detail)
+                        yield ChatDelta(DELTA_ERROR, f"Max retries ({max_retries}) exceeded: {e}")
                         return
-                else:
-                    # 已达到最大重试次数
-                    logger.error(f"[CHAT] [req_{request_id}] 已达到最大重试次数 ({max_retries})，请求失败")
-                    status = classify_error_status(status_code, e)
-                    await finalize_result(status, status_code, error_detail)
-                    if req.stream: yield f"data: {json.dumps({'error': {'message': f'Max retries ({max_retries}) exceeded: {e}'}})}\n\n"
-                    return
+        finally:
+            # 提前结束（客户端断开、未预期的异常）时归还尚未消耗的预留
+            hold_reservation(None)
 
     if req.stream:
-        return StreamingResponse(response_wrapper(), media_type="text/event-stream")
-    
-    full_content = ""
-    full_reasoning = ""
-    async for chunk_str in response_wrapper():
-        if chunk_str.startswith("data: [DONE]"): break
-        if chunk_str.startswith("data: "):
-            try:
-                data = json.loads(chunk_str[6:])
-                delta = data["choices"][0]["delta"]
-                if "content" in delta:
-                    full_content += delta["content"]
-                if "reasoning_content" in delta:
-                    full_reasoning += delta["reasoning_content"]
-            except json.JSONDecodeError as e:
-                logger.error(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] JSON解析失败: {str(e)}")
-            except (KeyError, IndexError) as e:
-                logger.error(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] 响应格式错误 ({type(e).__name__}): {str(e)}")
+        sse_encoder = SSEChunkEncoder(chat_id, created_time, req.model)
+        deltas = coalesce_deltas(
+            response_wrapper(),
+            config.performance.stream_coalesce_window_ms,
+            config.performance.stream_coalesce_max_chars,
+        )
+        return StreamingResponse(
+            encode_sse_stream(deltas, sse_encoder, sse_frame_stats),
+            media_type="text/event-stream"
+        )
+
+    # 非流式：直接聚合增量事件，最后一次性拼接
+    content_parts = []
+    reasoning_parts = []
+    async for delta in response_wrapper():
+        if delta.kind == DELTA_CONTENT:
+            content_parts.append(delta.text)
+        elif delta.kind == DELTA_REASONING:
+            reasoning_parts.append(delta.text)
+    full_content = "".join(content_parts)
+    full_reasoning = "".join(reasoning_parts)
 
     # 构建响应消息
     message = {"role": "assistant", "content": full_content}
@@ -2261,55 +2455,10 @@ async def chat_impl(
         "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
     }
 
-# ---------- 图片生成处理函数 ----------
-def parse_images_from_response(data_list: list) -> tuple[list, str]:
-    """从API响应中解析图片文件引用
-    返回: (file_ids_list, session_name)
-    file_ids_list: [{"fileId": str, "mimeType": str}, ...]
-    """
-    file_ids = []
-    session_name = ""
-    seen_file_ids = set()  # 用于去重
-
-    for data in data_list:
-        sar = data.get("streamAssistResponse")
-        if not sar:
-            continue
-
-        # 获取session信息（优先使用最新的）
-        session_info = sar.get("sessionInfo", {})
-        if session_info.get("session"):
-            session_name = session_info["session"]
-
-        answer = sar.get("answer") or {}
-        replies = answer.get("replies") or []
-
-        for reply in replies:
-            gc = reply.get("groundedContent", {})
-            content = gc.get("content", {})
-
-            # 检查file字段（图片生成的关键）
-            file_info = content.get("file")
-            if file_info and file_info.get("fileId"):
-                file_id = file_info["fileId"]
-                # 去重：同一个 fileId 只处理一次
-                if file_id in seen_file_ids:
-                    continue
-                seen_file_ids.add(file_id)
-
-                mime_type = file_info.get("mimeType", "image/png")
-                logger.debug(f"[PARSE] 解析文件: fileId={file_id}, mimeType={mime_type}")
-                file_ids.append({
-                    "fileId": file_id,
-                    "mimeType": mime_type
-                })
-
-    return file_ids, session_name
-
-
-async def stream_chat_generator(session: str, text_content: str, file_ids: List[str], model_name: str, chat_id: str, created_time: int, account_manager: AccountManager, is_stream: bool = True, request_id: str = "", request: Request = None):
+async def stream_chat_generator(session: str, text_content: str, file_ids: List[str], model_name: str, chat_id: str, account_manager: AccountManager, request_id: str = "", request: Request = None):
+    """调用上游流式接口，产出类型化增量事件（ChatDelta），由调用方决定输出格式"""
     start_time = time.time()
-    full_content = ""
+    content_parts = []
     first_response_time = None
 
     # 记录发送给API的内容
@@ -2346,20 +2495,20 @@ async def stream_chat_generator(session: str, text_content: str, file_ids: List[
             "modelId": target_model_id
         }
 
-    if is_stream:
-        chunk = create_chunk(chat_id, created_time, model_name, {"role": "assistant"}, None)
-        yield f"data: {chunk}\n\n"
+    yield ROLE_DELTA
 
     # 使用流式请求
-    json_objects = []  # 收集所有响应对象用于图片解析
+    media_collector = GeneratedFileCollector()  # 逐个对象检测生成的图片/视频
     file_ids_info = None  # 保存图片信息
 
-    async with http_client.stream(
+    connect_start = time.perf_counter()
+    async with metrics.STREAMS_IN_FLIGHT.track_inprogress(), http_client.stream(
         "POST",
         "https://biz-discoveryengine.googleapis.com/v1alpha/locations/global/widgetStreamAssist",
         headers=headers,
         json=body,
     ) as r:
+        metrics.UPSTREAM_CONNECT_SECONDS.observe(time.perf_counter() - connect_start)
         if r.status_code != 200:
             error_text = await r.aread()
             uptime_tracker.record_request(model_name, False, status_code=r.status_code)
@@ -2367,8 +2516,12 @@ async def stream_chat_generator(session: str, text_content: str, file_ids: List[
 
         # 使用异步解析器处理 JSON 数组流
         try:
-            async for json_obj in parse_json_array_stream_async(r.aiter_lines()):
-                json_objects.append(json_obj)  # 收集响应
+            if config.performance.stream_parser_engine == "legacy":
+                json_stream = parse_json_array_stream_async(r.aiter_lines())
+            else:
+                json_stream = parse_json_array_bytes_async(r.aiter_bytes())
+            async for json_obj in json_stream:
+                media_collector.feed(json_obj)
 
                 # 提取文本内容
                 for reply in json_obj.get("streamAssistResponse", {}).get("answer", {}).get("replies", []):
@@ -2385,24 +2538,21 @@ async def stream_chat_generator(session: str, text_content: str, file_ids: List[
                             first_response_time = time.time()
                             if request is not None:
                                 request.state.first_response_time = first_response_time
-                        chunk = create_chunk(chat_id, created_time, model_name, {"reasoning_content": text}, None)
-                        yield f"data: {chunk}\n\n"
+                        yield ChatDelta(DELTA_REASONING, text)
                     else:
                         if first_response_time is None:
                             first_response_time = time.time()
                             if request is not None:
                                 request.state.first_response_time = first_response_time
                         # 正常内容使用 content 字段
-                        full_content += text
-                        chunk = create_chunk(chat_id, created_time, model_name, {"content": text}, None)
-                        yield f"data: {chunk}\n\n"
+                        content_parts.append(text)
+                        yield ChatDelta(DELTA_CONTENT, text)
 
             # 提取图片信息（在 async with 块内）
-            if json_objects:
-                file_ids, session_name = parse_images_from_response(json_objects)
-                if file_ids and session_name:
-                    file_ids_info = (file_ids, session_name)
-                    logger.info(f"[IMAGE] [{account_manager.config.account_id}] [req_{request_id}] 检测到{len(file_ids)}张生成图片")
+            file_ids, session_name = media_collector.file_ids, media_collector.session_name
+            if file_ids and session_name:
+                file_ids_info = (file_ids, session_name)
+                logger.info(f"[IMAGE] [{account_manager.config.account_id}] [req_{request_id}] 检测到{len(file_ids)}张生成图片")
 
         except ValueError as e:
             uptime_tracker.record_request(model_name, False)
@@ -2445,8 +2595,7 @@ async def stream_chat_generator(session: str, text_content: str, file_ids: List[
                         first_response_time = time.time()
                         if request is not None:
                             request.state.first_response_time = first_response_time
-                    chunk = create_chunk(chat_id, created_time, model_name, {"content": error_msg}, None)
-                    yield f"data: {chunk}\n\n"
+                    yield ChatDelta(DELTA_CONTENT, error_msg)
                     continue
 
                 try:
@@ -2456,8 +2605,7 @@ async def stream_chat_generator(session: str, text_content: str, file_ids: List[
                         first_response_time = time.time()
                         if request is not None:
                             request.state.first_response_time = first_response_time
-                    chunk = create_chunk(chat_id, created_time, model_name, {"content": markdown}, None)
-                    yield f"data: {chunk}\n\n"
+                    yield ChatDelta(DELTA_CONTENT, markdown)
                 except Exception as save_error:
                     logger.error(f"[MEDIA] [{account_manager.config.account_id}] [req_{request_id}] 媒体{idx}处理失败: {str(save_error)[:100]}")
                     error_msg = f"\n\n⚠️ 媒体 {idx} 处理失败\n\n"
@@ -2465,8 +2613,7 @@ async def stream_chat_generator(session: str, text_content: str, file_ids: List[
                         first_response_time = time.time()
                         if request is not None:
                             request.state.first_response_time = first_response_time
-                    chunk = create_chunk(chat_id, created_time, model_name, {"content": error_msg}, None)
-                    yield f"data: {chunk}\n\n"
+                    yield ChatDelta(DELTA_CONTENT, error_msg)
 
             logger.info(f"[IMAGE] [{account_manager.config.account_id}] [req_{request_id}] 图片处理完成: {success_count}/{len(file_ids)} 成功")
 
@@ -2478,9 +2625,9 @@ async def stream_chat_generator(session: str, text_content: str, file_ids: List[
                 first_response_time = time.time()
                 if request is not None:
                     request.state.first_response_time = first_response_time
-            chunk = create_chunk(chat_id, created_time, model_name, {"content": error_msg}, None)
-            yield f"data: {chunk}\n\n"
+            yield ChatDelta(DELTA_CONTENT, error_msg)
 
+    full_content = "".join(content_parts)
     if full_content:
         response_preview = full_content[:500] + "...(已截断)" if len(full_content) > 500 else full_content
         logger.info(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] AI响应: {response_preview}")
@@ -2494,10 +2641,7 @@ async def stream_chat_generator(session: str, text_content: str, file_ids: List[
     total_time = time.time() - start_time
     logger.info(f"[API] [{account_manager.config.account_id}] [req_{request_id}] 响应完成: {total_time:.2f}秒")
     
-    if is_stream:
-        final_chunk = create_chunk(chat_id, created_time, model_name, {}, "stop")
-        yield f"data: {final_chunk}\n\n"
-        yield "data: [DONE]\n\n"
+    yield FINISH_DELTA
 
 # ---------- 公开端点（无需认证） ----------
 @app.get("/public/uptime")
@@ -2508,42 +2652,56 @@ async def get_public_uptime(days: int = 90):
     return await uptime_tracker.get_uptime_summary(days)
 
 
+# 抓取时计算的指标（读取当前的账户管理器，重新加载账户后仍然有效）
+metrics.registry.register(metrics.GaugeCallback(
+    "gemini_accounts_available", "Accounts currently selectable per quota type", ("quota_type",),
+    lambda: [((quota_type,), multi_account_mgr.count_available([quota_type])) for quota_type in QUOTA_TYPES],
+))
+metrics.registry.register(metrics.GaugeCallback(
+    "gemini_account_queue_waiting", "Requests waiting for account capacity", (),
+    lambda: [((), multi_account_mgr.get_queue_stats()["waiting"])],
+))
+metrics.registry.register(metrics.GaugeCallback(
+    "gemini_session_cache_entries", "Conversation session cache entries", (),
+    lambda: [((), len(multi_account_mgr.session_cache))],
+))
+metrics.registry.register(metrics.GaugeCallback(
+    "gemini_session_cache_hit_ratio", "Conversation session cache hit ratio since start", (),
+    lambda: [((), multi_account_mgr.session_cache.get_stats()["hit_rate"])],
+))
+
+
+@app.get("/metrics")
+async def get_metrics(authorization: Optional[str] = Header(None)):
+    """Prometheus 指标（配置了 API_KEY 时需要 Bearer 认证）"""
+    verify_api_key(API_KEY, authorization)
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.get("/public/stats")
 async def get_public_stats():
     """获取公开统计信息"""
-    async with stats_lock:
-        # 清理1小时前的请求时间戳
-        current_time = time.time()
-        recent_requests = [
-            ts for ts in global_stats["request_timestamps"]
-            if current_time - ts < 3600
-        ]
-
-        # 计算每分钟请求数
-        recent_minute = [
-            ts for ts in recent_requests
-            if current_time - ts < 60
-        ]
-        requests_per_minute = len(recent_minute)
-
-        # 计算负载状态
-        if requests_per_minute < 10:
-            load_status = "low"
-            load_color = "#10b981"  # 绿色
-        elif requests_per_minute < 30:
-            load_status = "medium"
-            load_color = "#f59e0b"  # 黄色
-        else:
-            load_status = "high"
-            load_color = "#ef4444"  # 红色
+    # 计算每分钟请求数
+    requests_per_minute = global_stats["request_series"].per_minute()
+
+    # 计算负载状态
+    if requests_per_minute < 10:
+        load_status = "low"
+        load_color = "#10b981"  # 绿色
+    elif requests_per_minute < 30:
+        load_status = "medium"
+        load_color = "#f59e0b"  # 黄色
+    else:
+        load_status = "high"
+        load_color = "#ef4444"  # 红色
 
-        return {
-            "total_visitors": global_stats["total_visitors"],
-            "total_requests": global_stats["total_requests"],
-            "requests_per_minute": requests_per_minute,
-            "load_status": load_status,
-            "load_color": load_color
-        }
+    return {
+        "total_visitors": global_stats["total_visitors"],
+        "total_requests": global_stats["total_requests"],
+        "requests_per_minute": requests_per_minute,
+        "load_status": load_status,
+        "load_color": load_color
+    }
 
 @app.get("/public/display")
 async def get_public_display():
@@ -2560,24 +2718,23 @@ async def get_public_logs(request: Request, limit: int = 100):
         client_ip = request.client.host
         current_time = time.time()
 
-        async with stats_lock:
-            # 清理24小时前的IP记录
-            if "visitor_ips" not in global_stats:
-                global_stats["visitor_ips"] = {}
-            global_stats["visitor_ips"] = {
-                ip: timestamp for ip, timestamp in global_stats["visitor_ips"].items()
-                if current_time - timestamp <= 86400
-            }
+        # 清理24小时前的IP记录
+        if "visitor_ips" not in global_stats:
+            global_stats["visitor_ips"] = {}
+        global_stats["visitor_ips"] = {
+            ip: timestamp for ip, timestamp in global_stats["visitor_ips"].items()
+            if current_time - timestamp <= 86400
+        }
 
-            # 记录新访问（24小时内同一IP只计数一次）
-            if client_ip not in global_stats["visitor_ips"]:
-                global_stats["visitor_ips"][client_ip] = current_time
-                global_stats["total_visitors"] = global_stats.get("total_visitors", 0) + 1
+        # 记录新访问（24小时内同一IP只计数一次）
+        if client_ip not in global_stats["visitor_ips"]:
+            global_stats["visitor_ips"][client_ip] = current_time
+            global_stats["total_visitors"] = global_stats.get("total_visitors", 0) + 1
 
-            global_stats.setdefault("recent_conversations", [])
-            await save_stats(global_stats)
+        global_stats.setdefault("recent_conversations", [])
+        stats_store.mark_dirty()
 
-            stored_logs = list(global_stats.get("recent_conversations", []))
+        stored_logs = list(global_stats.get("recent_conversations", []))
 
         sanitized_logs = get_sanitized_logs(limit=min(limit, 1000))
 
@@ -2627,4 +2784,10 @@ async def not_found_handler(request: Request, exc: HTTPException):
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", "7860"))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    workers = int(os.getenv("WORKERS", "1"))
+    if workers > 1:
+        # 多 worker 需要共享账户状态、对话绑定和统计计数
+        os.environ.setdefault("STATE_BACKEND", "shared")
+        uvicorn.run("main:app", host="0.0.0.0", port=port, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=port)
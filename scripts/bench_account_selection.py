@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+账户选择基准测试
+
+用途：对比旧的全量扫描选择（每次请求遍历所有账户并解析过期时间）与
+基于可用性索引的 MultiAccountManager.get_account 在 100 / 1万 / 10万 个账户下的耗时，
+并检查轮询的公平性（各账户被选中次数的分布）。
+
+使用方法：
+    python scripts/bench_account_selection.py [账户数 ...]
+"""
+
+import asyncio
+import random
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from core.account import AccountConfig, CooldownConfig, MultiAccountManager, RetryPolicy
+
+DEFAULT_SIZES = [100, 10_000, 100_000]
+RETRY_POLICY = RetryPolicy(account_failure_threshold=3, cooldowns=CooldownConfig(text=7200, images=14400, videos=14400))
+BEIJING_TZ = timezone(timedelta(hours=8))
+
+
+def build_manager(count: int) -> MultiAccountManager:
+    """构造账户池：约 10% 全局冷却，10% 绘图配额冷却，5% 手动禁用"""
+    rng = random.Random(count)
+    expires_at = (datetime.now(BEIJING_TZ) + timedelta(hours=12)).strftime("%Y-%m-%d %H:%M:%S")
+    manager = MultiAccountManager(3600)
+    stats = {}
+    for i in range(count):
+        config = AccountConfig(
+            account_id=f"acc{i}",
+            secure_c_ses="s",
+            host_c_oses=None,
+            csesidx=str(i),
+            config_id="c",
+            expires_at=expires_at,
+            disabled=rng.random() < 0.05,
+        )
+        manager.add_account(config, None, "ua", RETRY_POLICY, stats)
+        account = manager.accounts[config.account_id]
+        roll = rng.random()
+        if roll < 0.10:
+            account.handle_http_error(429)
+        elif roll < 0.20:
+            account.handle_http_error(429, quota_type="images")
+    return manager
+
+
+def _legacy_is_expired(config: AccountConfig) -> bool:
+    """旧实现：每次检查都调用 strptime"""
+    if not config.expires_at:
+        return False
+    expire_time = datetime.strptime(config.expires_at, "%Y-%m-%d %H:%M:%S").replace(tzinfo=BEIJING_TZ)
+    return (expire_time - datetime.now(BEIJING_TZ)).total_seconds() <= 0
+
+
+def legacy_select(manager: MultiAccountManager, required_quota_types, state: dict):
+    available_accounts = [
+        acc for acc in manager.accounts.values()
+        if (acc.should_retry() and
+            not _legacy_is_expired(acc.config) and
+            not acc.config.disabled and
+            acc.are_quotas_available(required_quota_types))
+    ]
+    if len(available_accounts) != state.get("last"):
+        state["counter"] = random.randint(0, 999999)
+        state["last"] = len(available_accounts)
+    index = state["counter"] % len(available_accounts)
+    state["counter"] += 1
+    return available_accounts[index]
+
+
+async def bench(count: int) -> None:
+    manager = build_manager(count)
+    iterations = max(5, min(20000, 2_000_000 // count))
+
+    for label, quota_types in (("text", ["text"]), ("text+images", ["text", "images"])):
+        state = {}
+        start = time.perf_counter()
+        for _ in range(iterations):
+            legacy_select(manager, quota_types, state)
+        legacy = (time.perf_counter() - start) / iterations
+
+        indexed_iterations = iterations * 10
+        start = time.perf_counter()
+        for _ in range(indexed_iterations):
+            # 释放选择时的预留，模拟请求已完成，避免账户被判定为饱和
+            reservation = await manager.get_account(None, "", quota_types)
+            reservation.cancel()
+        indexed = (time.perf_counter() - start) / indexed_iterations
+
+        print(
+            f"{count:>7} accounts {label:<12} | legacy {legacy * 1e6:10.1f} µs/select | "
+            f"indexed {indexed * 1e6:7.2f} µs/select | x{legacy / indexed:8.1f}"
+        )
+
+
+async def fairness(count: int = 100, rounds: int = 200) -> None:
+    manager = build_manager(count)
+    selected = Counter()
+    for _ in range(count * rounds):
+        reservation = await manager.get_account(None, "", ["text"])
+        reservation.cancel()
+        selected[reservation.account.config.account_id] += 1
+    values = list(selected.values())
+    print(
+        f"fairness ({count} accounts, {count * rounds} selects): "
+        f"eligible={len(values)} min={min(values)} max={max(values)} expected={count * rounds / len(values):.1f}"
+    )
+
+
+async def main() -> None:
+    import logging
+    logging.disable(logging.CRITICAL)
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    for count in sizes:
+        await bench(count)
+    await fairness()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
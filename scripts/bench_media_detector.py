@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+生成文件检测内存基准测试
+
+用途：对比"缓存所有响应对象后统一解析"（旧方式）与 GeneratedFileCollector
+逐对象增量检测在长响应流上的峰值内存。
+
+使用方法：
+    python scripts/bench_media_detector.py                 # 合成长响应（默认 20000 个对象）
+    python scripts/bench_media_detector.py dump.json       # 使用录制的 widgetStreamAssist 响应体
+"""
+
+import asyncio
+import json
+import sys
+import tracemalloc
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from core.google_api import GeneratedFileCollector, parse_images_from_response
+from util.streaming_parser import parse_json_array_bytes_async
+
+SESSION = "projects/000/locations/global/collections/default/engines/e/sessions/123"
+
+
+def build_payload(object_count: int) -> bytes:
+    """生成长文本回答，末尾附带两张生成图片。"""
+    objects = []
+    for i in range(object_count):
+        objects.append({
+            "streamAssistResponse": {
+                "answer": {"replies": [{"groundedContent": {"content": {"text": f"段落{i} " + "内容" * 80}}}]},
+                "sessionInfo": {"session": SESSION},
+            }
+        })
+    for i in range(2):
+        objects.append({
+            "streamAssistResponse": {
+                "answer": {"replies": [{"groundedContent": {"content": {"file": {"fileId": f"file-{i}", "mimeType": "image/png"}}}}]},
+                "sessionInfo": {"session": SESSION},
+            }
+        })
+    return json.dumps(objects, indent=2, ensure_ascii=False).encode()
+
+
+async def _chunks(payload: bytes, size: int = 16 * 1024):
+    for offset in range(0, len(payload), size):
+        yield payload[offset:offset + size]
+
+
+async def buffered(payload: bytes):
+    json_objects = []
+    async for obj in parse_json_array_bytes_async(_chunks(payload)):
+        json_objects.append(obj)
+    return parse_images_from_response(json_objects)
+
+
+async def incremental(payload: bytes):
+    collector = GeneratedFileCollector()
+    async for obj in parse_json_array_bytes_async(_chunks(payload)):
+        collector.feed(obj)
+    return collector.file_ids, collector.session_name
+
+
+def measure(fn, payload: bytes):
+    tracemalloc.start()
+    result = asyncio.run(fn(payload))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak
+
+
+def main() -> None:
+    if len(sys.argv) > 1:
+        payload = Path(sys.argv[1]).read_bytes()
+    else:
+        payload = build_payload(20000)
+
+    buffered_result, buffered_peak = measure(buffered, payload)
+    incremental_result, incremental_peak = measure(incremental, payload)
+    assert buffered_result == incremental_result, "检测结果不一致"
+
+    mb = 1024 * 1024
+    print(f"payload          : {len(payload) / mb:8.2f} MB, files={len(incremental_result[0])}")
+    print(f"buffered peak    : {buffered_peak / mb:8.2f} MB")
+    print(f"incremental peak : {incremental_peak / mb:8.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
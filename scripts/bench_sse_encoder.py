@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+SSE 帧编码微基准测试
+
+用途：对比 create_chunk + f-string 的旧路径与预编码的 SSEChunkEncoder
+在 token 级小增量上的耗时。
+
+使用方法：
+    python scripts/bench_sse_encoder.py [chunk_count]
+"""
+
+import random
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from util.sse import SSEChunkEncoder, create_chunk
+
+CHAT_ID = "chatcmpl-5f0c2a34-2d8e-4c1e-9a57-0f7f4b1c2d3e"
+CREATED = 1760000000
+MODEL = "gemini-2.5-pro"
+
+
+def build_deltas(count: int) -> list:
+    rng = random.Random(42)
+    words = ["the", "模型", "response", "内容", "\"quoted\"", "line\n", "tab\t", "😀", "token", "数据"]
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(1, 6))) for _ in range(count)]
+
+
+def legacy_path(deltas: list) -> int:
+    total = 0
+    for text in deltas:
+        chunk = create_chunk(CHAT_ID, CREATED, MODEL, {"content": text}, None)
+        # StreamingResponse 最终会把 str 编码为 bytes
+        total += len(f"data: {chunk}\n\n".encode("utf-8"))
+    return total
+
+
+def encoder_path(deltas: list) -> int:
+    encoder = SSEChunkEncoder(CHAT_ID, CREATED, MODEL)
+    total = 0
+    for text in deltas:
+        total += len(encoder.content(text))
+    return total
+
+
+def bench(fn, deltas: list, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(deltas)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    deltas = build_deltas(count)
+
+    encoder = SSEChunkEncoder(CHAT_ID, CREATED, MODEL)
+    for text in deltas[:1000]:
+        expected = f"data: {create_chunk(CHAT_ID, CREATED, MODEL, {'content': text}, None)}\n\n".encode("utf-8")
+        assert encoder.content(text) == expected, "编码结果与 create_chunk 不一致"
+
+    legacy = bench(legacy_path, deltas)
+    fast = bench(encoder_path, deltas)
+    print(f"chunks: {count}")
+    print(f"create_chunk + f-string : {legacy * 1000:8.2f} ms ({legacy / count * 1e6:6.2f} µs/chunk)")
+    print(f"SSEChunkEncoder         : {fast * 1000:8.2f} ms ({fast / count * 1e6:6.2f} µs/chunk)")
+    print(f"speedup                 : x{legacy / fast:.1f}")
+
+
+if __name__ == "__main__":
+    main()
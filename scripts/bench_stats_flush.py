@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+统计数据写入基准测试
+
+用途：对比两种统计持久化方式下网关的吞吐（RPS）与 p50/p95 延迟：
+- per_request：每次记录统计都同步写入整份统计（原先每个请求写两次 kv_stats 的方式）
+- write_behind：只标记为脏，由后台任务按 performance.stats_flush_seconds 定期写入（当前方式）
+数据库预先写入一份包含 2 万个请求时间戳的统计，模拟运行一段时间后的数据量。
+
+使用方法：
+    python scripts/bench_stats_flush.py [--requests 1000] [--concurrency 32] [--latency-ms 50]
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / "scripts"))
+
+from loadtest_workers import free_port, run_load, start_gateway, start_upstream, wait_ready
+
+MODES = ("per_request", "write_behind")
+PREFILLED_TIMESTAMPS = 20000
+
+
+def gateway_app():
+    """uvicorn factory：per_request 模式下把标记脏改为立即写入整份统计"""
+    import loadtest_workers
+    app = loadtest_workers.gateway_app()
+    if os.environ.get("BENCH_STATS_MODE") == "per_request":
+        import main
+        from core import storage
+        main.stats_store.mark_dirty = lambda: storage.save_stats_sync(main.stats_store.snapshot())
+    return app
+
+
+def prefill_stats(db_path: str) -> None:
+    """在子进程中写入预置统计（storage 的 SQLite 连接按进程缓存）"""
+    subprocess.run([sys.executable, __file__, "--prefill", db_path], check=True)
+
+
+def _write_prefilled_stats(db_path: str) -> None:
+    os.environ["SQLITE_PATH"] = db_path
+    from core import storage
+    now = time.time()
+    storage.save_stats_sync({
+        "total_visitors": 0,
+        "total_requests": PREFILLED_TIMESTAMPS,
+        "success_count": PREFILLED_TIMESTAMPS,
+        "failed_count": 0,
+        "request_timestamps": [now - i * 0.5 for i in range(PREFILLED_TIMESTAMPS)],
+        "model_request_timestamps": {},
+        "failure_timestamps": [],
+        "rate_limit_timestamps": [],
+        "visitor_ips": {},
+        "account_conversations": {},
+        "account_failures": {},
+        "recent_conversations": [],
+    })
+
+
+async def run_mode(mode: str, args: argparse.Namespace, upstream_port: int) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        os.makedirs(os.path.join(workdir, "data"))
+        prefill_stats(os.path.join(workdir, "data", "data.db"))
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        process = start_gateway(
+            1, port, upstream_port, workdir,
+            app="bench_stats_flush:gateway_app", extra_env={"BENCH_STATS_MODE": mode},
+        )
+        try:
+            await wait_ready(base_url)
+            await run_load(base_url, args.concurrency, args.concurrency)
+            return await run_load(base_url, args.requests, args.concurrency)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    upstream_port = free_port()
+    upstream = start_upstream(upstream_port, args.latency_ms)
+    print(f"模拟上游延迟 {args.latency_ms}ms，并发 {args.concurrency}，请求数 {args.requests}，预置时间戳 {PREFILLED_TIMESTAMPS}")
+    try:
+        for mode in MODES:
+            result = await run_mode(mode, args, upstream_port)
+            print(
+                f"{mode:<13} RPS={result['rps']:8.1f}  p50={result['p50']:7.1f}ms  "
+                f"p95={result['p95']:7.1f}ms  失败={result['failures']}"
+            )
+    finally:
+        upstream.terminate()
+        upstream.wait(timeout=30)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="统计数据写入基准测试")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency-ms", type=int, default=50)
+    parser.add_argument("--prefill", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.prefill:
+        _write_prefilled_stats(args.prefill)
+        return
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+流解析器基准测试
+
+用途：对比按行逐字符解析（parse_json_array_stream_async）与字节块增量解析
+（parse_json_array_bytes_async）在 widgetStreamAssist 响应上的耗时。
+
+使用方法：
+    python scripts/bench_streaming_parser.py                  # 使用合成负载（1KB ~ 5MB）
+    python scripts/bench_streaming_parser.py dump1.json ...   # 使用录制的原始响应体
+
+录制的响应体即 widgetStreamAssist 返回的原始字节（JSON 数组）。
+"""
+
+import asyncio
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from util.streaming_parser import parse_json_array_bytes_async, parse_json_array_stream_async
+
+SIZES = [1024, 16 * 1024, 256 * 1024, 1024 * 1024, 5 * 1024 * 1024]
+NETWORK_CHUNK_SIZE = 16 * 1024
+
+
+def build_payload(target_size: int) -> bytes:
+    """生成形如 widgetStreamAssist 的格式化 JSON 数组（每个对象一段文本增量）。"""
+    rng = random.Random(target_size)
+    objects = []
+    size = 0
+    index = 0
+    while size < target_size:
+        text = "".join(rng.choice("abcdefghij 中文内容\"\\{}") for _ in range(rng.randint(20, 400)))
+        obj = {
+            "streamAssistResponse": {
+                "answer": {
+                    "state": "IN_PROGRESS",
+                    "replies": [{
+                        "groundedContent": {
+                            "content": {"role": "model", "text": text, "thought": index % 7 == 0}
+                        },
+                        "replyId": f"reply-{index}",
+                    }],
+                },
+                "sessionInfo": {"session": "projects/000/locations/global/collections/default/engines/e/sessions/123"},
+            }
+        }
+        objects.append(obj)
+        size += len(json.dumps(obj, indent=2, ensure_ascii=False).encode())
+        index += 1
+    return json.dumps(objects, indent=2, ensure_ascii=False).encode()
+
+
+def split_network_chunks(payload: bytes) -> list:
+    """按随机大小切分，模拟 aiter_bytes() 收到的网络数据块。"""
+    rng = random.Random(len(payload))
+    chunks = []
+    offset = 0
+    while offset < len(payload):
+        step = rng.randint(NETWORK_CHUNK_SIZE // 4, NETWORK_CHUNK_SIZE)
+        chunks.append(payload[offset:offset + step])
+        offset += step
+    return chunks
+
+
+async def _iterate(items):
+    for item in items:
+        yield item
+
+
+async def _consume(stream) -> int:
+    count = 0
+    async for _ in stream:
+        count += 1
+    return count
+
+
+async def bench_case(name: str, payload: bytes, repeat: int) -> None:
+    lines = payload.decode("utf-8").splitlines()
+    chunks = split_network_chunks(payload)
+
+    legacy_best = float("inf")
+    bytes_best = float("inf")
+    legacy_count = bytes_count = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        legacy_count = await _consume(parse_json_array_stream_async(_iterate(lines)))
+        legacy_best = min(legacy_best, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        bytes_count = await _consume(parse_json_array_bytes_async(_iterate(chunks)))
+        bytes_best = min(bytes_best, time.perf_counter() - start)
+
+    mb = len(payload) / (1024 * 1024)
+    print(
+        f"{name:<24} {len(payload):>10} B {bytes_count:>6} obj | "
+        f"legacy {legacy_best * 1000:9.2f} ms ({mb / legacy_best:7.1f} MB/s) | "
+        f"bytes {bytes_best * 1000:9.2f} ms ({mb / bytes_best:7.1f} MB/s) | "
+        f"x{legacy_best / bytes_best:5.1f}"
+    )
+    if legacy_count != bytes_count:
+        print(f"  ⚠️ 对象数量不一致: legacy={legacy_count}, bytes={bytes_count}")
+
+
+async def main() -> None:
+    cases = []
+    if len(sys.argv) > 1:
+        for path in sys.argv[1:]:
+            cases.append((Path(path).name, Path(path).read_bytes()))
+    else:
+        for size in SIZES:
+            label = f"synthetic-{size // 1024}KB"
+            cases.append((label, build_payload(size)))
+
+    for name, payload in cases:
+        repeat = 5 if len(payload) < 1024 * 1024 else 2
+        await bench_case(name, payload, repeat)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
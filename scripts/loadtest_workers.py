@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+多 worker 压测
+
+用途：在本机启动一个模拟上游（带固定延迟的 getoxsrf / widgetCreateSession / widgetStreamAssist），
+以 1 个和 N 个 worker 分别启动网关（SQLite 共享状态），用固定并发发送聊天请求，
+对比吞吐（RPS）与 p50/p95 延迟，并检查各 worker 返回的 /public/stats 请求总数是否一致。
+
+使用方法：
+    python scripts/loadtest_workers.py [--workers 4] [--requests 2000] [--concurrency 64] [--latency-ms 50]
+
+说明：
+    - 网关运行在临时目录中（临时 SQLite 数据库和 ACCOUNTS_CONFIG 账户），不影响 data/ 下的数据
+    - 上游地址通过替换 httpx 传输层重定向到模拟服务，仅在本脚本内生效
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import httpx
+
+ACCOUNT_COUNT = 8
+STATS_SETTLE_SECONDS = 3
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# ---------- 模拟上游 ----------
+
+def build_upstream_app(latency_ms: int):
+    from fastapi import FastAPI, Request
+    from fastapi.responses import PlainTextResponse, StreamingResponse
+
+    app = FastAPI()
+    delay = latency_ms / 1000
+    counter = {"session": 0}
+
+    @app.get("/{path:path}")
+    async def get_route(path: str):
+        if "getoxsrf" in path:
+            token = base64.urlsafe_b64encode(b"k" * 32).decode()
+            return PlainTextResponse(")]}'\n" + json.dumps({"xsrfToken": token, "keyId": "kid"}))
+        return PlainTextResponse("not found", status_code=404)
+
+    @app.post("/{path:path}")
+    async def post_route(path: str, request: Request):
+        await request.body()
+        if "widgetCreateSession" in path:
+            counter["session"] += 1
+            return {"session": {"name": f"projects/x/sessions/s{counter['session']}"}}
+        if "widgetStreamAssist" in path:
+            async def body():
+                await asyncio.sleep(delay)
+                replies = [
+                    {"streamAssistResponse": {
+                        "answer": {"replies": [{"groundedContent": {"content": {"text": f"token{i} "}}}]},
+                        "sessionInfo": {"session": "projects/x/sessions/s"},
+                    }}
+                    for i in range(10)
+                ]
+                yield json.dumps(replies).encode()
+            return StreamingResponse(body(), media_type="application/json")
+        return PlainTextResponse("not found", status_code=404)
+
+    return app
+
+
+def upstream_app():
+    return build_upstream_app(int(os.environ["LOADTEST_UPSTREAM_LATENCY_MS"]))
+
+
+def start_upstream(port: int, latency_ms: int) -> subprocess.Popen:
+    """模拟上游运行在独立进程中，避免与压测客户端争用 CPU"""
+    env = dict(os.environ)
+    env.update({
+        "LOADTEST_UPSTREAM_LATENCY_MS": str(latency_ms),
+        "PYTHONPATH": os.pathsep.join([str(project_root), str(project_root / "scripts")]),
+    })
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "loadtest_workers:upstream_app", "--factory",
+         "--host", "127.0.0.1", "--port", str(port), "--workers", "2", "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+# ---------- 网关（uvicorn factory，在每个 worker 进程中调用） ----------
+
+class _RedirectTransport(httpx.AsyncHTTPTransport):
+    """把所有上游请求重定向到模拟服务"""
+
+    def __init__(self, port: int) -> None:
+        super().__init__()
+        self.port = port
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request.url = request.url.copy_with(scheme="http", host="127.0.0.1", port=self.port)
+        return await super().handle_async_request(request)
+
+
+def gateway_app():
+    import main
+
+    client = httpx.AsyncClient(transport=_RedirectTransport(int(os.environ["LOADTEST_UPSTREAM_PORT"])), timeout=30)
+    main.http_client = client
+    main.http_client_chat = client
+    main.http_client_auth = client
+    main.multi_account_mgr.update_http_client(client)
+    return main.app
+
+
+def start_gateway(
+    workers: int, port: int, upstream_port: int, workdir: str,
+    app: str = "loadtest_workers:gateway_app", extra_env: Optional[dict] = None,
+) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "ADMIN_KEY": "loadtest",
+        "SQLITE_PATH": os.path.join(workdir, "data", "data.db"),
+        "ACCOUNTS_CONFIG": json.dumps([
+            {"id": f"acc{i}", "secure_c_ses": "s", "csesidx": str(i), "config_id": "c"} for i in range(ACCOUNT_COUNT)
+        ]),
+        "LOADTEST_UPSTREAM_PORT": str(upstream_port),
+        "STATE_BACKEND": "shared" if workers > 1 else "memory",
+        "PYTHONPATH": os.pathsep.join([str(project_root), str(project_root / "scripts")]),
+    })
+    env.update(extra_env or {})
+    os.makedirs(os.path.join(workdir, "data"), exist_ok=True)
+    # main 以工作目录下的 static/ 挂载前端静态文件
+    os.makedirs(os.path.join(workdir, "static"), exist_ok=True)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--factory",
+         "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_ready(base_url: str, timeout: float = 60) -> None:
+    deadline = time.time() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.time() < deadline:
+            try:
+                if (await client.get(f"{base_url}/public/stats")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+    raise RuntimeError("网关启动超时")
+
+
+# ---------- 负载 ----------
+
+async def run_load(base_url: str, total: int, concurrency: int) -> dict:
+    latencies = []
+    failures = 0
+    next_index = 0
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        nonlocal next_index, failures
+        while next_index < total:
+            index = next_index
+            next_index += 1
+            payload = {
+                "model": "gemini-2.5-flash",
+                "messages": [{"role": "user", "content": f"压测请求 {index}"}],
+                "stream": False,
+            }
+            start = time.perf_counter()
+            try:
+                response = await client.post(f"{base_url}/v1/chat/completions", json=payload)
+                if response.status_code != 200:
+                    failures += 1
+            except httpx.HTTPError:
+                failures += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=60, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[int(len(latencies) * 0.95)],
+        "failures": failures,
+    }
+
+
+async def read_totals(base_url: str, samples: int) -> list:
+    """多次读取 /public/stats（新连接，由不同 worker 处理）"""
+    totals = []
+    for _ in range(samples):
+        async with httpx.AsyncClient() as client:
+            totals.append((await client.get(f"{base_url}/public/stats")).json()["total_requests"])
+    return totals
+
+
+async def run_case(workers: int, args: argparse.Namespace, upstream_port: int) -> None:
+    with tempfile.TemporaryDirectory() as workdir:
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        process = start_gateway(workers, port, upstream_port, workdir)
+        try:
+            await wait_ready(base_url)
+            # 预热（建立连接、JWT 与 Session 预热池）
+            await run_load(base_url, args.concurrency, args.concurrency)
+            result = await run_load(base_url, args.requests, args.concurrency)
+            await asyncio.sleep(STATS_SETTLE_SECONDS)
+            totals = await read_totals(base_url, workers * 4)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    expected = args.requests + args.concurrency
+    consistent = all(total >= expected for total in totals) and len(set(totals)) <= 2
+    print(
+        f"workers={workers:<3} RPS={result['rps']:8.1f}  p50={result['p50']:7.1f}ms  "
+        f"p95={result['p95']:7.1f}ms  失败={result['failures']}"
+    )
+    print(f"             /public/stats total_requests: {sorted(set(totals))}（已发送 {expected}，{'一致' if consistent else '不一致'}）")
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    upstream_port = free_port()
+    upstream = start_upstream(upstream_port, args.latency_ms)
+    print(f"模拟上游延迟 {args.latency_ms}ms，并发 {args.concurrency}，请求数 {args.requests}")
+    try:
+        for workers in sorted({1, args.workers}):
+            await run_case(workers, args, upstream_port)
+    finally:
+        upstream.terminate()
+        upstream.wait(timeout=30)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="多 worker 压测")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--latency-ms", type=int, default=50)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+import asyncio
+import json
+import time
+from json.encoder import encode_basestring_ascii
+from typing import AsyncIterator, NamedTuple, Optional, Union
+
+# 增量事件类型
+DELTA_ROLE = "role"
+DELTA_CONTENT = "content"
+DELTA_REASONING = "reasoning"
+DELTA_FINISH = "finish"
+DELTA_ERROR = "error"
+
+
+class ChatDelta(NamedTuple):
+    """对话生成器产出的类型化增量事件（与传输格式无关）"""
+    kind: str
+    text: str = ""
+
+
+ROLE_DELTA = ChatDelta(DELTA_ROLE)
+FINISH_DELTA = ChatDelta(DELTA_FINISH, "stop")
+
+
+# 合并增量时读取任务最多预读的上游增量数
+COALESCE_READAHEAD = 256
+
+
+class _SourceError(NamedTuple):
+    """读取任务捕获的上游异常，由消费端按顺序重新抛出"""
+    error: Exception
+
+
+# 上游增量结束标记
+_SOURCE_END = object()
+
+
+def create_chunk(id: str, created: int, model: str, delta: dict, finish_reason: Union[str, None]) -> str:
+    chunk = {
+        "id": id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "delta": delta,
+            "logprobs": None,  # OpenAI 标准字段
+            "finish_reason": finish_reason
+        }],
+        "system_fingerprint": None  # OpenAI 标准字段（可选）
+    }
+    return json.dumps(chunk)
+
+
+class SSEChunkEncoder:
+    """
+    预编码的 SSE 帧构建器（每个请求创建一次）。
+
+    同一请求的所有 chunk 共享 id、created、model 和外层结构，
+    因此这些部分只在构造时序列化一次并缓存为前缀/后缀字节，
+    每个增量只需转义文本本身，直接产出可发送的 `bytes` 帧。
+
+    产出的帧与 `f"data: {create_chunk(...)}\\n\\n"` 逐字节一致。
+    """
+
+    DONE = b"data: [DONE]\n\n"
+
+    def __init__(self, chat_id: str, created: int, model: str) -> None:
+        envelope = json.dumps({
+            "id": chat_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+        })
+        head = b"data: " + envelope[:-1].encode("ascii") + b', "choices": [{"index": 0, "delta": '
+        self._head = head
+        self._content_prefix = head + b'{"content": '
+        self._reasoning_prefix = head + b'{"reasoning_content": '
+        self._tail = b', "logprobs": null, "finish_reason": null}], "system_fingerprint": null}\n\n'
+        self._delta_tail = b"}" + self._tail
+        self._role_frame = head + b'{"role": "assistant"}' + self._tail
+
+    def role(self) -> bytes:
+        """首帧：{"role": "assistant"}"""
+        return self._role_frame
+
+    def content(self, text: str) -> bytes:
+        """正文增量帧：{"content": text}"""
+        return b"".join((self._content_prefix, encode_basestring_ascii(text).encode("ascii"), self._delta_tail))
+
+    def reasoning(self, text: str) -> bytes:
+        """思考过程增量帧：{"reasoning_content": text}"""
+        return b"".join((self._reasoning_prefix, encode_basestring_ascii(text).encode("ascii"), self._delta_tail))
+
+    def finish(self, finish_reason: str = "stop") -> bytes:
+        """结束帧：空 delta + finish_reason"""
+        return b"".join((
+            self._head,
+            b'{}, "logprobs": null, "finish_reason": ',
+            json.dumps(finish_reason).encode("ascii"),
+            b'}], "system_fingerprint": null}\n\n',
+        ))
+
+    @staticmethod
+    def error(message: str) -> bytes:
+        """错误帧：{"error": {"message": message}}"""
+        return f"data: {json.dumps({'error': {'message': message}})}\n\n".encode("ascii")
+
+    def encode(self, delta: ChatDelta) -> bytes:
+        """把类型化增量事件编码为 SSE 帧（结束事件附带 [DONE]）"""
+        kind = delta.kind
+        if kind == DELTA_CONTENT:
+            return self.content(delta.text)
+        if kind == DELTA_REASONING:
+            return self.reasoning(delta.text)
+        if kind == DELTA_ROLE:
+            return self._role_frame
+        if kind == DELTA_FINISH:
+            return self.finish(delta.text or "stop") + self.DONE
+        return self.error(delta.text)
+
+
+class SSEFrameStats:
+    """
+    SSE 帧发送统计（按秒分桶的环形计数器，记录 O(1)）。
+
+    用于在 /admin/stats 中展示最近一段时间的帧速率和平均帧大小。
+    """
+
+    def __init__(self, window_seconds: int = 60) -> None:
+        self.window_seconds = window_seconds
+        self._seconds = [0] * window_seconds
+        self._frames = [0] * window_seconds
+        self._bytes = [0] * window_seconds
+        self.total_frames = 0
+        self.total_bytes = 0
+
+    def record(self, size: int) -> None:
+        now = int(time.time())
+        slot = now % self.window_seconds
+        if self._seconds[slot] != now:
+            self._seconds[slot] = now
+            self._frames[slot] = 0
+            self._bytes[slot] = 0
+        self._frames[slot] += 1
+        self._bytes[slot] += size
+        self.total_frames += 1
+        self.total_bytes += size
+
+    def snapshot(self) -> dict:
+        now = int(time.time())
+        frames = 0
+        size = 0
+        for slot in range(self.window_seconds):
+            if now - self._seconds[slot] < self.window_seconds:
+                frames += self._frames[slot]
+                size += self._bytes[slot]
+        return {
+            "frames_per_second": round(frames / self.window_seconds, 2),
+            "bytes_per_frame": round(size / frames, 1) if frames else 0,
+            "total_frames": self.total_frames,
+            "total_bytes": self.total_bytes,
+        }
+
+
+async def coalesce_deltas(
+    deltas: AsyncIterator[ChatDelta],
+    window_ms: int,
+    max_chars: int,
+) -> AsyncIterator[ChatDelta]:
+    """
+    合并相邻的同类文本增量（content 与 reasoning 分别合并），减少帧数和写操作。
+
+    - 第一个文本增量立即发出，不影响首字延迟（TTFT）
+    - 缓冲区达到 max_chars 或自首个缓冲增量起超过 window_ms 时发出
+    - 类型切换或遇到非文本事件（role/finish/error）时先发出缓冲内容，保持顺序
+    - window_ms <= 0 时原样透传
+    """
+    if window_ms <= 0:
+        async for delta in deltas:
+            yield delta
+        return
+
+    window = window_ms / 1000
+    source = deltas.__aiter__()
+    # 单个读取任务把上游增量放入有界队列；合并窗口超时只影响等待，不打断上游读取
+    queue: asyncio.Queue = asyncio.Queue(COALESCE_READAHEAD)
+
+    async def read_source() -> None:
+        try:
+            async for item in source:
+                await queue.put(item)
+        except Exception as e:
+            await queue.put(_SourceError(e))
+        else:
+            await queue.put(_SOURCE_END)
+
+    reader = asyncio.create_task(read_source())
+    buffer_kind: Optional[str] = None
+    buffer_parts: list = []
+    buffer_len = 0
+    deadline = 0.0
+    first_text_sent = False
+
+    try:
+        while True:
+            if not queue.empty():
+                item = queue.get_nowait()
+            elif buffer_parts:
+                # 等待下一个增量，但不超过合并窗口
+                try:
+                    item = await asyncio.wait_for(queue.get(), max(0.0, deadline - time.monotonic()))
+                except asyncio.TimeoutError:
+                    yield ChatDelta(buffer_kind, "".join(buffer_parts))
+                    buffer_kind, buffer_parts, buffer_len = None, [], 0
+                    continue
+            else:
+                item = await queue.get()
+
+            if item is _SOURCE_END:
+                break
+            if isinstance(item, _SourceError):
+                if buffer_parts:
+                    yield ChatDelta(buffer_kind, "".join(buffer_parts))
+                    buffer_kind, buffer_parts, buffer_len = None, [], 0
+                raise item.error
+
+            delta = item
+            kind = delta.kind
+            if kind != DELTA_CONTENT and kind != DELTA_REASONING:
+                if buffer_parts:
+                    yield ChatDelta(buffer_kind, "".join(buffer_parts))
+                    buffer_kind, buffer_parts, buffer_len = None, [], 0
+                yield delta
+                continue
+
+            if not first_text_sent:
+                first_text_sent = True
+                yield delta
+                continue
+
+            if buffer_parts and kind != buffer_kind:
+                yield ChatDelta(buffer_kind, "".join(buffer_parts))
+                buffer_kind, buffer_parts, buffer_len = None, [], 0
+
+            if not buffer_parts:
+                buffer_kind = kind
+                deadline = time.monotonic() + window
+            buffer_parts.append(delta.text)
+            buffer_len += len(delta.text)
+            if buffer_len >= max_chars:
+                yield ChatDelta(buffer_kind, "".join(buffer_parts))
+                buffer_kind, buffer_parts, buffer_len = None, [], 0
+
+        if buffer_parts:
+            yield ChatDelta(buffer_kind, "".join(buffer_parts))
+    finally:
+        try:
+            if not reader.done():
+                reader.cancel()
+                try:
+                    await reader
+                except (asyncio.CancelledError, Exception):
+                    # 只吞掉读取任务自身的取消/异常；当前任务也被取消时继续向上传播
+                    current = asyncio.current_task()
+                    if current is not None and current.cancelling():
+                        raise
+        finally:
+            # 读取任务仍在运行上游时不能关闭上游（其取消会自行结束迭代）
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None and reader.done():
+                await aclose()
+
+
+async def encode_sse_stream(
+    deltas: AsyncIterator[ChatDelta],
+    encoder: SSEChunkEncoder,
+    frame_stats: Optional[SSEFrameStats] = None,
+) -> AsyncIterator[bytes]:
+    """仅用于流式客户端：把增量事件流转换为 SSE 字节帧流"""
+    async for delta in deltas:
+        frame = encoder.encode(delta)
+        if frame_stats is not None:
+            frame_stats.record(len(frame))
+        yield frame
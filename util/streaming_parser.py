@@ -1,3 +1,4 @@
+import codecs
 import json
 from typing import Iterator, Dict, Any, Iterable, AsyncIterator
 from itertools import chain
@@ -253,3 +254,107 @@ async def parse_json_array_stream_async(line_iterator: AsyncIterator[str]) -> As
     if brace_level != 0:
         print(f"警告: JSON流意外结束，括号层级为 {brace_level}，可能数据不完整。")
 
+
+async def parse_json_array_bytes_async(byte_iterator: AsyncIterator[bytes]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    异步版本（字节流引擎）：直接消费 `httpx.Response.aiter_bytes()` 的数据块，
+    增量解析一个 JSON 数组流。
+
+    与逐字符扫描的 `parse_json_array_stream_async` 不同，这里把数据块追加到
+    缓冲区后，使用 `JSONDecoder.raw_decode` 从上次的偏移量开始批量解码对象，
+    每个第一层级对象只解析一次，不做二次 `json.loads`。
+
+    Args:
+        byte_iterator: 一个产生响应字节块的异步迭代器。
+
+    Yields:
+        一个从流中解析出的JSON对象的字典。
+
+    Raises:
+        ValueError: 如果流不是以JSON数组开始，或对象格式错误导致无法解析。
+    """
+    decoder = json.JSONDecoder(strict=False)
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    pos = 0
+    in_array = False
+    finished = False
+
+    async for data in byte_iterator:
+        if finished or not data:
+            continue
+        chunk_text = text_decoder.decode(data)
+        buffer += chunk_text
+
+        # 1. 寻找数组的起始符 '['，并忽略之前的所有行（如 ")]}'" 前缀）
+        if not in_array:
+            while True:
+                stripped = buffer.lstrip()
+                if stripped.startswith("["):
+                    in_array = True
+                    buffer = stripped[1:]
+                    break
+                newline = buffer.find("\n")
+                if newline < 0:
+                    break
+                buffer = buffer[newline + 1:]
+            if not in_array:
+                continue
+            pos = 0
+        elif "}" not in chunk_text:
+            # 没有新的 '}' 到达，不可能有对象闭合；只在可能闭合时才重新解码未完成的对象
+            continue
+
+        # 2. 从 pos 开始批量解码所有已完整到达的对象
+        while True:
+            pos = _skip_separators(buffer, pos)
+            if pos >= len(buffer):
+                break
+            if buffer[pos] == "]":
+                finished = True
+                break
+            try:
+                obj, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # 对象尚不完整，等待更多数据
+                break
+            pos = end
+            if isinstance(obj, dict):
+                yield obj
+
+        # 丢弃已消费的前缀，避免缓冲区随响应长度增长
+        if pos:
+            buffer = buffer[pos:]
+            pos = 0
+
+    if not in_array:
+        raise ValueError("数据流不是以一个JSON数组 ( '[' ) 开始。")
+
+    if finished:
+        return
+
+    # 3. 流结束：解码剩余的完整对象，并检查是否还有未闭合的内容
+    buffer += text_decoder.decode(b"", final=True)
+    while True:
+        pos = _skip_separators(buffer, pos)
+        if pos >= len(buffer) or buffer[pos] == "]":
+            return
+        try:
+            obj, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            remainder = buffer[pos:]
+            if remainder.count("{") > remainder.count("}"):
+                print(f"警告: JSON流意外结束，剩余 {len(remainder)} 个字符未闭合，可能数据不完整。")
+                return
+            raise ValueError(f"解析JSON对象失败: {e}\n内容: {remainder[:500]}") from e
+        pos = end
+        if isinstance(obj, dict):
+            yield obj
+
+
+def _skip_separators(buffer: str, pos: int) -> int:
+    """跳过数组元素之间的空白和逗号，返回下一个有效字符的位置。"""
+    length = len(buffer)
+    while pos < length and buffer[pos] in " \t\r\n,":
+        pos += 1
+    return pos